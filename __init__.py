@@ -4,6 +4,7 @@ from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from dotenv import load_dotenv
+from werkzeug.middleware.proxy_fix import ProxyFix
 import os
 
 # Load environment variables from .env file
@@ -11,13 +12,15 @@ load_dotenv()
 
 # Setup of key Flask object (app)
 app = Flask(__name__)
+# nginx (bookworms.nginx_file) is the one proxy in front of the app, take the client address it forwards
+app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1)
 
 # Initialize Flask-Login object
 login_manager = LoginManager()
 login_manager.init_app(app)
 
 # Allowed servers for cross-origin resource sharing (CORS), these are GitHub Pages and localhost for GitHub Pages testing
-cors = CORS(app, supports_credentials=True, origins=['http://localhost:4504', 'http://127.0.0.1:4504', 'http://127.0.0.1:8504', 'https://gabrielac07.github.io'])
+cors = CORS(app, supports_credentials=True, origins=['http://localhost:4504', 'http://127.0.0.1:4504', 'http://127.0.0.1:8504', 'https://gabrielac07.github.io'], expose_headers=['X-Next-Cursor', 'Link', 'X-Total-Count'])
 
 # System Defaults
 app.config['ADMIN_USER'] = os.environ.get('ADMIN_USER') or 'admin'
@@ -51,6 +54,10 @@ else:
     dbString = 'sqlite:///volumes/'
     dbURI = dbString + dbName + '.db'
     backupURI = dbString + dbName + '_bak.db'
+if os.environ.get('SQLALCHEMY_DATABASE_URI'):
+    # Any other database, e.g. the throwaway SQLite file of the tests (tests/conftest.py)
+    dbURI = os.environ['SQLALCHEMY_DATABASE_URI']
+    backupURI = None
 
 app.config['DB_ENDPOINT'] = DB_ENDPOINT
 app.config['DB_USERNAME'] = DB_USERNAME
@@ -69,6 +76,17 @@ app.config['UPLOAD_EXTENSIONS'] = ['.jpg', '.png', '.gif']  # supported file typ
 app.config['UPLOAD_FOLDER'] = os.path.join(app.instance_path, 'uploads')
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# Recommendation settings
+app.config['VECTORS_FOLDER'] = os.path.join(app.instance_path, 'volumes', 'vectors')  # book vectors, see model/bookvectors.py
+
+# Cover image cache settings, see model/covercache.py
+app.config['COVERS_FOLDER'] = os.path.join(app.instance_path, 'volumes', 'covers')
+app.config['COVERS_MAX_BYTES'] = int(os.environ.get('COVERS_MAX_BYTES') or 500 * 1024 * 1024)  # disk budget of the cache
+
+# Password hashing settings, see model/passwords.py
+app.config['PASSWORD_POOL_SIZE'] = int(os.environ.get('PASSWORD_POOL_SIZE') or 2)  # hashing processes per worker, 0 hashes inline
+app.config['PASSWORD_QUEUE_LIMIT'] = int(os.environ.get('PASSWORD_QUEUE_LIMIT') or 16)  # hashes in flight per worker before 503
+
 # GITHUB settings
 app.config['GITHUB_API_URL'] = 'https://api.github.com'
 app.config['GITHUB_TOKEN'] = os.environ.get('GITHUB_TOKEN') or None
@@ -0,0 +1,53 @@
+from flask import Blueprint, jsonify, request
+from __init__ import db
+from model.author import Author, author_key
+import model.authorstats  # registers the handlers that keep the aggregates current
+from model.catalog import get_books
+from model.librarydb import Book
+from model.tableversion import VersionedLRU
+from api.etag import conditional
+
+author_api = Blueprint('author_api', __name__, url_prefix='/api')
+
+# Whole author pages, rebuilt after the authors or books tables change
+author_pages = VersionedLRU('author_pages', ['authors', 'books'], maxsize=1024)
+
+def load_author_page(author_id):
+    """
+    An author with their books and aggregate review and reaction counts.
+
+    The counts are read from the author row, the books from the indexed author_id column and the
+    catalog cache.
+
+    Returns:
+        dict: The page, None if the author does not exist.
+    """
+    author = db.session.get(Author, author_id)
+    if author is None:
+        return None
+    book_ids = [row[0] for row in db.session.query(Book.id).filter(Book.author_id == author_id).order_by(Book.title, Book.id)]
+    books = get_books(book_ids)
+    page = author.read()
+    page['books'] = [books[book_id] for book_id in book_ids if book_id in books]
+    return page
+
+# An author page
+@author_api.route('/authors/<int:author_id>', methods=['GET'])
+@conditional('authors', 'books')
+def get_author(author_id):
+    page = author_pages.get(author_id, lambda: load_author_page(author_id))
+    if page is None:
+        return jsonify({'error': 'Author not found'}), 404
+    return jsonify(page), 200
+
+# Look an author up by name, ignoring case, spacing and punctuation (?name=j.k. rowling)
+@author_api.route('/authors', methods=['GET'])
+@conditional('authors')
+def find_author():
+    name = request.args.get('name', '')
+    if not author_key(name):
+        return jsonify({'error': 'A name is required'}), 400
+    author = Author.query.filter_by(key=author_key(name)).first()
+    if author is None:
+        return jsonify({'error': 'Author not found'}), 404
+    return jsonify(author.read()), 200
@@ -1,9 +1,15 @@
-from flask import jsonify, request, Blueprint
+from flask import jsonify, request, Blueprint, g
 from flask_restful import Api
-from model.librarydb import Book
+from model.librarydb import Book, book_sampler
 from model.bookrecdb import SaveBookRec
+from model.genre import Genre, assign_genre
+from model.bookvectors import book_vectors
+from model.annindex import DEFAULT_NPROBE
+from model.catalog import get_books as get_catalog_books
+from model.userrecs import get_user_recommendations
+from model.bookevents import emit
+from api.jwt_authorize import token_required
 from __init__ import app, db 
-import random
 import time
 
 bookrec_api = Blueprint('bookrec_api', __name__, url_prefix='/api')
@@ -13,13 +19,11 @@ api = Api(bookrec_api)
 # Helper function to get a random book from the database filtered by genre
 def get_random_bookrec(genre=None):
     if genre:
-        books = Book.query.filter(Book.genre.ilike(f'%{genre}%')).all() # Fetch a book from the requested genre
-    else:
-        books = Book.query.all() # Fetch all books if no genre is specified
-    
-    #print(f"Books retrieved for genre '{genre}': {books}")  # Debug log
-
-    return random.choice(books) if books else None # Return a random book if available
+        matched = Genre.resolve(genre) # Exact match on the genre or one of its aliases
+        if not matched:
+            return None
+        return book_sampler.sample(matched.id) # Draw from the cached ids of the genre
+    return book_sampler.sample() # Draw from the cached ids of every book
 
 # Endpoint to get a random book
 @bookrec_api.route('/random_bookrec', methods=['GET'])
@@ -41,6 +45,60 @@ def random_bookrec():
             time.sleep(5)
             #print("No books found, retrying in 5 seconds...")
 
+MAX_SIMILAR = 50  # most similar books a client can ask for
+
+# Endpoint to get the books most like a given book, e.g. /api/bookrec/similar/3?k=10
+@bookrec_api.route('/bookrec/similar/<int:book_id>', methods=['GET'])
+def similar_books(book_id):
+    try:
+        k = min(max(int(request.args.get('k', 10)), 1), MAX_SIMILAR)
+        nprobe = max(int(request.args.get('nprobe', DEFAULT_NPROBE)), 1)  # raise for recall, lower for speed
+    except ValueError:
+        return jsonify({"error": "k and nprobe must be integers"}), 400
+
+    if not book_vectors.ready:
+        return jsonify({"error": "Book vectors have not been built, run flask custom build_vectors"}), 503
+
+    # ask for a few extra in case some were deleted since the vectors were built
+    matches = book_vectors.similar(book_id, k + 5, nprobe)
+    if matches is None:
+        if db.session.query(Book.id).filter_by(id=book_id).first() is None:
+            return jsonify({"error": "Book not found"}), 404
+        # added since the vectors were built, or without text to embed
+        return jsonify({'book_id': book_id, 'similar': [], 'message': "Book has no vector yet"})
+
+    books = get_catalog_books([match_id for match_id, _ in matches])
+    similar = []
+    for match_id, score in matches:
+        if match_id in books and len(similar) < k:
+            book = books[match_id]
+            book['score'] = round(score, 4)
+            similar.append(book)
+    return jsonify({'book_id': book_id, 'similar': similar})
+
+# Endpoint to get the signed in user's recommendations, from their wishlist, reactions and comments
+# Users without any history get the most popular books, e.g. /api/bookrec/for_me?limit=10
+@bookrec_api.route('/bookrec/for_me', methods=['GET'])
+@token_required()
+def recommendations_for_me():
+    try:
+        limit = min(max(int(request.args.get('limit', 10)), 1), 50)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+
+    source, recs = get_user_recommendations(g.current_user.id)
+    if not recs:
+        return jsonify({"source": source, "books": []})
+
+    books = get_catalog_books(recs['book_ids'])
+    results = []
+    for book_id, score in zip(recs['book_ids'], recs['scores']):
+        if book_id in books and len(results) < limit:  # skip books deleted since the last batch job
+            book = books[book_id]
+            book['score'] = score
+            results.append(book)
+    return jsonify({"source": source, "built_at": recs['built_at'], "books": results})
+
 # Endpoint to save a book recommendation (This is what I'm using for the table checkpoint on Thurs/Fri)
 @bookrec_api.route("/bookrec", methods=['POST']) # This is the endpoint to add a book to the savebookrec table
 def add_book():
@@ -63,6 +121,7 @@ def add_book():
     )
 
     db.session.add(new_book) # Add the new book to the savebookrec table
+    emit('bookrec.saved', record=new_book) # Count it towards the book's trending score
     db.session.commit() # Commit the changes to the database
     
     return jsonify({"message": "Book added successfully", 'success': True, 'id': new_book.id}), 201
@@ -81,6 +140,7 @@ def get_books():
                 'title': book.title,
                 'author': book.author,
                 'genre': book.genre,
+                'genre_id': book.genre_id,
                 'description': book.description,
                 'cover_url': book.cover_url
             }
@@ -109,6 +169,7 @@ def update_book():
         book.genre = data.get('genre', book.genre)
         book.description = data.get('description', book.description)
         book.cover_url = data.get('cover_url', book.cover_url)
+        assign_genre(book, create=False) # Keep genre_id in sync with the genre text
         db.session.commit()
         return jsonify({'message': 'Book updated successfully'}), 200
     except Exception as e:
@@ -1,22 +1,26 @@
+from urllib.parse import urlencode
 from flask import Blueprint, jsonify, request
+from sqlalchemy.exc import IntegrityError
 from flask_restful import Api
 from model.librarydb import Book
-from model.commentsdb import Comments
+from model.commentsdb import Comments, comment_page, parse_time, read_comments
 from model.user import User
-import random
+from model.librarydb import book_sampler
+from model.catalog import get_book
+from model.tableversion import TableVersion
+from model.bookevents import emit
+from api.etag import conditional
 from __init__ import app, db
 
 bookreview_api = Blueprint('bookreview_api', __name__, url_prefix='/api')
 api = Api(bookreview_api)
 
+MAX_COMMENT_LIMIT = 200  # comments per page
+
 # Fetch Random Book
 def get_random_book():
     try:
-        books_query = Book.query.all()
-        if books_query:
-            return random.choice(books_query)
-        else:
-            return None
+        return book_sampler.sample()
     except Exception as e:
         print(f"Error while fetching random book: {e}")
         return None
@@ -31,27 +35,9 @@ def get_user(user_id):
     else:
         return jsonify({'error': 'User not found'}), 404
     
-# Fetch Comments for a Book
+# Fetch Comments for a Book, with their authors' names from the same query
 def get_comments_for_book(book_id=None):
-    if book_id:
-        comments_query = Comments.query.filter_by(book_id=book_id).all()
-    else:
-        comments_query = Comments.query.all()
-
-    comments_data = []
-    for comment in comments_query:
-        user = User.query.get(comment.user_id)  # Fetch the user using the user_id
-        user_name = user._name if user else "Unknown User"  # Fetch the name
-
-        comments_data.append({
-            "id": comment.id,
-            "book_id": comment.book_id,
-            "user_id": comment.user_id,  # Keep user_id
-            "user_name": user_name,  # Add the user_name
-            "comment_text": comment.comment_text
-        })
-
-    return comments_data
+    return read_comments(book_id)
 
 # Route to fetch a random book
 @bookreview_api.route('/random_book', methods=['GET'])
@@ -73,24 +59,26 @@ def random_book():
 
 # Route to fetch a book by ID (this should handle /bookrates/{book_id} style URLs)
 @bookreview_api.route('/books/<int:book_id>', methods=['GET'])
+@conditional('books', 'comments', 'users')
 def get_book_by_id(book_id):
-    book = Book.query.get(book_id)
+    book = get_book(book_id)  # served from the catalog cache
     if not book:
         return jsonify({'error': 'Book not found'}), 404
 
-    comments = get_comments_for_book(book_id=book.id)
+    comments = get_comments_for_book(book_id=book['id'])
     return jsonify({
-        'id': book.id,
-        'title': book.title,
-        'author': book.author,
-        'genre': book.genre,
-        'description': book.description,
-        'cover_url': book.cover_url,
+        'id': book['id'],
+        'title': book['title'],
+        'author': book['author'],
+        'genre': book['genre'],
+        'description': book['description'],
+        'cover_url': book['cover_url'],
         'comments': comments
     })
 
 # Comments Route (GET, POST, PUT, DELETE)
 @bookreview_api.route('/comments', methods=['GET', 'POST'])
+@conditional('comments', 'users')  # GET only
 def manage_comments():
     if request.method == 'GET':
         book_id = request.args.get('book_id')
@@ -98,6 +86,10 @@ def manage_comments():
         if not book_id:
             return jsonify({'error': 'Book ID is required'}), 400
 
+        # limit, cursor or since ask for one page, newest first (?book_id=1&limit=20&since=2025-01-31T12:00:00Z)
+        if any(request.args.get(name) for name in ('limit', 'cursor', 'since')):
+            return comments_page_response(book_id)
+
         comments = get_comments_for_book(book_id)
         if comments:
             return jsonify({'comments': comments})
@@ -130,6 +122,8 @@ def manage_comments():
             )
 
             db.session.add(new_comment)
+            emit('comment.created', comment=new_comment)
+            TableVersion.bump('comments')
             db.session.commit()
 
             return jsonify({
@@ -139,11 +133,31 @@ def manage_comments():
                 'comment_text': new_comment.comment_text
             }), 201
 
+        except IntegrityError:
+            db.session.rollback()
+            return jsonify({'error': 'Comment already exists for this book and user'}), 400
         except Exception as e:
             print(f"Error while adding comment: {e}")
             db.session.rollback()
             return jsonify({'error': 'Internal Server Error'}), 500
 
+def comments_page_response(book_id):
+    args = request.args
+    try:
+        limit = min(max(int(args.get('limit', 50)), 1), MAX_COMMENT_LIMIT)
+        since = parse_time(args['since']) if args.get('since') else None
+        comments, next_cursor = comment_page(int(book_id), limit, cursor=args.get('cursor'), since=since)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    response = jsonify({'comments': comments, 'next_cursor': next_cursor})
+    if next_cursor:
+        params = args.to_dict()
+        params['cursor'] = next_cursor
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = f'<{request.path}?{urlencode(params)}>; rel="next"'
+    return response
+
 # PUT and DELETE for Comments (Route: /api/comments/<comment_id>)
 @bookreview_api.route('/comments/<int:comment_id>', methods=['PUT', 'DELETE'])
 def update_delete_comment(comment_id):
@@ -161,6 +175,8 @@ def update_delete_comment(comment_id):
                 return jsonify({'error': 'Comment text is required'}), 400
 
             comment.comment_text = comment_text
+            comment.rehash()
+            TableVersion.bump('comments')
             db.session.commit()
 
             return jsonify({
@@ -170,6 +186,9 @@ def update_delete_comment(comment_id):
                 'comment_text': comment.comment_text
             })
 
+        except IntegrityError:
+            db.session.rollback()
+            return jsonify({'error': 'The same comment already exists for this book and user'}), 400
         except Exception as e:
             print(f"Error while updating comment: {e}")
             db.session.rollback()
@@ -178,6 +197,8 @@ def update_delete_comment(comment_id):
     elif request.method == 'DELETE':
         try:
             db.session.delete(comment)
+            emit('comment.deleted', comment=comment)
+            TableVersion.bump('comments')
             db.session.commit()
             return jsonify({'message': 'Comment deleted successfully'}), 200
         except Exception as e:
@@ -209,8 +230,7 @@ def create_book():
             cover_url=cover_url
         )
 
-        db.session.add(new_book)
-        db.session.commit()
+        new_book.create()
 
         return jsonify({
             'id': new_book.id,
@@ -239,12 +259,7 @@ def update_delete_book(book_id):
     if request.method == 'PUT':
         try:
             data = request.get_json()
-            book.title = data.get('title', book.title)
-            book.author = data.get('author', book.author)
-            book.genre = data.get('genre', book.genre)
-            book.description = data.get('description', book.description)
-            book.cover_url = data.get('cover_url', book.cover_url)
-            db.session.commit()
+            book.update(data)
 
             return jsonify({
                 'id': book.id,
@@ -264,8 +279,7 @@ def update_delete_book(book_id):
         try:
             print(f"Attempting to delete book with ID: {book_id}")
             
-            db.session.delete(book)
-            db.session.commit()
+            book.delete()
 
             return jsonify({'message': 'Book deleted successfully'}), 200
 
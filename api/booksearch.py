@@ -0,0 +1,39 @@
+from flask import Blueprint, jsonify, request
+from model.booksearch import search_books
+from api.etag import conditional
+
+booksearch_api = Blueprint('booksearch_api', __name__, url_prefix='/api')
+
+MAX_LIMIT = 100  # largest page a client can ask for
+
+# Search the catalog, e.g. /api/books/search?q=harry pot&page=1&limit=20
+@booksearch_api.route('/books/search', methods=['GET'])
+@conditional('books')
+def search():
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Query parameter q is required'}), 400
+
+    try:
+        page = max(int(request.args.get('page', 1)), 1)
+        limit = min(max(int(request.args.get('limit', 20)), 1), MAX_LIMIT)
+    except ValueError:
+        return jsonify({'error': 'page and limit must be integers'}), 400
+
+    try:
+        total, results = search_books(query, page=page, limit=limit)
+    except Exception as e:
+        return jsonify({'error': 'Search failed', 'message': str(e)}), 500
+
+    books = []
+    for book_data, score in results:
+        book_data['score'] = score
+        books.append(book_data)
+
+    return jsonify({
+        'query': query,
+        'page': page,
+        'limit': limit,
+        'total': total,
+        'books': books
+    }), 200
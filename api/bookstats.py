@@ -0,0 +1,32 @@
+from flask import Blueprint, jsonify, request
+from model.bookstats import get_book_stats
+from model.catalog import get_book, get_books
+from api.etag import conditional
+
+bookstats_api = Blueprint('bookstats_api', __name__, url_prefix='/api')
+
+MAX_IDS = 100  # books per batch request
+
+# Comment, reaction and wishlist counts and the reaction histogram of a book
+@bookstats_api.route('/books/<int:book_id>/stats', methods=['GET'])
+@conditional('book_stats', 'books')
+def get_stats(book_id):
+    if get_book(book_id) is None:
+        return jsonify({'error': 'Book not found'}), 404
+    return jsonify(get_book_stats([book_id])[book_id]), 200
+
+# The statistics of several books at once (?ids=1,2,3), unknown ids are left out
+@bookstats_api.route('/books/stats', methods=['GET'])
+@conditional('book_stats', 'books')
+def get_stats_batch():
+    try:
+        book_ids = list(dict.fromkeys(int(book_id) for book_id in request.args.get('ids', '').split(',') if book_id.strip()))
+    except ValueError:
+        return jsonify({'error': 'ids must be a comma separated list of book ids'}), 400
+    if not book_ids:
+        return jsonify({'error': 'ids is required'}), 400
+    if len(book_ids) > MAX_IDS:
+        return jsonify({'error': f'At most {MAX_IDS} ids per request'}), 400
+    existing = get_books(book_ids)
+    stats = get_book_stats([book_id for book_id in book_ids if book_id in existing])
+    return jsonify(list(stats.values())), 200
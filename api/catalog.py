@@ -0,0 +1,103 @@
+import io
+import json
+from urllib.parse import urlencode
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from model.catalog import BOOK_FIELDS, parse_fields, book_page, iter_books
+from model.genre import Genre
+from model.bookimport import FORMATS, DEFAULT_BATCH_SIZE, import_books, import_books_upload
+from api.etag import conditional
+from api.jwt_authorize import token_required
+
+catalog_api = Blueprint('catalog_api', __name__, url_prefix='/api')
+
+MAX_LIMIT = 1000  # largest page a client can ask for
+
+def _stream_json_array(rows):
+    yield '['
+    for index, row in enumerate(rows):
+        yield (',' if index else '') + json.dumps(row)
+    yield ']'
+
+def catalog_response(default_fields=BOOK_FIELDS):
+    """
+    Build a streamed JSON array of books from the request's query string.
+
+    Query parameters:
+        fields: comma separated book fields, e.g. fields=id,title,author (default: default_fields)
+        sort: 'id' (default) or 'title'
+        genre: only list books of this genre, aliases accepted
+        limit: page size, when omitted the whole catalog is streamed
+        cursor: the X-Next-Cursor header of the previous page
+
+    The body is always a JSON array, paging information is sent in the X-Next-Cursor and Link headers.
+    """
+    args = request.args
+    try:
+        fields = parse_fields(args.get('fields'), default_fields)
+        sort = args.get('sort', 'id')
+        cursor = args.get('cursor')
+        limit = args.get('limit')
+        limit = min(max(int(limit), 1), MAX_LIMIT) if limit else None
+        genre_id = None
+        if args.get('genre'):
+            genre = Genre.resolve(args.get('genre'))
+            if not genre:
+                return jsonify([]), 200
+            genre_id = genre.id
+
+        next_cursor = None
+        if limit:
+            rows, next_cursor = book_page(sort=sort, cursor=cursor, limit=limit, fields=fields, genre_id=genre_id)
+        else:
+            rows = iter_books(sort=sort, cursor=cursor, fields=fields, genre_id=genre_id)
+            # read the first batch now so a bad sort or cursor is still reported as a 400
+            first = next(rows, None)
+            rows = [] if first is None else _chain(first, rows)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    response = Response(stream_with_context(_stream_json_array(rows)), mimetype='application/json')
+    if next_cursor:
+        params = args.to_dict()
+        params['cursor'] = next_cursor
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = f'<{request.path}?{urlencode(params)}>; rel="next"'
+    return response
+
+def _chain(first, rest):
+    yield first
+    yield from rest
+
+# List the catalog, e.g. /api/books?fields=id,title&sort=title&limit=50
+@catalog_api.route('/books', methods=['GET'])
+@conditional('books', 'genres')
+def list_books():
+    return catalog_response()
+
+# Bulk import books from a CSV or JSONL file, sent as the multipart field 'file' or as the raw body
+# e.g. POST /api/books/import?format=jsonl&batch_size=1000&start=0
+@catalog_api.route('/books/import', methods=['POST'])
+@token_required(roles=['Admin'])
+def import_catalog():
+    try:
+        fmt = request.args.get('format')
+        batch_size = max(int(request.args.get('batch_size', DEFAULT_BATCH_SIZE)), 1)
+        start = max(int(request.args.get('start', 0)), 0)
+    except ValueError:
+        return jsonify({'error': 'batch_size and start must be integers'}), 400
+    if fmt and fmt not in FORMATS:
+        return jsonify({'error': f"format must be one of: {', '.join(FORMATS)}"}), 400
+
+    # the totals of the last committed batch, so a failed import reports where to resume
+    last = {'inserted': 0, 'updated': 0, 'skipped': 0, 'offset': start}
+    try:
+        if 'file' in request.files:
+            totals = import_books_upload(request.files['file'], fmt=fmt, batch_size=batch_size, start=start, progress=last.update)
+        else:
+            if not fmt:
+                return jsonify({'error': 'format is required when the file is sent as the request body'}), 400
+            stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+            totals = import_books(stream, fmt=fmt, batch_size=batch_size, start=start, progress=last.update)
+    except Exception as e:
+        return jsonify({'error': 'Import failed, retry with start set to offset', 'message': str(e), **last}), 500
+    return jsonify(totals), 200
@@ -0,0 +1,38 @@
+from flask import Blueprint, jsonify, request
+from model.commentsearch import search_comments
+from api.etag import conditional
+
+commentsearch_api = Blueprint('commentsearch_api', __name__, url_prefix='/api')
+
+MAX_LIMIT = 100  # largest page a client can ask for
+
+# Search review comments, e.g. /api/comments/search?q=ending&book_id=3&user_id=1&page=1&limit=20
+@commentsearch_api.route('/comments/search', methods=['GET'])
+@conditional('comments', 'users')
+def search():
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Query parameter q is required'}), 400
+
+    try:
+        page = max(int(request.args.get('page', 1)), 1)
+        limit = min(max(int(request.args.get('limit', 20)), 1), MAX_LIMIT)
+        book_id = request.args.get('book_id', type=int)
+        user_id = request.args.get('user_id', type=int)
+        if request.args.get('book_id') and book_id is None or request.args.get('user_id') and user_id is None:
+            raise ValueError
+    except ValueError:
+        return jsonify({'error': 'page, limit, book_id and user_id must be integers'}), 400
+
+    try:
+        total, comments = search_comments(query, book_id=book_id, user_id=user_id, page=page, limit=limit)
+    except Exception as e:
+        return jsonify({'error': 'Search failed', 'message': str(e)}), 500
+
+    return jsonify({
+        'query': query,
+        'page': page,
+        'limit': limit,
+        'total': total,
+        'comments': comments
+    }), 200
@@ -0,0 +1,59 @@
+import os
+from flask import Blueprint, jsonify, redirect, request, send_from_directory, url_for
+from __init__ import db
+from model.catalog import get_book
+from model.suggest import SuggestedBook
+from model.bookrecdb import SaveBookRec
+from model.covercache import THUMBNAIL_WIDTHS, EXTENSIONS, cached_cover, covers_folder
+
+covers_api = Blueprint('covers_api', __name__, url_prefix='/api/covers')
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600  # cached files are named after their URL, they never change
+
+def _cover_url_of(source, record_id):
+    if source == 'books':
+        book = get_book(record_id)
+        return book['cover_url'] if book else None
+    model = {'suggestions': SuggestedBook, 'bookrecs': SaveBookRec}.get(source)
+    record = db.session.get(model, record_id) if model else None
+    return record.cover_url if record else None
+
+def _cover_response(source, record_id):
+    url = _cover_url_of(source, record_id)
+    if not url:
+        return jsonify({'error': 'Cover not found'}), 404
+
+    width = request.args.get('w', type=int)
+    if width is not None and width not in THUMBNAIL_WIDTHS:
+        return jsonify({'error': f"w must be one of: {', '.join(map(str, THUMBNAIL_WIDTHS))}"}), 400
+
+    name = cached_cover(url, width)
+    if name is None:
+        # not cached yet, the background fetcher is downloading it, send the client to the original
+        response = redirect(url, code=302)
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    # the cached file's URL is immutable, this redirect is only cached briefly in case the cover changes
+    response = redirect(url_for('covers_api.cover_file', name=name), code=302)
+    response.headers['Cache-Control'] = 'public, max-age=300'
+    return response
+
+# Cover of a book, e.g. /api/covers/3?w=200 (w is optional, one of 100, 200, 400)
+@covers_api.route('/<int:book_id>', methods=['GET'])
+def book_cover(book_id):
+    return _cover_response('books', book_id)
+
+# Cover of a suggested book or saved recommendation, e.g. /api/covers/suggestions/2
+@covers_api.route('/<any(suggestions, bookrecs):source>/<int:record_id>', methods=['GET'])
+def other_cover(source, record_id):
+    return _cover_response(source, record_id)
+
+# A cached cover file, served with sendfile and cached by browsers and nginx for a year
+@covers_api.route('/file/<name>', methods=['GET'])
+def cover_file(name):
+    extension = os.path.splitext(name)[1]
+    if extension not in EXTENSIONS:
+        return jsonify({'error': 'Cover not found'}), 404
+    response = send_from_directory(covers_folder(), name, mimetype=EXTENSIONS[extension], max_age=IMMUTABLE_MAX_AGE)
+    response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    return response
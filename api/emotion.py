@@ -3,7 +3,11 @@ from flask import Blueprint, request, jsonify, current_app, Response, g, Flask
 from flask_restful import Api, Resource  # used for REST API building
 from __init__ import app, db
 from model.librarydb import Book
+from api.catalog import catalog_response
 from model.emotion import Emotion
+from model.tableversion import TableVersion
+from model.bookevents import emit
+from api.etag import conditional
 
 emotion_api = Blueprint('emotion_api', __name__, url_prefix='/api/emotion')
 api = Api(emotion_api)
@@ -28,15 +32,15 @@ def add_emotion():
 
 
 @emotion_api.route('/books', methods=['GET'])
+@conditional('books', 'genres')
 def get_books():
     """Retrieve all books from the database to display in a dropdown menu."""
-    books = Book.query.all()  # SQLAlchemy query to get all books from the books table
-    books_list = [{'id': book.id, 'title': book.title, 'author': book.author} for book in books]
-    return jsonify(books_list)
+    return catalog_response(default_fields=('id', 'title', 'author'))  # streamed, accepts fields/sort/limit/cursor
 
 
 # Read - Get all reactions for a specific book
 @emotion_api.route('/<title_id>', methods=['GET'])   #/It
+@conditional('emotion')
 def get_emotion(title_id):
     try:
         # Query reactions for the specific book
@@ -60,6 +64,7 @@ def get_emotion(title_id):
 
 # Read - Get all reactions for a specific user
 @emotion_api.route('/user/<user_id>', methods=['GET'])   #/1
+@conditional('emotion')
 def get_user_emotion(user_id):
     try:
         # Query reactions for the specific user
@@ -103,8 +108,12 @@ def update_emotion():
             return jsonify({"error": "Reaction not found"}), 404
 
         # Update the reaction type
+        previous_type = emotion.reaction_type
         emotion.reaction_type = new_reaction_type
+        if new_reaction_type != previous_type:
+            emit('reaction.changed', emotion=emotion, previous_type=previous_type)
 
+        TableVersion.bump('emotion')
         db.session.commit()
 
         return jsonify({
@@ -139,6 +148,8 @@ def delete_emotion():
     
     # Delete the reaction from the database
     db.session.delete(emotion)
+    emit('reaction.deleted', emotion=emotion)
+    TableVersion.bump('emotion')
     db.session.commit()
 
     return jsonify({"message": "Reaction deleted successfully"}), 200
@@ -156,7 +167,9 @@ def reset_emotion(user_id):
         # Delete all reactions for the user
         for emotion in emotions:
             db.session.delete(emotion)
+            emit('reaction.deleted', emotion=emotion)
 
+        TableVersion.bump('emotion')
         db.session.commit()  # Commit the deletion
 
         return jsonify({"message": "All reactions for the user have been reset"}), 200
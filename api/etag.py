@@ -0,0 +1,46 @@
+import hashlib
+from functools import wraps
+from flask import Response, make_response, request
+from model.tableversion import TableVersion
+from model.metrics import incr
+
+DEFAULT_MAX_AGE = 5  # seconds a shared cache (the nginx proxy) may serve a response without asking again
+
+def conditional(*tables, max_age=DEFAULT_MAX_AGE):
+    """
+    Answer repeated GET requests with 304 Not Modified until one of the tables changes.
+
+    The validator is built from the versions of the tables the response is read from (see
+    model/tableversion.py), so it costs one primary key lookup per table and is checked before the
+    handler does any work. Successful responses get a weak ETag and a public Cache-Control header
+    so nginx can serve repeats and revalidate them with If-None-Match.
+
+    Only GET and HEAD requests are affected, so the decorator can sit on routes that also accept writes.
+
+    Args:
+        tables (str): Names of the tables the response depends on, e.g. 'books', 'comments'.
+        max_age (int): Seconds the response may be served from a cache without revalidating.
+    """
+    def decorator(func):
+        @wraps(func)
+        def decorated(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return func(*args, **kwargs)
+
+            versions = ','.join(f'{name}:{TableVersion.get(name)}' for name in tables)
+            etag = hashlib.sha1(f'{request.full_path}|{versions}'.encode()).hexdigest()[:24]
+
+            if request.if_none_match.contains_weak(etag):
+                incr('etag.not_modified')
+                response = Response(status=304)
+            else:
+                response = make_response(func(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                incr('etag.full_responses')
+
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = f'public, max-age={max_age}'
+            return response
+        return decorated
+    return decorator
@@ -4,7 +4,7 @@ from flask_restful import Api, Resource  # used for REST API building
 from datetime import datetime
 from __init__ import app
 from api.jwt_authorize import token_required
-from model.feedback import Feedback
+from model.feedback import Feedback, read_feedbacks
 
 """
 This Blueprint object is used to define APIs for the Feedback model.
@@ -50,9 +50,8 @@ class FeedbackAPI:
             data = request.get_json()
             post_id = data['id']
             # Find all the feedbacks by the current user
-            feedbacks = Feedback.query.filter(Feedback._post_id == data['id']).all()
-            # Prepare a JSON list of all the feedbacks, uses for loop shortcut called list comprehension
-            json_ready = [feedback.read() for feedback in feedbacks]
+            # Prepare a JSON list of all the feedbacks, with their user names and post titles in one joined query
+            json_ready = read_feedbacks(Feedback.query.filter(Feedback._post_id == data['id']))
             # Return a JSON list, converting Python dictionaries to JSON format
             return jsonify(json_ready)
 
@@ -0,0 +1,40 @@
+from flask import Blueprint, jsonify
+from sqlalchemy import func
+from __init__ import db
+from model.genre import Genre
+from model.librarydb import Book
+from model.tableversion import VersionedCache
+from api.etag import conditional
+
+genre_api = Blueprint('genre_api', __name__, url_prefix='/api')
+
+def load_genre_facets():
+    """Count the books in every genre, one GROUP BY on the indexed genre_id column."""
+    rows = (
+        db.session.query(Genre.id, Genre.name, func.count(Book.id))
+        .outerjoin(Book, Book.genre_id == Genre.id)
+        .group_by(Genre.id, Genre.name)
+        .order_by(Genre.name)
+        .all()
+    )
+    return [{'id': genre_id, 'name': name, 'count': count} for genre_id, name, count in rows]
+
+# Facet counts are recomputed only after the books or genres tables change
+genre_facets = VersionedCache(['books', 'genres'], load_genre_facets, name='genre_facets')
+
+# Genres with their book counts, for filter menus
+@genre_api.route('/genres', methods=['GET'])
+@conditional('books', 'genres')
+def get_genres():
+    try:
+        return jsonify(genre_facets.get()), 200
+    except Exception as e:
+        return jsonify({'error': 'Failed to fetch genres', 'message': str(e)}), 500
+
+# A single genre with its aliases
+@genre_api.route('/genres/<int:genre_id>', methods=['GET'])
+def get_genre(genre_id):
+    genre = db.session.get(Genre, genre_id)
+    if not genre:
+        return jsonify({'error': 'Genre not found'}), 404
+    return jsonify(genre.read()), 200
@@ -1,8 +1,45 @@
 from flask import request
 from flask import current_app, g
 from functools import wraps
+from datetime import datetime, timedelta, timezone
+import uuid
 import jwt
-from model.user import User
+from model.usercache import get_user_by_uid
+from model.tokenversion import is_token_revoked, token_version
+
+# Tokens are signed (HS256) and carry the user's role, token version and a unique id (jti), so role
+# checks need no database and revoked tokens are rejected from the worker's caches of token versions
+# and logged out jtis.
+TOKEN_SECONDS = 3600  # matches the max_age of the cookie set at login
+REQUIRED_CLAIMS = ["_uid", "id", "role", "iat", "exp", "token_version", "jti"]
+
+
+def encode_token(user, seconds=TOKEN_SECONDS):
+    """
+    Mint the JWT of a user.
+
+    Args:
+        user (User): The authenticated user.
+        seconds (int, optional): How long the token is valid.
+
+    Returns:
+        str: The signed token with the _uid, id, role, iat, exp, token_version and jti claims.
+    """
+    now = datetime.now(timezone.utc)
+    return jwt.encode(
+        {
+            "_uid": user._uid,
+            "id": user.id,
+            "role": user.role,
+            "iat": now,
+            "exp": now + timedelta(seconds=seconds),
+            "token_version": token_version(user.id),
+            "jti": uuid.uuid4().hex,
+        },
+        current_app.config["SECRET_KEY"],
+        algorithm="HS256"
+    )
+
 
 def token_required(roles=None):
     """
@@ -11,15 +48,16 @@ def token_required(roles=None):
     This function performs the following steps:
     
     1. Checks for the presence of a valid JWT token in the request cookie.
-    2. Decodes the token and retrieves the user data.
-    3. Checks if the user data is found in the database.
-    4. Checks if the user has the required role.
-    5. Sets the current_user in the global context (Flask's g object).
-    6. Returns the decorated function if all checks pass.
+    2. Decodes the token, checks its signature, expiry and required claims.
+    3. Checks if the token's role claim is one of the required roles.
+    4. Checks that the token has not been revoked, through the worker's token version and logged out jti caches (model/tokenversion.py).
+    5. Checks if the user data is found in the database, through the worker's user cache (model/usercache.py).
+    6. Sets the current_user in the global context (Flask's g object).
+    7. Returns the decorated function if all checks pass.
 
     Possible error responses:
     
-    - 401 / Unauthorized: token is missing or invalid.
+    - 401 / Unauthorized: token is missing, invalid, expired or revoked.
     - 403 / Forbidden: user has insufficient permissions.
     - 500 / Internal Server Error: something went wrong with the token decoding.
 
@@ -40,24 +78,32 @@ def token_required(roles=None):
                 }, 401
 
             try:
-                data = jwt.decode(token, current_app.config["SECRET_KEY"], algorithms=["HS256"])
-                current_user = User.query.filter_by(_uid=data["_uid"]).first()
-                if not current_user:
+                data = jwt.decode(token, current_app.config["SECRET_KEY"], algorithms=["HS256"],
+                                  options={"require": REQUIRED_CLAIMS})
+                if roles and data["role"] not in roles:
                     return {
-                        "message": "User not found",
-                        "error": "Unauthorized",
+                        "message": "User does not have the required role",
+                        "error": "Forbidden",
                         "data": data
+                    }, 403
+
+                if data["token_version"] != token_version(data["id"]) or is_token_revoked(data["jti"]):
+                    return {
+                        "message": "Token has been revoked",
+                        "error": "Unauthorized"
                     }, 401
 
-                if roles and current_user.role not in roles:
+                current_user = get_user_by_uid(data["_uid"])
+                if not current_user or current_user.id != data["id"]:
                     return {
-                        "message": "User does not have the required role",
-                        "error": "Forbidden",
+                        "message": "User not found",
+                        "error": "Unauthorized",
                         "data": data
-                    }, 403
+                    }, 401
                     
                 # Authentication succes, set the current_user in the global context (Flask's g object)
                 g.current_user = current_user
+                g.token = data
             except jwt.ExpiredSignatureError:
                 return {
                     "message": "Token has expired",
@@ -0,0 +1,9 @@
+from flask import Blueprint, jsonify
+from model.metrics import snapshot
+
+metrics_api = Blueprint('metrics_api', __name__, url_prefix='/api')
+
+# Cache hit/miss and other counters of the worker that answers, e.g. catalog.hits
+@metrics_api.route('/metrics', methods=['GET'])
+def get_metrics():
+    return jsonify(snapshot()), 200
@@ -4,7 +4,7 @@ from flask_restful import Api, Resource  # used for REST API building
 from datetime import datetime
 from __init__ import app
 from api.jwt_authorize import token_required
-from model.nestPost import NestPost
+from model.nestPost import NestPost, read_nest_posts
 
 """
 This Blueprint object is used to define APIs for the Post model.
@@ -49,9 +49,8 @@ class NestPostAPI:
             # Obtain the current user
             current_user = g.current_user
             # Find all the posts by the current user
-            posts = NestPost.query.filter(NestPost._user_id == current_user.id).all()
-            # Prepare a JSON list of all the posts, uses for loop shortcut called list comprehension
-            json_ready = [post.read() for post in posts]
+            # Prepare a JSON list of all the posts, with their user and group names in one joined query
+            json_ready = read_nest_posts(NestPost.query.filter(NestPost._user_id == current_user.id))
             # Return a JSON list, converting Python dictionaries to JSON format
             return jsonify(json_ready)
 
@@ -4,7 +4,7 @@ from flask_restful import Api, Resource  # used for REST API building
 from datetime import datetime
 from __init__ import app
 from api.jwt_authorize import token_required
-from model.post import Post
+from model.post import Post, read_posts
 from model.channel import Channel
 
 """
@@ -130,9 +130,8 @@ class PostAPI:
             # Obtain the current user
             current_user = g.current_user
             # Find all the posts by the current user
-            posts = Post.query.filter(Post._user_id == current_user.id).all()
-            # Prepare a JSON list of all the posts, using list comprehension
-            json_ready = [post.read() for post in posts]
+            # Prepare a JSON list of all the posts, with their user and channel names in one joined query
+            json_ready = read_posts(Post.query.filter(Post._user_id == current_user.id))
             # Return a JSON list, converting Python dictionaries to JSON format
             return jsonify(json_ready)
 
@@ -166,13 +165,8 @@ class PostAPI:
             """
             Retrieve all posts.
             """
-            # Find all the posts
-            posts = Post.query.all()
-            # Prepare a JSON list of all the posts, using list comprehension
-            json_ready = []
-            for post in posts:
-                post_data = post.read()
-                json_ready.append(post_data)
+            # Find all the posts and prepare a JSON list, with their user and channel names in one joined query
+            json_ready = read_posts()
             # Return a JSON list, converting Python dictionaries to JSON format
             return jsonify(json_ready)
 
@@ -190,9 +184,8 @@ class PostAPI:
                 return {'message': 'Channel ID not found'}, 400
             
             # Find all posts by channel ID and user ID
-            posts = Post.query.filter_by(_channel_id=data['channel_id']).all()
-            # Prepare a JSON list of all the posts, using list comprehension
-            json_ready = [post.read() for post in posts]
+            # Prepare a JSON list of all the posts, with their user and channel names in one joined query
+            json_ready = read_posts(Post.query.filter_by(_channel_id=data['channel_id']))
             # Return a JSON list, converting Python dictionaries to JSON format
             return jsonify(json_ready)
 
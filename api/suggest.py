@@ -135,8 +135,7 @@ def delete_book():
         if not suggested_book:
             return jsonify({'error': 'Book not found'}), 404
         
-        db.session.delete(suggested_book)
-        db.session.commit()
+        suggested_book.delete()
         
         return jsonify({'message': 'Book deleted successfully'}), 200
     except Exception as e:
@@ -183,8 +182,7 @@ def reject_book():
         if not suggested_book:
             return jsonify({'error': 'Book not found'}), 404
         
-        db.session.delete(suggested_book)
-        db.session.commit()
+        suggested_book.delete()
         
         return jsonify({'message': 'Book rejected successfully'}), 200
     except Exception as e:
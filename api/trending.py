@@ -0,0 +1,27 @@
+from flask import Blueprint, jsonify, request
+from model.catalog import get_books
+from model.trending import CACHE_SECONDS, DEFAULT_WINDOW, RANKING_SIZE, parse_window, trending_books
+
+trending_api = Blueprint('trending_api', __name__, url_prefix='/api')
+
+# Books with the most reactions, wishlist entries, comments and saves lately (?window=24h&limit=20)
+@trending_api.route('/books/trending', methods=['GET'])
+def get_trending_books():
+    window = request.args.get('window', DEFAULT_WINDOW)
+    try:
+        hours = parse_window(window)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    limit = min(max(request.args.get('limit', 20, type=int), 1), RANKING_SIZE)
+
+    ranking = trending_books(hours)[:limit]
+    books = get_books([book_id for book_id, _ in ranking])
+    results = []
+    for book_id, score in ranking:
+        if book_id in books:
+            book = books[book_id]
+            book['trending_score'] = score
+            results.append(book)
+    response = jsonify({'window': window, 'books': results})
+    response.headers['Cache-Control'] = f'public, max-age={CACHE_SECONDS}'
+    return response, 200
@@ -1,10 +1,14 @@
-import jwt
+from urllib.parse import urlencode
+from datetime import datetime, timezone
 from flask import Blueprint, request, jsonify, current_app, Response, g
 from flask_restful import Api, Resource  # used for REST API building
-from datetime import datetime
-from __init__ import app
-from api.jwt_authorize import token_required
+from __init__ import db
+from api.jwt_authorize import token_required, encode_token, TOKEN_SECONDS
 from model.user import User
+from model.tokenversion import revoke_token, revoke_tokens
+from model.passwords import LoginThrottled, PasswordPoolBusy
+from model.userprovision import provision_users
+from model.userdirectory import parse_fields, user_page, count_users
 
 # Create a Blueprint for the user API
 user_api = Blueprint('user_api', __name__, url_prefix='/api')
@@ -13,6 +17,54 @@ user_api = Blueprint('user_api', __name__, url_prefix='/api')
 # API docs: https://flask-restful.readthedocs.io/en/latest/api.html
 api = Api(user_api)
 
+MAX_USER_LIMIT = 500  # largest page of users a client can ask for
+LISTING_PARAMS = ('fields', 'sort', 'order', 'q', 'role', 'limit', 'cursor')
+
+def user_listing_args(args, default_limit=50):
+    """
+    Read the sort, filter and paging parameters shared by /api/users and the admin user tables.
+
+    Returns:
+        dict: Keyword arguments for user_page.
+
+    Raises:
+        ValueError: limit is not an integer.
+    """
+    try:
+        limit = min(max(int(args.get('limit', default_limit)), 1), MAX_USER_LIMIT)
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    return {
+        'sort': args.get('sort', 'id'),
+        'order': args.get('order', 'asc'),
+        'cursor': args.get('cursor') or None,
+        'limit': limit,
+        'search': args.get('q') or None,
+        'role': args.get('role') or None,
+    }
+
+def users_page_response(current_user):
+    args = request.args
+    try:
+        listing = user_listing_args(args)
+        fields = parse_fields(args.get('fields'))
+        users, next_cursor = user_page(fields=fields, **listing)
+        total = count_users(search=listing['search'], role=listing['role'])
+    except ValueError as e:
+        return {'message': str(e)}, 400
+
+    if 'id' in fields:
+        for user in users:
+            user['access'] = ['rw'] if current_user.role == 'Admin' or current_user.id == user['id'] else ['ro']
+    response = jsonify(users)
+    response.headers['X-Total-Count'] = str(total)
+    if next_cursor:
+        params = args.to_dict()
+        params['cursor'] = next_cursor
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = f'<{request.path}?{urlencode(params)}>; rel="next"'
+    return response
+
 class UserAPI:
     """
     Define the API endpoints for the User model.
@@ -22,39 +74,57 @@ class UserAPI:
         Users API operation for bulk Create and Read.
         """
 
+        @token_required("Admin")
         def post(self):
             """
-            Handle bulk user creation by sending POST requests to the single user endpoint.
+            Create many users at once, see model/userprovision.py.
+
+            The body is a list of users (name, uid and optionally password and pfp). With
+            ?dry_run=true the users are only validated and checked against the existing uids.
             """
             users = request.get_json()
 
             if not isinstance(users, list):
                 return {'message': 'Expected a list of user data'}, 400
 
-            results = {'errors': [], 'success_count': 0, 'error_count': 0}
-
-            with current_app.test_client() as client:
-                for user in users:
-                    # Set a default password as we don't have it for bulk creation
-                    user["password"] = app.config['DEFAULT_PASSWORD']
-
-                    # Simulate a POST request to the single user creation endpoint
-                    response = client.post('/api/user', json=user)
-
-                    if response.status_code == 200:
-                        results['success_count'] += 1
-                    else:
-                        results['errors'].append(response.get_json())
-                        results['error_count'] += 1
-
-            return jsonify(results)
+            dry_run = request.args.get('dry_run', '').lower() in ('1', 'true', 'yes')
+            try:
+                rows = provision_users(users, dry_run=dry_run)
+            except Exception as e:
+                db.session.rollback()
+                return {'message': 'Failed to create users', 'error': str(e)}, 500
+
+            ok = 'would_create' if dry_run else 'created'
+            errors = [row for row in rows if row['status'] != ok]
+            return jsonify({
+                'dry_run': dry_run,
+                'success_count': len(rows) - len(errors),
+                'error_count': len(errors),
+                'errors': errors,
+                'results': rows
+            })
         
         @token_required()
         def get(self):
             """
-            Retrieve all users.
+            Retrieve all users, or one page of them when any of the listing parameters is given.
+
+            Query parameters:
+                fields: comma separated user fields, e.g. fields=id,uid,name (default: every field)
+                sort: 'id' (default), 'uid' or 'name'
+                order: 'asc' (default) or 'desc'
+                q: only users whose uid or name starts with this text (case-sensitive)
+                role: only users with this role
+                limit: page size, default 50
+                cursor: the X-Next-Cursor header of the previous page
+
+            A page is a JSON array, paging information is sent in the X-Next-Cursor, Link and
+            X-Total-Count headers.
             """
             current_user = g.current_user
+            if any(name in request.args for name in LISTING_PARAMS):
+                return users_page_response(current_user)
+
             users = User.query.all()  # extract all users from the database
 
             # Prepare a JSON list of user dictionaries
@@ -174,29 +244,27 @@ class UserAPI:
                 if not password:
                     return {'message': 'Password is missing'}, 401
 
-                # Find user
-                user = User.query.filter_by(_uid=uid).first()
-
-                if user is None or not user.is_password(password):
+                # Find user, throttled uids and a full hashing pool raise 429 and 503
+                user = User.authenticate(uid, password, request.remote_addr)
+                if user is None:
                     return {'message': "Invalid user id or password"}, 401
 
                 # Generate token
-                token = jwt.encode(
-                    {"_uid": user._uid},
-                    current_app.config["SECRET_KEY"],
-                    algorithm="HS256"
-                )
+                token = encode_token(user)
                 resp = Response(f"Authentication for {user._uid} successful")
                 resp.set_cookie(
                     current_app.config["JWT_TOKEN_NAME"],
                     token,
-                    max_age=3600,
+                    max_age=TOKEN_SECONDS,
                     secure=True,
                     httponly=True,
                     path='/',
                     samesite='None'  # This is the key part for cross-site requests
                 )
                 return resp
+            except (LoginThrottled, PasswordPoolBusy) as e:
+                # answered, not logged, a login storm would otherwise fill the log with tracebacks
+                return {'message': e.description}, e.code, {'Retry-After': str(e.retry_after)}
             except Exception as e:
                 return {
                     "error": "Something went wrong",
@@ -206,22 +274,19 @@ class UserAPI:
         @token_required()
         def delete(self):
             """
-            Invalidate the current user's token by setting its expiry to 0.
+            Invalidate the current token on the server and expire the cookie, the user's other
+            devices stay logged in.
             """
-            current_user = g.current_user
             try:
-                # Generate a token with practically 0 age
-                token = jwt.encode(
-                    {"_uid": current_user._uid, "exp": datetime.utcnow()},
-                    current_app.config["SECRET_KEY"],
-                    algorithm="HS256"
-                )
+                # Revoke this token by its jti, a copy of the cookie stops working too
+                revoke_token(g.token["jti"], datetime.fromtimestamp(g.token["exp"], timezone.utc))
+                db.session.commit()
 
                 # Prepare a response indicating the token has been invalidated
                 resp = Response("Token invalidated successfully")
                 resp.set_cookie(
                     current_app.config["JWT_TOKEN_NAME"],
-                    token,
+                    "",
                     max_age=0,  # Immediately expire the cookie
                     secure=True,
                     httponly=True,
@@ -230,10 +295,34 @@ class UserAPI:
                 )
                 return resp
             except Exception as e:
+                db.session.rollback()
                 return {
                     "message": "Failed to invalidate token",
                     "error": str(e)
                 }, 500
+    class _Revoke(Resource):
+        """
+        Admin revocation of a user's sessions.
+        """
+
+        @token_required("Admin")
+        def post(self):
+            """
+            Revoke every token of a user, they have to log in again.
+            """
+            body = request.get_json(silent=True) or {}
+            uid = body.get('uid')
+            user = User.query.filter_by(_uid=uid).first()
+            if user is None:
+                return {'message': f'User {uid} not found'}, 404
+            try:
+                revoke_tokens(user.id)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                return {'message': 'Failed to revoke tokens', 'error': str(e)}, 500
+            return {'message': f'Sessions of {uid} revoked'}, 200
+
     class _ID(Resource):  # Individual identification API operation
         @token_required()
         def get(self):
@@ -246,4 +335,5 @@ class UserAPI:
 api.add_resource(UserAPI._ID, '/id')
 api.add_resource(UserAPI._BULK_CRUD, '/users')
 api.add_resource(UserAPI._CRUD, '/user')
-api.add_resource(UserAPI._Security, '/authenticate')
\ No newline at end of file
+api.add_resource(UserAPI._Security, '/authenticate')
+api.add_resource(UserAPI._Revoke, '/user/revoke')
\ No newline at end of file
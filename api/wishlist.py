@@ -1,20 +1,22 @@
 from flask import Blueprint, jsonify, request, g
 from __init__ import app, db  # Import db object from your Flask app's __init__.py
 from model.librarydb import Book
+from api.catalog import catalog_response
+from api.etag import conditional
 from model.wishlist import Wishlist, update_wishlist_item, get_wishlist, add_to_wishlist, delete_from_wishlist  # Import the functions
 from api.jwt_authorize import token_required
 from model.user import User
+from model.bookevents import emit
 
 # Create a Blueprint for the wishlist functionality
 wishlist_api = Blueprint('wishlist_api', __name__, url_prefix='/api/wishlist')
 
 # Route to get a dropdown list of books
 @wishlist_api.route('/books', methods=['GET'])
+@conditional('books', 'genres')
 def get_books():
     """Retrieve all books from the database to display in a dropdown menu."""
-    books = Book.query.all()  # SQLAlchemy query to get all books from the books table
-    books_list = [{'id': book.id, 'title': book.title, 'author': book.author} for book in books]
-    return jsonify(books_list)
+    return catalog_response(default_fields=('id', 'title', 'author'))  # streamed, accepts fields/sort/limit/cursor
 
 # Route to get all books in the wishlist 
 @wishlist_api.route('/', methods=['GET'])
@@ -79,6 +81,7 @@ def delete_book_from_wishlist(id):
 
     try:
         db.session.delete(wishlist_item)
+        emit('wishlist.removed', item=wishlist_item)
         db.session.commit()
         return jsonify({"message": "Wishlist item removed"}), 200
     except Exception as e:
@@ -1,4 +1,6 @@
 # imports from flask
+import csv
+import io
 import json
 import os
 from urllib.parse import urljoin, urlparse
@@ -6,16 +8,17 @@ from flask import abort, redirect, render_template, request, send_from_directory
 from flask_login import current_user, login_user, logout_user
 from flask.cli import AppGroup
 from flask_login import current_user, login_required
-from flask import current_app
+from flask import current_app, Response, stream_with_context
 from werkzeug.security import generate_password_hash
 import shutil
+import click
 
 
 
 # import "objects" from "this" project
 from __init__ import app, db, login_manager  # Key Flask objects 
 # API endpoints
-from api.user import user_api 
+from api.user import user_api, user_listing_args
 from api.pfp import pfp_api
 from api.nestImg import nestImg_api # Justin added this, custom format for his website
 from api.post import post_api
@@ -34,6 +37,15 @@ from api.wishlist import wishlist_api  # Import the wishlist blueprint
 from api.suggest import suggest_api
 from api.bookpurchase import bookpurchase_api # Avika added this, book purchase for her website
 from api.emotion import emotion_api
+from api.booksearch import booksearch_api
+from api.genre import genre_api
+from api.catalog import catalog_api
+from api.metrics import metrics_api
+from api.covers import covers_api
+from api.author import author_api
+from api.trending import trending_api
+from api.bookstats import bookstats_api
+from api.commentsearch import commentsearch_api
 
 
 
@@ -41,6 +53,9 @@ from api.vote import vote_api
 # database Initialization functions
 from model.carChat import CarChat
 from model.user import User, initUsers
+from model.tokenversion import revoke_tokens
+from model.usercache import load_session_user
+from model.userdirectory import USER_FIELDS, parse_fields, user_page, iter_users, count_users
 from model.section import Section, initSections
 from model.group import Group, initGroups
 from model.channel import Channel, initChannels
@@ -49,12 +64,21 @@ from model.nestPost import NestPost, initNestPosts # Justin added this, custom f
 from model.vote import Vote, initVotes
 from model.librarydb import Book, initBooks 
 from model.reaction import Reaction, initReactions
-from model.commentsdb import Comments, initComments
+from model.commentsdb import Comments, initComments, delete_duplicate_comments
 from model.suggest import SuggestedBook, initSuggest
 from model.bookpurchasedb import CartItem, init_books_in_cart
 from model.wishlist import Wishlist, initWishlist
 from model.bookrecdb import SaveBookRec, initSavedBookRecs
 from model.emotion import Emotion, initEmotion
+from model.booksearch import init_book_search
+from model.commentsearch import init_comment_search
+from model.genre import Genre, initGenres, backfill_genres
+from model.bookimport import FORMATS as BOOK_IMPORT_FORMATS, import_books_file
+from model.bookvectors import DIMENSIONS, build_book_vectors, build_book_index
+from model.userrecs import build_user_recommendations
+from model.author import backfill_authors
+from model.authorstats import check_author_counts, recount_authors
+from model.bookstats import repair_book_stats
 
 # server only Views
 
@@ -80,6 +104,15 @@ app.register_blueprint(nestImg_api)
 app.register_blueprint(vote_api)
 app.register_blueprint(car_api)
 app.register_blueprint(emotion_api)
+app.register_blueprint(booksearch_api)
+app.register_blueprint(genre_api)
+app.register_blueprint(catalog_api)
+app.register_blueprint(metrics_api)
+app.register_blueprint(covers_api)
+app.register_blueprint(author_api)
+app.register_blueprint(trending_api)
+app.register_blueprint(bookstats_api)
+app.register_blueprint(commentsearch_api)
 
 
 # Tell Flask-Login the view function name of your login route
@@ -92,7 +125,7 @@ def unauthorized_callback():
 # register URIs for server pages
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return load_session_user(int(user_id))
 
 @app.context_processor
 def inject_user():
@@ -109,8 +142,8 @@ def login():
     error = None
     next_page = request.args.get('next', '') or request.form.get('next', '')
     if request.method == 'POST':
-        user = User.query.filter_by(_uid=request.form['username']).first()
-        if user and user.is_password(request.form['password']):
+        user = User.authenticate(request.form['username'], request.form['password'], request.remote_addr)
+        if user:
             login_user(user)
             if not is_safe_url(next_page):
                 return abort(400)
@@ -134,17 +167,62 @@ def index():
     print("Home:", current_user)
     return render_template("index.html")
 
+def render_user_table(template):
+    # one page of users, sorted and filtered by the query string, non-admins only see themselves
+    only = None if current_user.role == 'Admin' else current_user.id
+    try:
+        listing = user_listing_args(request.args)
+        users, next_cursor = user_page(user_id=only, **listing)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    total = count_users(search=listing['search'], role=listing['role'], user_id=only)
+    params = {key: value for key, value in request.args.items() if key != 'cursor'}
+    return render_template(template, user_data=users, listing=listing, total=total,
+                           first_url=url_for(request.endpoint, **params),
+                           next_url=url_for(request.endpoint, **params, cursor=next_cursor) if next_cursor else None)
+
 @app.route('/users/table')
 @login_required
 def utable():
-    users = User.query.all()
-    return render_template("utable.html", user_data=users)
+    return render_user_table("utable.html")
 
 @app.route('/users/table2')
 @login_required
 def u2table():
-    users = User.query.all()
-    return render_template("u2table.html", user_data=users)
+    return render_user_table("u2table.html")
+
+# Stream every user matching the table's filters as CSV, read BATCH_SIZE rows at a time
+@app.route('/users/export')
+@login_required
+def export_users():
+    if current_user.role != 'Admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+    try:
+        listing = user_listing_args(request.args)
+        fields = parse_fields(request.args.get('fields'), USER_FIELDS)
+        rows = iter_users(fields=fields, sort=listing['sort'], order=listing['order'],
+                          search=listing['search'], role=listing['role'])
+        # read the first batch now so a bad sort is still reported as a 400
+        first = next(rows, None)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fields)
+        writer.writeheader()
+        if first is not None:
+            writer.writerow(first)
+        for row in rows:
+            writer.writerow(row)
+            if buffer.tell() > 64 * 1024:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    return Response(stream_with_context(generate()), mimetype='text/csv',
+                    headers={'Content-Disposition': 'attachment; filename=users.csv'})
 
 # Helper function to extract uploads for a user (ie PFP image)
 @app.route('/uploads/<path:filename>')
@@ -170,7 +248,8 @@ def reset_password(user_id):
     if not user:
         return jsonify({'error': 'User not found'}), 404
 
-    # Set the new password
+    # Set the new password, sessions opened with the old one end
+    revoke_tokens(user.id)
     if user.update({"password": app.config['DEFAULT_PASSWORD']}):
         return jsonify({'message': 'Password reset successfully'}), 200
     return jsonify({'error': 'Password reset failed'}), 500
@@ -188,6 +267,7 @@ def generate_data():
     initPosts()
     initNestPosts()
     initVotes()
+    initGenres()
     initBooks()
     initComments()
     initReactions()
@@ -196,6 +276,13 @@ def generate_data():
     init_books_in_cart()
     initSuggest()
     initEmotion()
+    check_author_counts()  # seed data is inserted without book events
+    repair_book_stats()
+    db.session.commit()
+    init_book_search()
+    init_comment_search()
+    build_book_vectors()
+    build_user_recommendations()
     
 # Backup the old database
 def backup_database(db_uri, backup_uri):
@@ -274,6 +361,102 @@ def restore_data_command():
     data = load_data_from_json()
     restore_data(data)
     
+# Define a command to rebuild the book and comment search indexes from their tables
+@custom_cli.command('rebuild_search')
+def rebuild_search():
+    init_book_search(rebuild=True)
+    init_comment_search(rebuild=True)
+    print("Book and comment search indexes rebuilt.")
+
+# Define a command to link existing books, suggestions and saved recommendations to the genre taxonomy
+@custom_cli.command('migrate_genres')
+def migrate_genres():
+    initGenres()
+    for model in [Book, SuggestedBook, SaveBookRec]:
+        linked = backfill_genres(model, create=model is Book)  # suggestions and saved recommendations only link to known genres
+        print(f"Linked {linked} {model.__tablename__} rows to genres.")
+
+# Define a command to link existing books to authors and recompute every author's aggregates
+@custom_cli.command('migrate_authors')
+def migrate_authors():
+    linked = backfill_authors(Book)
+    print(f"Linked {linked} books to authors.")
+    try:
+        recounted = recount_authors()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        raise e
+    print(f"Recounted {recounted} authors.")
+
+# Define a command to compare the author aggregates with the tables they count, recounting on a mismatch
+@custom_cli.command('check_authors')
+def check_authors():
+    if check_author_counts():
+        print("Author aggregates were out of date, recounted every author.")
+    else:
+        print("Author aggregates are up to date.")
+
+# Define a command to rebuild the per-book statistics from the comments, emotion and wishlist tables
+@custom_cli.command('repair_book_stats')
+def repair_book_stats_command():
+    try:
+        books = repair_book_stats()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        raise e
+    print(f"Rebuilt statistics of {books} books.")
+
+# Define a command to delete duplicate comments left by databases created before comments were deduplicated
+@custom_cli.command('dedupe_comments')
+def dedupe_comments():
+    deleted = delete_duplicate_comments()
+    print(f"Deleted {deleted} duplicate comments, recounted their books and authors.")
+
+# Define a command to bulk import books from a CSV or JSONL file, e.g. flask custom import_books books.csv
+@custom_cli.command('import_books')
+@click.argument('path')
+@click.option('--format', 'fmt', type=click.Choice(BOOK_IMPORT_FORMATS), help='Defaults to the file extension.')
+@click.option('--batch-size', default=1000, show_default=True, help='Books written per transaction.')
+@click.option('--start', default=0, help='Number of records to skip.')
+@click.option('--checkpoint', default=None, help='Checkpoint file, defaults to PATH.checkpoint. Resumes from it if present.')
+def import_books_command(path, fmt, batch_size, start, checkpoint):
+    def report(totals):
+        print(f"{totals['offset']} records read: {totals['inserted']} inserted, {totals['updated']} updated, {totals['skipped']} skipped")
+    totals = import_books_file(path, fmt=fmt, batch_size=batch_size, start=start,
+                               checkpoint=checkpoint or path + '.checkpoint', progress=report)
+    print(f"Import finished: {totals['inserted']} inserted, {totals['updated']} updated, {totals['skipped']} skipped.")
+
+# Define a command to rebuild the "more like this" book vectors, e.g. after a bulk import
+@custom_cli.command('build_vectors')
+@click.option('--dimensions', default=DIMENSIONS, show_default=True, help='Floats per book vector.')
+@click.option('--ann/--no-ann', default=True, show_default=True, help='Also rebuild the approximate nearest neighbour index.')
+def build_vectors(dimensions, ann):
+    count = build_book_vectors(dimensions)
+    print(f"Built vectors for {count} books.")
+    if ann and count:
+        manifest = build_book_index()
+        print(f"Built the similarity index with {manifest['lists']} partitions.")
+
+# Define a command to rebuild only the approximate nearest neighbour index over the current book vectors
+@custom_cli.command('build_ann')
+@click.option('--lists', default=None, type=int, help='Number of partitions, defaults to sqrt(number of books).')
+def build_ann(lists):
+    manifest = build_book_index(lists)
+    if manifest is None:
+        print("Build the book vectors first: flask custom build_vectors")
+    else:
+        print(f"Built the similarity index over {manifest['vectors']} books with {manifest['lists']} partitions.")
+
+# Define a command to recompute every user's recommendations, meant to run on a schedule (e.g. nightly cron)
+@custom_cli.command('build_recs')
+@click.option('--top-n', default=20, show_default=True, help='Books stored per user.')
+@click.option('--neighbors', default=50, show_default=True, help='Similar books kept per book.')
+def build_recs(top_n, neighbors):
+    users = build_user_recommendations(top_n=top_n, neighbors=neighbors)
+    print(f"Built recommendations for {users} users.")
+
 # Register the custom command group with the Flask application
 app.cli.add_command(custom_cli)
         
@@ -0,0 +1,167 @@
+## model, backend
+import json
+import os
+import threading
+import time
+import numpy as np
+
+# Approximate nearest neighbour search (IVF, inverted file)
+# The vectors are clustered with k-means into `lists` partitions. A query is compared with the
+# partition centroids first and only the vectors of the `nprobe` closest partitions are scanned,
+# so a search reads about nprobe / lists of the matrix. nprobe is the recall/latency knob: more
+# partitions probed means better recall and slower queries, nprobe = lists is an exact search.
+# Vectors are expected to be L2-normalized, similarity is the dot product.
+
+DEFAULT_NPROBE = 8
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE = 100000  # vectors used to train the centroids, all vectors are then assigned
+
+CENTROIDS_FILE = 'centroids.npy'  # float32 (lists x dimensions)
+VECTORS_FILE = 'vectors.npy'      # float32, the vectors reordered so each partition is contiguous
+ROWS_FILE = 'rows.npy'            # int64, the original row of each reordered vector
+OFFSETS_FILE = 'offsets.npy'      # int64 (lists + 1), partition i is VECTORS_FILE[offsets[i]:offsets[i + 1]]
+MANIFEST_FILE = 'manifest.json'   # written last, readers reload when it changes
+
+
+def default_lists(count):
+    """About sqrt(n) partitions, the usual IVF starting point."""
+    return max(1, min(count, int(np.sqrt(count))))
+
+
+def _assign(vectors, centroids, chunk=50000):
+    # nearest centroid of every vector, in chunks so the score matrix stays small
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk):
+        labels[start:start + chunk] = np.argmax(np.asarray(vectors[start:start + chunk]) @ centroids.T, axis=1)
+    return labels
+
+
+def kmeans(vectors, lists, iterations=KMEANS_ITERATIONS, sample=KMEANS_SAMPLE, seed=0):
+    """
+    Spherical k-means: centroids are renormalized after each step, matching dot product similarity.
+
+    Args:
+        vectors (np.ndarray): Normalized float32 vectors, one per row.
+        lists (int): Number of centroids.
+        iterations (int): Lloyd iterations.
+        sample (int): Train on at most this many randomly chosen vectors.
+        seed (int): Random seed, builds are reproducible.
+
+    Returns:
+        np.ndarray: float32 centroids (lists x dimensions).
+    """
+    rng = np.random.default_rng(seed)
+    count = len(vectors)
+    train = np.asarray(vectors[np.sort(rng.choice(count, size=min(sample, count), replace=False))], dtype=np.float32)
+    centroids = train[rng.choice(len(train), size=lists, replace=False)].copy()
+    for _ in range(iterations):
+        labels = _assign(train, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, train)
+        empty = np.bincount(labels, minlength=lists) == 0
+        # an empty partition restarts from a random training vector
+        sums[empty] = train[rng.choice(len(train), size=int(empty.sum()))]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = (sums / np.maximum(norms, 1e-12)).astype(np.float32)
+    return centroids
+
+
+def build_ivf(vectors, folder, lists=None, iterations=KMEANS_ITERATIONS, source=None):
+    """
+    Build an IVF index over a matrix and write it to a folder, replacing any previous index.
+
+    Args:
+        vectors (np.ndarray): Normalized float32 vectors, may be memory-mapped.
+        folder (str): Where the index files are written.
+        lists (int, optional): Number of partitions, defaults to default_lists(len(vectors)).
+        iterations (int): k-means iterations.
+        source (dict, optional): Stored in the manifest, used by readers to tell whether the index
+            matches the vectors it was built from.
+
+    Returns:
+        dict: The manifest.
+    """
+    lists = min(lists or default_lists(len(vectors)), len(vectors))
+    centroids = kmeans(vectors, lists, iterations)
+    labels = _assign(vectors, centroids)
+    rows = np.argsort(labels, kind='stable')
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=lists))]).astype(np.int64)
+
+    os.makedirs(folder, exist_ok=True)
+    arrays = {CENTROIDS_FILE: centroids, VECTORS_FILE: np.asarray(vectors)[rows].astype(np.float32),
+              ROWS_FILE: rows.astype(np.int64), OFFSETS_FILE: offsets}
+    for name, array in arrays.items():
+        with open(os.path.join(folder, name + '.tmp'), 'wb') as f:
+            np.save(f, array)
+    manifest = {'vectors': len(vectors), 'lists': lists, 'built_at': time.time(), 'source': source}
+    with open(os.path.join(folder, MANIFEST_FILE + '.tmp'), 'w') as f:
+        json.dump(manifest, f)
+    for name in list(arrays) + [MANIFEST_FILE]:
+        os.replace(os.path.join(folder, name + '.tmp'), os.path.join(folder, name))
+    return manifest
+
+
+class IVFIndex:
+    """
+    A read-only, memory-mapped IVF index, reloaded when the folder's manifest changes.
+
+    Args:
+        folder (str): The folder build_ivf wrote to.
+    """
+    def __init__(self, folder):
+        self.folder = folder
+        self._lock = threading.Lock()
+        self._stamp = None
+        self.manifest = None
+
+    def _refresh(self):
+        try:
+            stat = os.stat(os.path.join(self.folder, MANIFEST_FILE))
+            stamp = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            stamp = None
+        if stamp == self._stamp:
+            return
+        with self._lock:
+            if stamp != self._stamp:
+                self.manifest = None
+                if stamp is not None:
+                    # the small arrays are read into memory, the vectors and their rows stay mapped
+                    self.centroids = np.load(os.path.join(self.folder, CENTROIDS_FILE))
+                    self.offsets = np.load(os.path.join(self.folder, OFFSETS_FILE))
+                    self.vectors = np.load(os.path.join(self.folder, VECTORS_FILE), mmap_mode='r')
+                    self.rows = np.load(os.path.join(self.folder, ROWS_FILE), mmap_mode='r')
+                    with open(os.path.join(self.folder, MANIFEST_FILE)) as f:
+                        self.manifest = json.load(f)
+                self._stamp = stamp
+
+    def current(self, source=None):
+        """True if an index is available and, when source is given, was built from that source."""
+        self._refresh()
+        return self.manifest is not None and (source is None or self.manifest.get('source') == source)
+
+    def search(self, query, k, nprobe=DEFAULT_NPROBE):
+        """
+        The k vectors with the highest dot product among the nprobe closest partitions.
+
+        Args:
+            query (np.ndarray): A normalized float32 vector.
+            k (int): Number of results.
+            nprobe (int): Partitions scanned, between 1 and the number of lists.
+
+        Returns:
+            tuple: (original rows, scores), both arrays ordered best first.
+        """
+        self._refresh()
+        lists = len(self.centroids)
+        nprobe = min(max(nprobe, 1), lists)
+        probe = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        positions = np.concatenate([np.arange(self.offsets[i], self.offsets[i + 1]) for i in probe])
+        if not len(positions):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        # partitions are contiguous, so each probed partition is one sequential read of the map
+        scores = np.concatenate([np.asarray(self.vectors[self.offsets[i]:self.offsets[i + 1]]) @ query for i in probe])
+        top = min(k, len(scores))
+        best = np.argpartition(-scores, top - 1)[:top]
+        best = best[np.argsort(-scores[best])]
+        return np.asarray(self.rows[positions[best]]), scores[best]
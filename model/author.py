@@ -0,0 +1,120 @@
+## model, backend
+import re
+from sqlalchemy import update
+from __init__ import app, db
+from model.dbutil import add_column_if_missing, create_index_if_missing
+from model.tableversion import TableVersion
+
+class Author(db.Model):
+    """
+    Author Model
+
+    One row per author, books point to it through Book.author_id. The counts are aggregates kept
+    up to date by model/authorstats.py as books, comments and reactions are written.
+
+    Attributes:
+        id (db.Column): The primary key.
+        name (db.Column): The name as first seen, e.g. 'J.K. Rowling'.
+        key (db.Column): The normalized name used for lookups, e.g. 'j k rowling'.
+        book_count (db.Column): Books by the author.
+        review_count (db.Column): Comments on the author's books.
+        reaction_count (db.Column): Emotion reactions to the author's books.
+    """
+    __tablename__ = 'authors'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(255), nullable=False)
+    key = db.Column(db.String(255), unique=True, nullable=False, index=True)
+    book_count = db.Column(db.Integer, nullable=False, default=0)
+    review_count = db.Column(db.Integer, nullable=False, default=0)
+    reaction_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<Author(id={self.id}, name={self.name})>"
+
+    def read(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'book_count': self.book_count,
+            'review_count': self.review_count,
+            'reaction_count': self.reaction_count
+        }
+
+    @staticmethod
+    def resolve(name, create=False):
+        """
+        Find the author a name refers to, with one indexed lookup on the normalized key.
+
+        Args:
+            name (str): An author name, spacing, case and punctuation are ignored.
+            create (bool): Create the author when nothing matches.
+
+        Returns:
+            Author: The matching author, or None.
+        """
+        key = author_key(name)
+        if not key:
+            return None
+        author = Author.query.filter_by(key=key).first()
+        if author or not create:
+            return author
+        author = Author(name=name.strip(), key=key, book_count=0, review_count=0, reaction_count=0)
+        db.session.add(author)
+        db.session.flush()
+        TableVersion.bump('authors')
+        return author
+
+
+def author_key(name):
+    """Normalize an author name for lookups: 'J.K. Rowling' and 'J. K. Rowling' -> 'j k rowling'."""
+    return re.sub(r'[^a-z0-9]+', ' ', (name or '').lower()).strip()
+
+
+def assign_author(record):
+    """Point a record with `author` and `author_id` columns at its Author, adding new authors."""
+    author = Author.resolve(record.author, create=True)
+    record.author_id = author.id if author else None
+
+
+def backfill_authors(model):
+    """
+    Link a table with a free-text `author` column to the authors table.
+
+    Adds the `author_id` column and its index to databases created before the authors table
+    existed, then links every unlinked row, one UPDATE per distinct author string. The aggregates
+    of the linked authors are filled in by model/authorstats.py.
+
+    Args:
+        model (db.Model): A model with `author` and `author_id` columns.
+
+    Returns:
+        int: The number of rows linked.
+    """
+    table = model.__tablename__
+    add_column_if_missing(table, model.__table__.c.author_id)
+    for index in model.__table__.indexes:
+        if 'author_id' in index.columns:
+            create_index_if_missing(index)
+
+    linked = 0
+    names = [row[0] for row in db.session.query(model.author).filter(model.author_id.is_(None)).distinct()]
+    for name in names:
+        author = Author.resolve(name, create=True)
+        if author is None:
+            continue
+        result = db.session.execute(
+            update(model)
+            .where(model.author == name, model.author_id.is_(None))
+            .values(author_id=author.id)
+        )
+        linked += result.rowcount
+    if linked:
+        TableVersion.bump(table)
+    db.session.commit()
+    return linked
+
+
+# create the table before the books table that references it
+with app.app_context():
+    db.create_all()
@@ -0,0 +1,158 @@
+## model, backend
+from sqlalchemy import func, select, update
+from __init__ import app, db
+from model.author import Author
+from model.bookevents import on
+from model.librarydb import Book, startup_linked_authors
+from model.commentsdb import Comments
+from model.emotion import Emotion
+from model.tableversion import TableVersion
+
+# Author aggregates
+# Author.book_count, review_count and reaction_count are kept up to date as the writes happen, so an
+# author page reads one row instead of counting over books, comments and reactions. Comments and
+# reactions, the frequent writes, add or subtract one with an atomic UPDATE. Book writes are rare and
+# can move comments and reactions between authors, so they recount the authors involved.
+# Reactions name a book by title (Emotion.title_id), they count for the authors of the books with
+# that title.
+
+
+def _reaction_author_ids(title):
+    return [row[0] for row in db.session.query(Book.author_id)
+            .filter(Book.title == title, Book.author_id.isnot(None)).distinct()]
+
+
+def _add(author_ids, column, amount):
+    author_ids = [author_id for author_id in author_ids if author_id]
+    if not author_ids:
+        return
+    counter = getattr(Author, column)
+    db.session.execute(
+        update(Author).where(Author.id.in_(author_ids)).values({column: counter + amount}),
+        execution_options={'synchronize_session': False})
+    TableVersion.bump('authors')
+
+
+def recount_authors(author_ids=None):
+    """
+    Recompute the aggregates of some or all authors from the books, comments and reactions tables.
+
+    Runs inside the caller's transaction, the caller commits.
+
+    Args:
+        author_ids (iterable, optional): The authors to recount, every author when omitted.
+
+    Returns:
+        int: The number of authors recounted.
+    """
+    query = db.session.query(Author)
+    if author_ids is not None:
+        author_ids = [author_id for author_id in set(author_ids) if author_id]
+        if not author_ids:
+            return 0
+        query = query.filter(Author.id.in_(author_ids))
+
+    def counts(statement):
+        if author_ids is not None:
+            statement = statement.where(Book.author_id.in_(author_ids))
+        return dict(db.session.execute(statement.group_by(Book.author_id)).all())
+
+    books = counts(select(Book.author_id, func.count(Book.id)))
+    reviews = counts(select(Book.author_id, func.count(Comments.id)).join(Book, Comments.book_id == Book.id))
+    reactions = counts(select(Book.author_id, func.count(Emotion.id.distinct())).join(Book, Emotion.title_id == Book.title))
+
+    authors = query.all()
+    for author in authors:
+        author.book_count = books.get(author.id, 0)
+        author.review_count = reviews.get(author.id, 0)
+        author.reaction_count = reactions.get(author.id, 0)
+    if authors:
+        TableVersion.bump('authors')
+    return len(authors)
+
+
+def check_author_counts():
+    """
+    Compare the summed aggregates with the tables they count and recount every author on a mismatch,
+    e.g. after seed data was inserted before these handlers were registered.
+
+    Returns:
+        bool: True if a recount was needed.
+    """
+    stored = db.session.query(func.coalesce(func.sum(Author.book_count), 0), func.coalesce(func.sum(Author.review_count), 0),
+                              func.coalesce(func.sum(Author.reaction_count), 0)).one()
+    actual = (
+        db.session.query(func.count(Book.id)).filter(Book.author_id.isnot(None)).scalar(),
+        db.session.query(func.count(Comments.id)).join(Book, Comments.book_id == Book.id).filter(Book.author_id.isnot(None)).scalar(),
+        db.session.execute(select(func.count()).select_from(
+            select(Book.author_id, Emotion.id).join(Book, Emotion.title_id == Book.title)
+            .where(Book.author_id.isnot(None)).distinct().subquery())).scalar(),
+    )
+    if tuple(stored) == actual:
+        return False
+    try:
+        recount_authors()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        raise e
+    return True
+
+
+@on('book.created')
+def _book_created(book):
+    recount_authors([book.author_id])
+
+
+@on('book.updated')
+def _book_updated(book, previous):
+    recount_authors([book.author_id, previous.get('author_id')])
+
+
+@on('book.deleted')
+def _book_deleted(book):
+    recount_authors([book.author_id])
+
+
+@on('books.imported')
+def _books_imported(author_ids):
+    recount_authors(author_ids)
+
+
+@on('comments.imported')
+@on('comments.deduplicated')
+def _comments_imported(book_ids):
+    recount_authors(row[0] for row in db.session.query(Book.author_id).filter(Book.id.in_(list(book_ids))).distinct())
+
+
+@on('comment.created')
+def _comment_created(comment):
+    _add([db.session.query(Book.author_id).filter(Book.id == comment.book_id).scalar()], 'review_count', 1)
+
+
+@on('comment.deleted')
+def _comment_deleted(comment):
+    _add([db.session.query(Book.author_id).filter(Book.id == comment.book_id).scalar()], 'review_count', -1)
+
+
+@on('reaction.created')
+def _reaction_created(emotion):
+    _add(_reaction_author_ids(emotion.title_id), 'reaction_count', 1)
+
+
+@on('reaction.deleted')
+def _reaction_deleted(emotion):
+    _add(_reaction_author_ids(emotion.title_id), 'reaction_count', -1)
+
+
+# fill in the authors linked by the startup backfill; seed data is counted by generate_data and
+# any other drift by flask custom check_authors, neither scans the tables at every worker start
+with app.app_context():
+    db.create_all()  # the emotion table is otherwise created by initEmotion
+    if startup_linked_authors:
+        try:
+            recount_authors()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            raise e
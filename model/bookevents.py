@@ -0,0 +1,51 @@
+## model, backend
+from collections import defaultdict
+
+# Book events
+# Models announce their writes here and subsystems that keep derived data (e.g. author aggregates)
+# subscribe, so a model does not need to know who depends on it.
+# Handlers run synchronously inside the write's transaction, before the commit: whatever they
+# change is committed or rolled back together with the write itself.
+#
+# Events and their keyword arguments:
+#   book.created      book
+#   book.updated      book, previous (dict of the changed columns' old values)
+#   book.deleted      book (already flushed, so queries no longer see it)
+#   books.imported    author_ids (authors whose books a bulk import inserted or updated)
+#   comment.created   comment
+#   comment.deleted   comment
+#   comments.imported book_ids (books that comments were bulk inserted for, e.g. by a restore)
+#   comments.deduplicated book_ids (books that duplicate comments were deleted from)
+#   reaction.created  emotion
+#   reaction.deleted  emotion
+#   reaction.changed  emotion, previous_type (the reaction_type before the change)
+#   wishlist.added    item (a Wishlist row)
+#   wishlist.removed  item
+#   bookrec.saved     record (a SaveBookRec row)
+
+_handlers = defaultdict(list)
+
+
+def on(event):
+    """
+    Decorator subscribing a function to an event, e.g. @on('comment.created').
+
+    Args:
+        event (str): One of the events listed above.
+    """
+    def decorator(handler):
+        _handlers[event].append(handler)
+        return handler
+    return decorator
+
+
+def emit(event, **payload):
+    """
+    Run every handler of an event. Call it before committing the write it describes.
+
+    Args:
+        event (str): One of the events listed above.
+        payload: The event's keyword arguments.
+    """
+    for handler in _handlers[event]:
+        handler(**payload)
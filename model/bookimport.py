@@ -0,0 +1,134 @@
+## model, backend
+import csv
+import io
+import json
+import os
+from itertools import islice
+from __init__ import db
+from model.librarydb import Book
+
+# Bulk catalog importer
+# Records are streamed from a CSV or JSONL file, so a 200k-title catalog never sits in memory, and
+# written with Book.upsert_many, one transaction per batch. After every batch the number of records
+# consumed is saved to a checkpoint file so a failed import can resume where it stopped.
+
+FORMATS = ('csv', 'jsonl')
+DEFAULT_BATCH_SIZE = 1000
+
+
+def detect_format(filename):
+    """Guess the format from a file name, 'books.jsonl' -> 'jsonl'. Defaults to csv."""
+    extension = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    return 'jsonl' if extension in ('jsonl', 'ndjson', 'json') else 'csv'
+
+
+def read_records(stream, fmt):
+    """
+    Yield one book dictionary per record of a text stream.
+
+    Args:
+        stream: A text file object.
+        fmt (str): 'csv' (with a header row) or 'jsonl' (one JSON object per line).
+
+    Raises:
+        ValueError: The format is unknown or a JSONL line is not a JSON object.
+    """
+    if fmt == 'csv':
+        for row in csv.DictReader(stream):
+            yield {key.strip(): (value.strip() if isinstance(value, str) else value) for key, value in row.items() if key}
+    elif fmt == 'jsonl':
+        for number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError(f'Line {number} is not a JSON object')
+            yield record
+    else:
+        raise ValueError(f"Unknown format '{fmt}', expected one of: {', '.join(FORMATS)}")
+
+
+def load_book_keys():
+    """Map (title, author) -> id for the whole catalog, one query for the whole import."""
+    return {(title, author): book_id for book_id, title, author in db.session.query(Book.id, Book.title, Book.author)}
+
+
+def read_checkpoint(path, source):
+    """The offset saved for this source, 0 if there is no checkpoint or it belongs to another file."""
+    if not path or not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        checkpoint = json.load(f)
+    return checkpoint.get('offset', 0) if checkpoint.get('source') == source else 0
+
+
+def write_checkpoint(path, source, offset):
+    # write then rename, so a crash never leaves half a checkpoint
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'source': source, 'offset': offset}, f)
+    os.replace(tmp, path)
+
+
+def import_books(stream, fmt='csv', batch_size=DEFAULT_BATCH_SIZE, start=0, checkpoint=None, source=None, progress=None):
+    """
+    Import books from a CSV or JSONL stream.
+
+    Args:
+        stream: A text file object.
+        fmt (str): 'csv' or 'jsonl'.
+        batch_size (int): Records written per transaction.
+        start (int): Number of records to skip, e.g. the offset reported by an interrupted import.
+        checkpoint (str, optional): Path of a checkpoint file. The import resumes from the offset saved
+            there for the same source, saves the offset after each batch and deletes it when done.
+        source (str, optional): Identifies the input in the checkpoint, usually the file path.
+        progress (function, optional): Called with the running totals after each batch.
+
+    Returns:
+        dict: Totals of 'inserted', 'updated' and 'skipped' records and the final 'offset'.
+
+    Raises:
+        Exception: A batch failed. It is rolled back, earlier batches stay committed and the
+            checkpoint holds the offset to resume from.
+    """
+    if checkpoint:
+        start = max(start, read_checkpoint(checkpoint, source))
+    totals = {'inserted': 0, 'updated': 0, 'skipped': 0, 'offset': start}
+    known = load_book_keys()
+    records = islice(read_records(stream, fmt), start, None)
+
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            break
+        try:
+            result = Book.upsert_many(batch, known)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        for key in ('inserted', 'updated', 'skipped'):
+            totals[key] += result[key]
+        totals['offset'] += len(batch)
+        if checkpoint:
+            write_checkpoint(checkpoint, source, totals['offset'])
+        if progress:
+            progress(dict(totals))
+
+    if checkpoint and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    return totals
+
+
+def import_books_file(path, fmt=None, **kwargs):
+    """Import books from a file on disk, see import_books for the options."""
+    fmt = fmt or detect_format(path)
+    with open(path, newline='', encoding='utf-8') as f:
+        return import_books(f, fmt=fmt, source=os.path.abspath(path), **kwargs)
+
+
+def import_books_upload(file_storage, fmt=None, **kwargs):
+    """Import books from an uploaded file (werkzeug FileStorage), read as a stream."""
+    fmt = fmt or detect_format(file_storage.filename)
+    stream = io.TextIOWrapper(file_storage.stream, encoding='utf-8', newline='')
+    return import_books(stream, fmt=fmt, source=file_storage.filename, **kwargs)
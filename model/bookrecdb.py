@@ -2,6 +2,7 @@ from sqlalchemy import Column, Integer, String, Text
 from sqlalchemy.exc import IntegrityError
 from __init__ import db, app
 from model.librarydb import Book
+from model.genre import assign_genre, backfill_genres
 #import random
 
 class SaveBookRec(db.Model): # Class to save a book recommendation
@@ -10,6 +11,7 @@ class SaveBookRec(db.Model): # Class to save a book recommendation
     title = Column(String, nullable=False)
     author = Column(String, nullable=False)
     genre = Column(String, nullable=False)
+    genre_id = Column(Integer, db.ForeignKey('genres.id'), index=True) # Reference to Genre.id, kept in sync with genre
     description = Column(Text, nullable=True)
     cover_url = Column(String, nullable=True)
 
@@ -19,6 +21,7 @@ class SaveBookRec(db.Model): # Class to save a book recommendation
         self.genre = genre
         self.description = description
         self.cover_url = cover_url
+        assign_genre(self, create=False) # Link the genre text to the genre taxonomy, unknown genres stay unlinked
     
     def read(self): # Function to read the book recommendation
         return {
@@ -26,6 +29,7 @@ class SaveBookRec(db.Model): # Class to save a book recommendation
             'title': self.title,
             'author': self.author,
             'genre': self.genre,
+            'genre_id': self.genre_id,
             'description': self.description,
             'cover_url': self.cover_url
         }
@@ -38,6 +42,7 @@ class SaveBookRec(db.Model): # Class to save a book recommendation
                 existing_record.genre = item['genre']
                 existing_record.description = item['description']
                 existing_record.cover_url = item['cover_url']
+                assign_genre(existing_record, create=False)
             else: # If the book recommendation does not exist, create a new record
                 new_record = cls( # Create a new record
                     title=item['title'],
@@ -71,6 +76,7 @@ def initSavedBookRecs():
 # Create the table before inserting data
 with app.app_context():
     db.create_all()
+    backfill_genres(SaveBookRec, create=False) # Link saved recommendations made before the genre taxonomy
     initSavedBookRecs() # Initialize the saved book recommendations
 
 '''
@@ -0,0 +1,163 @@
+## model, backend
+import re
+from sqlalchemy import text, inspect, or_
+from __init__ import app, db
+from model.librarydb import Book
+from model.catalog import get_books
+
+# Full-text index over the books table
+# - SQLite (dev): an FTS5 virtual table that uses `books` as its external content, kept in sync by triggers
+# - MySQL (prod): a FULLTEXT index on the books table itself
+# Anything else falls back to a LIKE scan so the endpoint still works.
+
+FTS_TABLE = 'books_fts'
+FULLTEXT_INDEX = 'books_fulltext'
+SEARCH_COLUMNS = ('title', 'author', 'genre', 'description')
+# bm25 column weights, title matches rank above author, genre and description matches
+BM25_WEIGHTS = (10.0, 5.0, 2.0, 1.0)
+MAX_TERMS = 10  # cap the number of words taken from a query
+
+_SQLITE_DDL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, author, genre, description,
+        content='books', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON books BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, author, genre, description)
+        VALUES (new.id, new.title, new.author, new.genre, new.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON books BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author, genre, description)
+        VALUES ('delete', old.id, old.title, old.author, old.genre, old.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE ON books BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author, genre, description)
+        VALUES ('delete', old.id, old.title, old.author, old.genre, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, title, author, genre, description)
+        VALUES (new.id, new.title, new.author, new.genre, new.description);
+    END
+    """,
+]
+
+
+def _dialect():
+    return db.engine.dialect.name
+
+
+def _terms(query):
+    """Split a user query into plain word tokens, dropping any search operators."""
+    return re.findall(r'\w+', query or '', re.UNICODE)[:MAX_TERMS]
+
+
+def init_book_search(rebuild=False):
+    """
+    Create the full-text index for the current database and make sure it is in sync.
+
+    The SQLite index is rebuilt from the books table when it is missing rows (for example
+    after `db.drop_all()`, which drops the triggers but not the virtual table) or when
+    `rebuild` is set.
+    """
+    dialect = _dialect()
+    if dialect == 'sqlite':
+        with db.engine.begin() as conn:
+            for ddl in _SQLITE_DDL:
+                conn.execute(text(ddl))
+            indexed = conn.execute(text(f"SELECT count(*) FROM {FTS_TABLE}_docsize")).scalar()
+            total = conn.execute(text("SELECT count(*) FROM books")).scalar()
+            if rebuild or indexed != total:
+                conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+    elif dialect == 'mysql':
+        indexes = [index['name'] for index in inspect(db.engine).get_indexes('books')]
+        with db.engine.begin() as conn:
+            if rebuild and FULLTEXT_INDEX in indexes:
+                conn.execute(text(f"ALTER TABLE books DROP INDEX {FULLTEXT_INDEX}"))
+                indexes.remove(FULLTEXT_INDEX)
+            if FULLTEXT_INDEX not in indexes:
+                conn.execute(text(f"ALTER TABLE books ADD FULLTEXT INDEX {FULLTEXT_INDEX} ({', '.join(SEARCH_COLUMNS)})"))
+
+
+def _search_sqlite(terms, limit, offset):
+    # every word must match, and each word also matches as a prefix ("harr" finds "Harry")
+    match = ' '.join('"' + term.replace('"', '') + '"*' for term in terms)
+    weights = ', '.join(str(weight) for weight in BM25_WEIGHTS)
+    total = db.session.execute(
+        text(f"SELECT count(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match"),
+        {'match': match}
+    ).scalar()
+    rows = db.session.execute(
+        text(f"""
+            SELECT rowid AS id, bm25({FTS_TABLE}, {weights}) AS score
+            FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match
+            ORDER BY score LIMIT :limit OFFSET :offset
+        """),
+        {'match': match, 'limit': limit, 'offset': offset}
+    ).all()
+    # bm25 is "lower is better", flip the sign so a higher score is a better match
+    return total, [(row.id, -row.score) for row in rows]
+
+
+def _search_mysql(terms, limit, offset):
+    against = ' '.join(f'+{term}*' for term in terms)
+    match = f"MATCH ({', '.join(SEARCH_COLUMNS)}) AGAINST (:against IN BOOLEAN MODE)"
+    total = db.session.execute(
+        text(f"SELECT count(*) FROM books WHERE {match}"),
+        {'against': against}
+    ).scalar()
+    rows = db.session.execute(
+        text(f"SELECT id, {match} AS score FROM books WHERE {match} ORDER BY score DESC LIMIT :limit OFFSET :offset"),
+        {'against': against, 'limit': limit, 'offset': offset}
+    ).all()
+    return total, [(row.id, row.score) for row in rows]
+
+
+def _search_like(terms, limit, offset):
+    query = Book.query
+    for term in terms:
+        pattern = f'%{term}%'
+        query = query.filter(or_(Book.title.ilike(pattern), Book.author.ilike(pattern), Book.genre.ilike(pattern)))
+    total = query.count()
+    books = query.order_by(Book.title, Book.id).limit(limit).offset(offset).all()
+    return total, [(book.id, None) for book in books]
+
+
+def search_books(query, page=1, limit=20):
+    """
+    Search the catalog by title, author, genre and description.
+
+    Args:
+        query (str): Free text typed by the user, each word is matched as a prefix.
+        page (int): 1-based page number.
+        limit (int): Number of results per page.
+
+    Returns:
+        tuple: (total number of matches, list of (book dictionary, score) for the requested page, best match first)
+    """
+    terms = _terms(query)
+    if not terms:
+        return 0, []
+
+    offset = (page - 1) * limit
+    dialect = _dialect()
+    if dialect == 'sqlite':
+        total, hits = _search_sqlite(terms, limit, offset)
+    elif dialect == 'mysql':
+        total, hits = _search_mysql(terms, limit, offset)
+    else:
+        total, hits = _search_like(terms, limit, offset)
+
+    # load the page of books from the catalog cache (one IN query for the misses) and keep rank order
+    books = get_books([book_id for book_id, _ in hits]) if hits else {}
+    return total, [(books[book_id], score) for book_id, score in hits if book_id in books]
+
+
+# create the search index alongside the tables
+with app.app_context():
+    init_book_search()
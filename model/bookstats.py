@@ -0,0 +1,227 @@
+## model, backend
+from sqlalchemy import delete, func, insert, select
+from __init__ import app, db
+from model.bookevents import on
+from model.dbutil import increment
+from model.librarydb import Book
+from model.commentsdb import Comments
+from model.emotion import Emotion
+from model.wishlist import Wishlist
+from model.tableversion import TableVersion
+
+# Per-book statistics
+# Comment, reaction and wishlist counts and each book's reaction histogram are kept in two small
+# tables, updated through the book events in the same transaction as the comment, reaction or
+# wishlist write, so a book's statistics are one primary key lookup instead of a count over the
+# event tables. Reactions name a book by title (Emotion.title_id), they count for every book with
+# that title. repair_book_stats() rebuilds both tables from the event tables.
+
+
+class BookStats(db.Model):
+    """
+    BookStats Model
+
+    Attributes:
+        book_id (db.Column): The Book.id.
+        comment_count (db.Column): Comments on the book.
+        reaction_count (db.Column): Emotion reactions to the book.
+        wishlist_count (db.Column): Wishlists the book is on.
+    """
+    __tablename__ = 'book_stats'
+
+    book_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    comment_count = db.Column(db.Integer, nullable=False, default=0)
+    reaction_count = db.Column(db.Integer, nullable=False, default=0)
+    wishlist_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<BookStats(book_id={self.book_id}, comments={self.comment_count}, reactions={self.reaction_count})>"
+
+
+class BookReactionStats(db.Model):
+    """
+    BookReactionStats Model
+
+    One bar of a book's reaction histogram.
+
+    Attributes:
+        book_id (db.Column): The Book.id.
+        reaction_type (db.Column): The reaction, e.g. '❤️'.
+        count (db.Column): Reactions of that type to the book.
+    """
+    __tablename__ = 'book_reaction_stats'
+
+    book_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    reaction_type = db.Column(db.String(32), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<BookReactionStats(book_id={self.book_id}, reaction_type={self.reaction_type}, count={self.count})>"
+
+
+def get_book_stats(book_ids):
+    """
+    Read the statistics of several books with two IN queries.
+
+    Args:
+        book_ids (list): Book ids, books without any activity get zero counts.
+
+    Returns:
+        dict: book id -> {'book_id', 'comments', 'reactions', 'wishlist', 'reaction_histogram'}
+    """
+    stats = {book_id: {'book_id': book_id, 'comments': 0, 'reactions': 0, 'wishlist': 0, 'reaction_histogram': {}}
+             for book_id in book_ids}
+    if not stats:
+        return stats
+    for row in BookStats.query.filter(BookStats.book_id.in_(list(stats))):
+        stats[row.book_id].update(comments=row.comment_count, reactions=row.reaction_count, wishlist=row.wishlist_count)
+    for row in BookReactionStats.query.filter(BookReactionStats.book_id.in_(list(stats)), BookReactionStats.count > 0):
+        stats[row.book_id]['reaction_histogram'][row.reaction_type] = row.count
+    return stats
+
+
+def repair_book_stats(book_ids=None):
+    """
+    Recompute the statistics of some or all books from the comments, emotion and wishlist tables.
+
+    Runs inside the caller's transaction, the caller commits.
+
+    Args:
+        book_ids (iterable, optional): The books to recompute, every book when omitted.
+
+    Returns:
+        int: The number of books with statistics afterwards.
+    """
+    def scoped(statement, column):
+        return statement if book_ids is None else statement.where(column.in_(book_ids))
+
+    if book_ids is not None:
+        book_ids = list(set(book_ids))
+        if not book_ids:
+            return 0
+    db.session.execute(scoped(delete(BookStats), BookStats.book_id))
+    db.session.execute(scoped(delete(BookReactionStats), BookReactionStats.book_id))
+
+    # reactions join on the indexed books.title, a book counts each reaction once
+    reactions = db.session.execute(scoped(
+        select(Book.id, Emotion.reaction_type, func.count(Emotion.id.distinct()))
+        .join(Book, Emotion.title_id == Book.title).group_by(Book.id, Emotion.reaction_type), Book.id)).all()
+    comments = db.session.execute(scoped(
+        select(Comments.book_id, func.count(Comments.id)).group_by(Comments.book_id), Comments.book_id)).all()
+    wishlist = db.session.execute(scoped(
+        select(Wishlist.book_id, func.count(Wishlist.id)).group_by(Wishlist.book_id), Wishlist.book_id)).all()
+
+    rows = {}
+    def row(book_id):
+        return rows.setdefault(book_id, {'book_id': book_id, 'comment_count': 0, 'reaction_count': 0, 'wishlist_count': 0})
+    for book_id, count in comments:
+        row(book_id)['comment_count'] = count
+    for book_id, count in wishlist:
+        row(book_id)['wishlist_count'] = count
+    for book_id, _, count in reactions:
+        row(book_id)['reaction_count'] += count
+
+    if rows:
+        db.session.execute(insert(BookStats), list(rows.values()))
+    if reactions:
+        db.session.execute(insert(BookReactionStats), [{'book_id': book_id, 'reaction_type': reaction_type, 'count': count}
+                                                       for book_id, reaction_type, count in reactions])
+    TableVersion.bump('book_stats')
+    return len(rows)
+
+
+def check_book_stats():
+    """
+    Build the statistics when the tables are empty but there is activity to count, e.g. on the first
+    start after this module was added or after seed data was inserted without events.
+
+    Returns:
+        bool: True if the statistics were built.
+    """
+    if db.session.query(BookStats.book_id).first() is not None:
+        return False
+    if not any(db.session.query(model.id).first() for model in (Comments, Emotion, Wishlist)):
+        return False
+    try:
+        repair_book_stats()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        raise e
+    return True
+
+
+def _count(book_ids, column, amount):
+    for book_id in {book_id for book_id in book_ids if book_id}:
+        increment(BookStats, {'book_id': book_id}, **{column: amount})
+    TableVersion.bump('book_stats')
+
+
+def _count_reaction(emotion, reaction_type, amount):
+    book_ids = [row[0] for row in db.session.query(Book.id).filter(Book.title == emotion.title_id)]
+    for book_id in book_ids:
+        increment(BookReactionStats, {'book_id': book_id, 'reaction_type': reaction_type}, count=amount)
+    return book_ids
+
+
+@on('comments.imported')
+@on('comments.deduplicated')
+def _comments_imported(book_ids):
+    repair_book_stats(book_ids)
+
+
+@on('comment.created')
+def _comment_created(comment):
+    _count([comment.book_id], 'comment_count', 1)
+
+
+@on('comment.deleted')
+def _comment_deleted(comment):
+    _count([comment.book_id], 'comment_count', -1)
+
+
+@on('reaction.created')
+def _reaction_created(emotion):
+    _count(_count_reaction(emotion, emotion.reaction_type, 1), 'reaction_count', 1)
+
+
+@on('reaction.deleted')
+def _reaction_deleted(emotion):
+    _count(_count_reaction(emotion, emotion.reaction_type, -1), 'reaction_count', -1)
+
+
+@on('reaction.changed')
+def _reaction_changed(emotion, previous_type):
+    _count_reaction(emotion, previous_type, -1)
+    _count_reaction(emotion, emotion.reaction_type, 1)
+    TableVersion.bump('book_stats')
+
+
+@on('wishlist.added')
+def _wishlist_added(item):
+    _count([item.book_id], 'wishlist_count', 1)
+
+
+@on('wishlist.removed')
+def _wishlist_removed(item):
+    _count([item.book_id], 'wishlist_count', -1)
+
+
+@on('book.updated')
+def _book_updated(book, previous):
+    # a new title changes which reactions count for the book
+    if book.title != previous.get('title'):
+        repair_book_stats([book.id])
+
+
+@on('book.deleted')
+def _book_deleted(book):
+    db.session.execute(delete(BookStats).where(BookStats.book_id == book.id))
+    db.session.execute(delete(BookReactionStats).where(BookReactionStats.book_id == book.id))
+    TableVersion.bump('book_stats')
+
+
+# create the tables, then count activity recorded before they existed
+with app.app_context():
+    db.create_all()
+    check_book_stats()
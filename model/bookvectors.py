@@ -0,0 +1,259 @@
+## model, backend
+import json
+import os
+import pickle
+import threading
+import time
+import numpy as np
+from __init__ import app, db
+from model.annindex import DEFAULT_NPROBE, IVFIndex, build_ivf
+
+# Content vectors for "more like this" recommendations
+# Every book is embedded from its title, genre and description: TF-IDF over the words, reduced
+# with truncated SVD to DIMENSIONS floats and normalized, so the dot product of two vectors is
+# their cosine similarity. The matrix is built offline (flask custom build_vectors) and stored as
+# float32 .npy files that every gunicorn worker memory-maps, the operating system keeps one shared
+# copy in its page cache. Books added after the build are embedded with the saved pipeline and
+# appended to a small delta file, which every worker re-reads when it grows.
+# For large catalogs an IVF index (model/annindex.py) built from the same matrix replaces the
+# brute-force scan, it is used only while it matches the current build.
+
+DIMENSIONS = 64  # floats per book, 500k books take 128 MB
+
+VECTORS_FILE = 'book_vectors.npy'    # float32 (books x dimensions), rows sorted by book id
+IDS_FILE = 'book_ids.npy'            # int64 book ids, one per row of VECTORS_FILE
+PIPELINE_FILE = 'book_pipeline.pkl'  # the fitted TF-IDF + SVD pipeline, to embed new books
+MANIFEST_FILE = 'manifest.json'      # written last by a build, workers reload when it changes
+DELTA_FILE = 'book_vectors.delta'    # appended records of books embedded since the build
+ANN_FOLDER = 'ann'                   # the IVF index of the current build
+
+
+def vectors_path(name):
+    return os.path.join(app.config['VECTORS_FOLDER'], name)
+
+
+def book_text(title, genre, description):
+    """The text a book is embedded from, the genre is repeated so it weighs as much as a few description words."""
+    return ' '.join(part for part in [title, genre, genre, description] if part)
+
+
+def _delta_dtype(dimensions):
+    return np.dtype([('id', '<i8'), ('vector', '<f4', (dimensions,))])
+
+
+def build_book_vectors(dimensions=DIMENSIONS):
+    """
+    Embed the whole catalog and replace the files every worker maps.
+
+    New files are written under temporary names and renamed into place, and the delta file is
+    removed, since the new matrix already contains those books.
+
+    Args:
+        dimensions (int): Floats per book vector, capped by the size of the catalog.
+
+    Returns:
+        int: The number of books embedded.
+    """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.decomposition import TruncatedSVD
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import Normalizer
+    from model.librarydb import Book
+
+    rows = db.session.query(Book.id, Book.title, Book.genre, Book.description).order_by(Book.id).all()
+    if len(rows) < 2:
+        return 0
+    ids = np.array([row.id for row in rows], dtype=np.int64)
+    texts = [book_text(row.title, row.genre, row.description) for row in rows]
+
+    tfidf = TfidfVectorizer(stop_words='english', sublinear_tf=True, max_features=100000, dtype=np.float32)
+    matrix = tfidf.fit_transform(texts)
+    components = max(1, min(dimensions, matrix.shape[1] - 1, len(rows) - 1))
+    pipeline = make_pipeline(tfidf, TruncatedSVD(n_components=components, random_state=0), Normalizer(copy=False))
+    # refit end to end so the saved pipeline embeds new books exactly like the catalog
+    vectors = pipeline.fit_transform(texts).astype(np.float32)
+
+    folder = app.config['VECTORS_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    with open(vectors_path(VECTORS_FILE + '.tmp'), 'wb') as f:
+        np.save(f, vectors)
+    with open(vectors_path(IDS_FILE + '.tmp'), 'wb') as f:
+        np.save(f, ids)
+    with open(vectors_path(PIPELINE_FILE + '.tmp'), 'wb') as f:
+        pickle.dump(pipeline, f)
+    with open(vectors_path(MANIFEST_FILE + '.tmp'), 'w') as f:
+        json.dump({'books': len(ids), 'dimensions': components, 'built_at': time.time()}, f)
+    for name in (VECTORS_FILE, IDS_FILE, PIPELINE_FILE, MANIFEST_FILE):
+        os.replace(vectors_path(name + '.tmp'), vectors_path(name))
+    if os.path.exists(vectors_path(DELTA_FILE)):
+        os.remove(vectors_path(DELTA_FILE))
+    book_vectors.reload()
+    return len(ids)
+
+
+def build_book_index(lists=None):
+    """
+    Build the IVF index over the current book vectors, see model/annindex.py.
+
+    Args:
+        lists (int, optional): Number of partitions, about sqrt(number of books) by default.
+
+    Returns:
+        dict: The index manifest, None if the vectors have not been built.
+    """
+    if not book_vectors.ready:
+        return None
+    return build_ivf(book_vectors.vectors, vectors_path(ANN_FOLDER), lists=lists, source=book_vectors.built_at)
+
+
+class BookVectors:
+    """
+    A worker's read-only view of the book vectors.
+
+    The matrix is memory-mapped, so opening it costs nothing and all workers share one copy.
+    Before each lookup the manifest and delta file are checked with os.stat, a rebuild or books
+    appended by another worker are picked up on the next request.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._manifest_stamp = None
+        self._delta_size = None
+        self.ids = None
+        self.vectors = None
+        self.pipeline = None
+        self.delta = {}
+        self.built_at = None
+        self.index = IVFIndex(vectors_path(ANN_FOLDER))
+
+    def _stamp(self, name):
+        try:
+            stat = os.stat(vectors_path(name))
+            return stat.st_mtime_ns, stat.st_size
+        except FileNotFoundError:
+            return None
+
+    def reload(self):
+        with self._lock:
+            self._manifest_stamp = None
+            self._delta_size = None
+        self._refresh()
+
+    def _refresh(self):
+        manifest_stamp = self._stamp(MANIFEST_FILE)
+        delta_stamp = self._stamp(DELTA_FILE)
+        delta_size = delta_stamp[1] if delta_stamp else 0
+        if manifest_stamp == self._manifest_stamp and delta_size == self._delta_size:
+            return
+        with self._lock:
+            if manifest_stamp != self._manifest_stamp:
+                if manifest_stamp is None:
+                    self.ids = self.vectors = self.pipeline = None
+                else:
+                    self.ids = np.load(vectors_path(IDS_FILE), mmap_mode='r')
+                    self.vectors = np.load(vectors_path(VECTORS_FILE), mmap_mode='r')
+                    self.pipeline = None  # unpickled on first use, only writers need it
+                    with open(vectors_path(MANIFEST_FILE)) as f:
+                        self.built_at = json.load(f)['built_at']
+                self._manifest_stamp = manifest_stamp
+                self._delta_size = None
+            if delta_size != self._delta_size:
+                self.delta = {}
+                if delta_size and self.vectors is not None:
+                    dtype = _delta_dtype(self.vectors.shape[1])
+                    records = np.fromfile(vectors_path(DELTA_FILE), dtype=dtype, count=delta_size // dtype.itemsize)
+                    for record in records:  # later records replace earlier ones for the same book
+                        self.delta[int(record['id'])] = record['vector']
+                self._delta_size = delta_size
+
+    @property
+    def ready(self):
+        self._refresh()
+        return self.vectors is not None
+
+    def vector(self, book_id):
+        """The vector of a book, None if it has not been embedded."""
+        self._refresh()
+        if book_id in self.delta:
+            return self.delta[book_id]
+        if self.ids is None:
+            return None
+        row = int(np.searchsorted(self.ids, book_id))
+        if row < len(self.ids) and self.ids[row] == book_id:
+            return self.vectors[row]
+        return None
+
+    def embed(self, title, genre, description):
+        """Embed a book's text with the pipeline of the current build."""
+        self._refresh()
+        if self.vectors is None:
+            return None
+        if self.pipeline is None:
+            with open(vectors_path(PIPELINE_FILE), 'rb') as f:
+                self.pipeline = pickle.load(f)
+        return self.pipeline.transform([book_text(title, genre, description)])[0].astype(np.float32)
+
+    def similar(self, book_id, k=10, nprobe=DEFAULT_NPROBE):
+        """
+        The books most similar to a book, by cosine similarity of their vectors.
+
+        Args:
+            book_id (int): The book to compare against.
+            k (int): Number of results.
+            nprobe (int): IVF partitions scanned when an index is available, higher is slower and
+                more accurate. None forces an exact scan.
+
+        Returns:
+            list: (book id, score) pairs, best first, the book itself excluded. None if the book has
+                no vector.
+        """
+        query = self.vector(book_id)
+        if query is None:
+            return None
+        exclude = set(self.delta) | {book_id}
+
+        candidates = []
+        if nprobe and self.index.current(source=self.built_at):
+            rows, scores = self.index.search(query, k + len(exclude), nprobe)
+            candidates = [(int(self.ids[row]), float(score)) for row, score in zip(rows, scores)
+                          if int(self.ids[row]) not in exclude]
+        elif len(self.ids):
+            scores = np.asarray(self.vectors @ query)
+            # books re-embedded in the delta are scored from their newer vector below
+            for excluded_id in exclude:
+                row = int(np.searchsorted(self.ids, excluded_id))
+                if row < len(self.ids) and self.ids[row] == excluded_id:
+                    scores[row] = -np.inf
+            top = min(k, len(scores))
+            rows = np.argpartition(-scores, top - 1)[:top] if top else []
+            candidates = [(int(self.ids[row]), float(scores[row])) for row in rows if np.isfinite(scores[row])]
+        for delta_id, vector in self.delta.items():
+            if delta_id != book_id:
+                candidates.append((delta_id, float(vector @ query)))
+        candidates.sort(key=lambda candidate: candidate[1], reverse=True)
+        return candidates[:k]
+
+
+# One view per worker process
+book_vectors = BookVectors()
+
+
+def append_book_vector(book):
+    """
+    Embed a new or changed book and append it to the delta file, so every worker can recommend it
+    before the next full build. Does nothing until the vectors have been built once.
+
+    Args:
+        book (Book): A committed book.
+    """
+    vector = book_vectors.embed(book.title, book.genre, book.description)
+    if vector is None:
+        return
+    record = np.zeros(1, dtype=_delta_dtype(len(vector)))
+    record['id'] = book.id
+    record['vector'] = vector
+    # a single append of one whole record, so concurrent workers never interleave
+    fd = os.open(vectors_path(DELTA_FILE), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, record.tobytes())
+    finally:
+        os.close(fd)
@@ -0,0 +1,148 @@
+## model, backend
+import base64
+import json
+from sqlalchemy import or_, and_
+from __init__ import db
+from model.librarydb import Book
+from model.tableversion import VersionedLRU
+
+# Catalog listing shared by every endpoint that lists books
+# Pages are read with keyset (cursor) pagination: each page starts right after the sort key of
+# the last row of the previous page, so page 1000 costs the same index seek as page 1.
+
+BOOK_FIELDS = ('id', 'title', 'author', 'author_id', 'genre', 'genre_id', 'description', 'cover_url')
+SORT_KEYS = ('id', 'title')
+BATCH_SIZE = 500  # rows read per query when streaming the whole catalog
+
+# Catalog reads are served from memory until the books table version changes, Book.create, update,
+# delete and restore (and accepting a suggestion) bump it, so every worker refreshes after any write.
+catalog_cache = VersionedLRU('catalog', ['books'], maxsize=2048)
+
+
+def parse_fields(value, default=BOOK_FIELDS):
+    """
+    Parse a sparse fieldset such as 'id,title,author'.
+
+    Raises:
+        ValueError: A field is not a book field.
+    """
+    if not value:
+        return list(default)
+    fields = list(dict.fromkeys(field.strip() for field in value.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in BOOK_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. Allowed fields: {', '.join(BOOK_FIELDS)}")
+    return fields
+
+
+def encode_cursor(sort_value, book_id):
+    """Opaque cursor pointing just after a row."""
+    raw = json.dumps([sort_value, book_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor made by encode_cursor.
+
+    Raises:
+        ValueError: The cursor is malformed.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, book_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return sort_value, int(book_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def _page_query(sort, after, fields, genre_id, limit):
+    if sort not in SORT_KEYS:
+        raise ValueError(f"sort must be one of: {', '.join(SORT_KEYS)}")
+    # the sort key and id are always read, the cursor is built from them
+    names = list(dict.fromkeys(['id', sort] + list(fields)))
+    query = db.session.query(*[getattr(Book, name) for name in names])
+    if genre_id is not None:
+        query = query.filter(Book.genre_id == genre_id)
+    if after is not None:
+        sort_value, book_id = after
+        if sort == 'id':
+            query = query.filter(Book.id > book_id)
+        else:
+            query = query.filter(or_(Book.title > sort_value, and_(Book.title == sort_value, Book.id > book_id)))
+    order = [Book.id] if sort == 'id' else [Book.title, Book.id]
+    return [row._asdict() for row in query.order_by(*order).limit(limit).all()]
+
+
+def _cached_page(sort, after, fields, genre_id, limit):
+    key = ('page', sort, tuple(after) if after else None, tuple(fields), genre_id, limit)
+    return catalog_cache.get(key, lambda: _page_query(sort, after, fields, genre_id, limit))
+
+
+def book_page(sort='id', cursor=None, limit=100, fields=BOOK_FIELDS, genre_id=None):
+    """
+    Read one page of the catalog.
+
+    Args:
+        sort (str): 'id' or 'title'.
+        cursor (str, optional): The next_cursor of the previous page.
+        limit (int): Page size.
+        fields (list): Book fields to return.
+        genre_id (int, optional): Only list books of this genre.
+
+    Returns:
+        tuple: (list of book dictionaries with only the requested fields, cursor of the next page or None)
+    """
+    after = decode_cursor(cursor) if cursor else None
+    rows = _cached_page(sort, after, fields, genre_id, limit + 1)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last[sort], last['id'])
+    return [{field: row[field] for field in fields} for row in rows], next_cursor
+
+
+def iter_books(sort='id', cursor=None, fields=BOOK_FIELDS, genre_id=None):
+    """
+    Yield every book from the cursor onwards, reading BATCH_SIZE rows at a time so memory stays flat.
+    The batches are not cached, an export would otherwise keep the whole catalog in catalog_cache.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    while True:
+        rows = _page_query(sort, after, fields, genre_id, BATCH_SIZE)
+        for row in rows:
+            yield {field: row[field] for field in fields}
+        if len(rows) < BATCH_SIZE:
+            return
+        last = rows[-1]
+        after = (last[sort], last['id'])
+
+
+def get_book(book_id):
+    """
+    Read one book as a dictionary (see Book.read).
+
+    Returns:
+        dict: A copy of the cached book, None if it does not exist.
+    """
+    books = get_books([book_id])
+    return books.get(book_id)
+
+
+def get_books(book_ids):
+    """
+    Read several books as dictionaries, loading the ones not in the cache with a single IN query.
+
+    Args:
+        book_ids (list): Book ids, in any order.
+
+    Returns:
+        dict: book id -> copy of the book dictionary, ids that do not exist are left out.
+    """
+    def load(missing_keys):
+        ids = [book_id for _, book_id in missing_keys]
+        return {('book', book.id): book.read() for book in Book.query.filter(Book.id.in_(ids)).all()}
+
+    found = catalog_cache.get_many([('book', book_id) for book_id in book_ids], load)
+    return {book_id: dict(book) for (_, book_id), book in found.items()}
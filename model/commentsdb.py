@@ -1,18 +1,32 @@
+from datetime import datetime, timezone
 from flask_restful import Api, Resource
-from sqlalchemy import Integer, String, Text
+from sqlalchemy import Integer, String, Text, and_, delete, func, or_, update
 from __init__ import app, db
 from sqlalchemy import Column
-from sqlite3 import IntegrityError
+import hashlib
+from sqlalchemy.exc import IntegrityError
 from model.librarydb import Book
 from model.user import User
+from model.tableversion import TableVersion
+from model.bookevents import emit
+from model.catalog import decode_cursor, encode_cursor
+from model.dbutil import add_column_if_missing, create_index_if_missing, create_indexes, has_index, insert_ignore
 from api.jwt_authorize import token_required
 
+RESTORE_BATCH_SIZE = 500  # comments per multi-row INSERT
+
 class Comments(db.Model):
     __tablename__ = 'comments'
     id = db.Column(Integer, primary_key=True)
     book_id = db.Column(Integer, db.ForeignKey('books.id'), nullable=False)  # Reference to Book.id
     user_id = db.Column(Integer, db.ForeignKey('users.id'), nullable=False)  # Reference to User.id
     comment_text = db.Column(Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=lambda: utcnow())  # UTC, naive
+    # sha256 of (book_id, user_id, comment_text), the same comment can only be stored once
+    content_hash = db.Column(String(64), unique=True, index=True, default=lambda context: _default_hash(context))
+
+    # a book's comments newest first, and the ones after a point in time, are one index range
+    __table_args__ = (db.Index('ix_comments_book_created', 'book_id', 'created_at', 'id'),)
 
     # Establish relationships
     book = db.relationship('Book', backref='comments')  # Relationship with Book
@@ -20,31 +34,34 @@ class Comments(db.Model):
 
     # CRUD methods
     def create(self):
-        # Check if the comment already exists for this user and book
-        existing_comment = Comments.query.filter_by(
-            book_id=self.book_id,
-            user_id=self.user_id,
-            comment_text=self.comment_text
-        ).first()
-
-        if existing_comment:
-            # If the comment already exists, return a message indicating no change
-            return {"message": "Comment already exists for this book and user."}, 400
-
+        # the unique content_hash rejects a duplicate comment, no lookup before the insert
+        self.rehash()
         try:
             db.session.add(self)
+            db.session.flush()
+            emit('comment.created', comment=self)
+            TableVersion.bump('comments')
             db.session.commit()
             return {"message": "Comment added successfully."}, 201
+        except IntegrityError:
+            # If the comment already exists, return a message indicating no change
+            db.session.rollback()
+            return {"message": "Comment already exists for this book and user."}, 400
         except Exception as e:
             db.session.rollback()
             raise e
 
+    def rehash(self):
+        """Recompute content_hash after book_id, user_id or comment_text changed."""
+        self.content_hash = comment_hash(self.book_id, self.user_id, self.comment_text)
+
     def read(self):
         return {
             'id': self.id,
             'book_id': self.book_id,
             'user_id': self.user_id,
-            'comment_text': self.comment_text
+            'comment_text': self.comment_text,
+            'created_at': format_time(self.created_at)
         }
 
     def update(self, inputs):
@@ -55,14 +72,19 @@ class Comments(db.Model):
         user_id = inputs.get("user_id", None)
         comment_text = inputs.get("comment_text", "")
 
-        if book_id:
+        if book_id and book_id != self.book_id:
+            # moving a comment to another book counts as deleting and recreating it
+            emit('comment.deleted', comment=self)
             self.book_id = book_id
+            emit('comment.created', comment=self)
         if user_id:
             self.user_id = user_id
         if comment_text:
             self.comment_text = comment_text
+        self.rehash()
 
         try:
+            TableVersion.bump('comments')
             db.session.commit()
         except IntegrityError as e:
             db.session.rollback()
@@ -74,63 +96,254 @@ class Comments(db.Model):
     def delete(self):
         try:
             db.session.delete(self)
+            emit('comment.deleted', comment=self)
+            TableVersion.bump('comments')
             db.session.commit()
         except Exception as e:
             db.session.rollback()
             raise e
 
     @staticmethod
-    def restore(data):
+    def restore(data, batch_size=None):
+        """
+        Restore comments from a backup in batches of multi-row inserts. Comments that already exist,
+        by content_hash, are skipped by the database rather than looked up one by one.
+
+        Args:
+            data (list): Comment dictionaries, ids are not kept.
+            batch_size (int, optional): Comments per INSERT, RESTORE_BATCH_SIZE by default.
+
+        Returns:
+            dict: comment id -> {'status': 'created' or 'existing', 'comment': comment dictionary}
+        """
+        batch_size = batch_size or RESTORE_BATCH_SIZE
         restored_comments = {}
+        for start in range(0, len(data), batch_size):
+            batch = {}  # content hash -> row, a comment repeated in the batch is inserted once
+            for comment_data in data[start:start + batch_size]:
+                if not comment_data.get('book_id') or not comment_data.get('user_id') or not comment_data.get('comment_text'):
+                    continue
+                created_at = comment_data.get('created_at')
+                if isinstance(created_at, str):
+                    created_at = parse_time(created_at)
+                row = {
+                    'book_id': comment_data['book_id'],
+                    'user_id': comment_data['user_id'],
+                    'comment_text': comment_data['comment_text'],
+                    'created_at': created_at or utcnow(),
+                    'content_hash': comment_hash(comment_data['book_id'], comment_data['user_id'], comment_data['comment_text'])
+                }
+                batch[row['content_hash']] = row
+            if not batch:
+                continue
 
-        for comment_data in data:  # Iterate through each comment in the input data
-            # Remove 'id' if it's present in the input data, as it's auto-generated by the database
-            comment_data.pop('id', None)
-
-            # Check if the comment already exists based on book_id and user_id
-            existing_comment = Comments.query.filter_by(
-                book_id=comment_data.get('book_id'),
-                user_id=comment_data.get('user_id'),
-                comment_text=comment_data.get('comment_text')
-            ).first()
-
-            if existing_comment:
-                # Update the existing comment with new data
-                for key, value in comment_data.items():
-                    setattr(existing_comment, key, value)
-
-                try:
-                    db.session.commit()
-                    restored_comments[existing_comment.id] = {
-                        'status': 'updated',
-                        'comment': existing_comment.read()
-                    }
-                except Exception as e:
-                    db.session.rollback()
-                    restored_comments[existing_comment.id] = {
-                        'status': 'error',
-                        'message': str(e)
-                    }
-            else:
-                # Create a new comment
-                new_comment = Comments(**comment_data)
-                db.session.add(new_comment)
-                try:
-                    db.session.commit()
-                    restored_comments[new_comment.id] = {
-                        'status': 'created',
-                        'comment': new_comment.read()
-                    }
-                except Exception as e:
-                    db.session.rollback()
-                    restored_comments[new_comment.id] = {
-                        'status': 'error',
-                        'message': str(e)
-                    }  
+            hashes = list(batch)
+            # only to report which comments were new, the insert itself skips duplicates
+            existing = {row[0] for row in db.session.query(Comments.content_hash).filter(Comments.content_hash.in_(hashes))}
+            try:
+                insert_ignore(Comments, list(batch.values()), 'content_hash')
+                created = [batch[content_hash] for content_hash in hashes if content_hash not in existing]
+                if created:
+                    emit('comments.imported', book_ids={row['book_id'] for row in created})
+                TableVersion.bump('comments')
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                raise e
+            for comment in Comments.query.filter(Comments.content_hash.in_(hashes)):
+                restored_comments[comment.id] = {
+                    'status': 'existing' if comment.content_hash in existing else 'created',
+                    'comment': comment.read()
+                }
 
         return restored_comments
 
 
+def comment_hash(book_id, user_id, comment_text):
+    """The content_hash of a comment, equal for the same text by the same user on the same book."""
+    return hashlib.sha256(f'{book_id}\x00{user_id}\x00{comment_text}'.encode()).hexdigest()
+
+
+def _default_hash(context):
+    # column default for inserts that did not set content_hash, e.g. Comments(...) added directly
+    params = context.get_current_parameters()
+    return comment_hash(params['book_id'], params['user_id'], params['comment_text'])
+
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def format_time(value):
+    """ISO 8601 UTC text of a stored timestamp, e.g. '2025-01-31T12:00:00.123456Z'."""
+    return value.isoformat() + 'Z' if value else None
+
+
+def parse_time(text):
+    """
+    Parse an ISO 8601 timestamp into a naive UTC datetime, as stored.
+
+    Raises:
+        ValueError: The text is not a timestamp.
+    """
+    if not isinstance(text, str):
+        raise ValueError('Invalid timestamp')
+    value = datetime.fromisoformat(text.strip().replace('Z', '+00:00'))
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def serialize_comments(comments, user_names):
+    """
+    Turn comments into the dictionaries the comment endpoints return.
+
+    Args:
+        comments (list): Comments rows.
+        user_names (dict): User.id -> name of the comments' authors, loaded beforehand so serializing
+            never queries. Missing users are shown as 'Unknown User'.
+
+    Returns:
+        list: Comment dictionaries, in the order given.
+    """
+    return [{
+        'id': comment.id,
+        'book_id': comment.book_id,
+        'user_id': comment.user_id,
+        'user_name': user_names.get(comment.user_id, 'Unknown User'),
+        'comment_text': comment.comment_text,
+        'created_at': format_time(comment.created_at)
+    } for comment in comments]
+
+
+def read_comments(book_id=None):
+    """
+    Read the comments of a book, or of every book, with their authors' names in one joined query.
+
+    Args:
+        book_id (int, optional): The book, all comments when omitted.
+
+    Returns:
+        list: Comment dictionaries (see serialize_comments), oldest first.
+    """
+    query = db.session.query(Comments, User._name).outerjoin(User, User.id == Comments.user_id)
+    if book_id:
+        query = query.filter(Comments.book_id == book_id)
+    rows = query.order_by(Comments.id).all()
+    return serialize_comments([comment for comment, _ in rows],
+                              {comment.user_id: name for comment, name in rows if name is not None})
+
+
+def comment_page(book_id, limit, cursor=None, since=None):
+    """
+    Read one page of a book's comments, newest first, with keyset pagination on (created_at, id).
+
+    Args:
+        book_id (int): The book.
+        limit (int): Comments per page.
+        cursor (str, optional): The next_cursor of the previous page.
+        since (datetime, optional): Only comments created after this time, for clients that already
+            have the older ones.
+
+    Returns:
+        tuple: (comment dictionaries, cursor of the next page or None on the last page)
+
+    Raises:
+        ValueError: The cursor is malformed.
+    """
+    query = db.session.query(Comments, User._name).outerjoin(User, User.id == Comments.user_id) \
+        .filter(Comments.book_id == book_id)
+    if since is not None:
+        query = query.filter(Comments.created_at > since)
+    if cursor:
+        created_at, comment_id = decode_cursor(cursor)
+        created_at = parse_time(created_at)
+        query = query.filter(or_(Comments.created_at < created_at,
+                                 and_(Comments.created_at == created_at, Comments.id < comment_id)))
+    # one extra row tells whether there is a next page
+    rows = query.order_by(Comments.created_at.desc(), Comments.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1][0]
+        next_cursor = encode_cursor(format_time(last.created_at), last.id)
+    comments = serialize_comments([comment for comment, _ in rows],
+                                  {comment.user_id: name for comment, name in rows if name is not None})
+    return comments, next_cursor
+
+
+def migrate_comment_times():
+    """
+    Add created_at and its index to databases created before comments were timestamped. Comments
+    without a time get the time of the migration, their ids keep them in order.
+    """
+    add_column_if_missing(Comments.__tablename__, Comments.__table__.c.created_at)
+    create_index_if_missing(next(index for index in Comments.__table__.indexes if index.name == 'ix_comments_book_created'))
+    result = db.session.execute(update(Comments).where(Comments.created_at.is_(None)).values(created_at=utcnow()))
+    if result.rowcount:
+        TableVersion.bump('comments')
+    db.session.commit()
+
+
+def migrate_comment_hashes(batch_size=RESTORE_BATCH_SIZE):
+    """
+    Add content_hash and its unique index to databases created before comments were deduplicated.
+
+    Hashes are filled in for comments without one, then the unique index is created, unless there are
+    duplicate comments: deleting them changes the book and author statistics, so it is left to
+    'flask custom dedupe_comments' (delete_duplicate_comments). Once the unique index exists there is
+    nothing left to do and the comments are not scanned again.
+
+    Returns:
+        int: The number of duplicate comments waiting to be deleted, 0 once the index exists.
+    """
+    if has_index(Comments.__tablename__, 'ix_comments_content_hash'):
+        return 0
+    add_column_if_missing(Comments.__tablename__, Comments.__table__.c.content_hash)
+    while True:
+        rows = db.session.query(Comments.id, Comments.book_id, Comments.user_id, Comments.comment_text) \
+            .filter(Comments.content_hash.is_(None)).limit(batch_size).all()
+        if not rows:
+            break
+        db.session.execute(update(Comments), [{'id': row.id, 'content_hash': comment_hash(row.book_id, row.user_id, row.comment_text)}
+                                              for row in rows])
+    db.session.commit()
+    duplicates = db.session.query(func.count(Comments.id) - func.count(Comments.content_hash.distinct())).scalar()
+    if duplicates:
+        print(f"Found {duplicates} duplicate comments, run 'flask custom dedupe_comments' to delete them.")
+        return duplicates
+    create_indexes(Comments)
+    return 0
+
+
+def delete_duplicate_comments():
+    """
+    Delete duplicate comments, keeping the oldest copy, and create the unique content_hash index.
+
+    The statistics of the books that lost comments, and of their authors, are recounted through the
+    comments.deduplicated event in the same transaction as the deletion.
+
+    Returns:
+        int: The number of duplicate comments deleted.
+    """
+    duplicates = db.session.query(Comments.content_hash, func.min(Comments.id)) \
+        .group_by(Comments.content_hash).having(func.count(Comments.id) > 1).all()
+    deleted, book_ids = 0, set()
+    try:
+        for content_hash, keep_id in duplicates:
+            book_ids.add(db.session.get(Comments, keep_id).book_id)
+            deleted += db.session.execute(delete(Comments).where(Comments.content_hash == content_hash, Comments.id != keep_id)).rowcount
+        if deleted:
+            emit('comments.deduplicated', book_ids=book_ids)
+            TableVersion.bump('comments')
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        raise e
+    create_indexes(Comments)
+    return deleted
+
+
 # Update initComments to prevent duplication
 def initComments():
     comments = [
@@ -151,24 +364,14 @@ def initComments():
         }
     ]
 
-    # Ensure we're inside a context to manipulate the DB session
-    for comment in comments:
-        # Check if the comment already exists before adding it to the session
-        existing_comment = Comments.query.filter_by(
-            book_id=comment["book_id"],
-            user_id=comment["user_id"],
-            comment_text=comment["comment_text"]
-        ).first()
-
-        if not existing_comment:
-            new_comment = Comments(
-                book_id=comment["book_id"],
-                comment_text=comment["comment_text"],
-                user_id=comment["user_id"]
-            )
-            db.session.add(new_comment)
+    # comments that already exist are skipped by the unique content_hash
+    now = utcnow()
+    rows = [dict(comment, created_at=now, content_hash=comment_hash(comment["book_id"], comment["user_id"], comment["comment_text"]))
+            for comment in comments]
 
     try:
+        insert_ignore(Comments, rows, 'content_hash')
+        TableVersion.bump('comments')
         db.session.commit()  # Commit the changes
     except IntegrityError:
         db.session.rollback()  # Rollback if there is an integrity error
@@ -181,4 +384,6 @@ def initComments():
 # Create the tables and initialize data
 with app.app_context():
     db.create_all()  # Create tables
+    migrate_comment_times()  # timestamp comments created before created_at existed
+    migrate_comment_hashes()  # hash comments created before content_hash existed
     initComments()  # Initialize the comments data
@@ -0,0 +1,186 @@
+## model, backend
+import html
+import re
+from sqlalchemy import text, inspect
+from __init__ import app, db
+from model.commentsdb import Comments, serialize_comments
+from model.user import User
+from model.booksearch import _dialect, _terms
+
+# Full-text index over the review comments, built like the book search index (model/booksearch.py)
+# - SQLite (dev): an FTS5 virtual table that uses `comments` as its external content, kept in sync by triggers
+# - MySQL (prod): a FULLTEXT index on the comments table itself
+# Anything else falls back to a LIKE scan.
+# The database finds and ranks the matches, highlights are added here so they look the same on
+# every database and the comment text is HTML-escaped around the <mark> tags.
+
+FTS_TABLE = 'comments_fts'
+FULLTEXT_INDEX = 'comments_fulltext'
+HIGHLIGHT_OPEN, HIGHLIGHT_CLOSE = '<mark>', '</mark>'
+
+_SQLITE_DDL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        comment_text,
+        content='comments', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON comments BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, comment_text) VALUES (new.id, new.comment_text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON comments BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, comment_text) VALUES ('delete', old.id, old.comment_text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF comment_text ON comments BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, comment_text) VALUES ('delete', old.id, old.comment_text);
+        INSERT INTO {FTS_TABLE}(rowid, comment_text) VALUES (new.id, new.comment_text);
+    END
+    """,
+]
+
+
+def init_comment_search(rebuild=False):
+    """
+    Create the full-text index over the comments and make sure it is in sync, see init_book_search.
+    """
+    dialect = _dialect()
+    if dialect == 'sqlite':
+        with db.engine.begin() as conn:
+            for ddl in _SQLITE_DDL:
+                conn.execute(text(ddl))
+            indexed = conn.execute(text(f"SELECT count(*) FROM {FTS_TABLE}_docsize")).scalar()
+            total = conn.execute(text("SELECT count(*) FROM comments")).scalar()
+            if rebuild or indexed != total:
+                conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+    elif dialect == 'mysql':
+        indexes = [index['name'] for index in inspect(db.engine).get_indexes('comments')]
+        with db.engine.begin() as conn:
+            if rebuild and FULLTEXT_INDEX in indexes:
+                conn.execute(text(f"ALTER TABLE comments DROP INDEX {FULLTEXT_INDEX}"))
+                indexes.remove(FULLTEXT_INDEX)
+            if FULLTEXT_INDEX not in indexes:
+                conn.execute(text(f"ALTER TABLE comments ADD FULLTEXT INDEX {FULLTEXT_INDEX} (comment_text)"))
+
+
+def _filters(book_id, user_id):
+    # extra conditions on the comments table, aliased c
+    conditions, params = [], {}
+    if book_id is not None:
+        conditions.append('c.book_id = :book_id')
+        params['book_id'] = book_id
+    if user_id is not None:
+        conditions.append('c.user_id = :user_id')
+        params['user_id'] = user_id
+    return ''.join(f' AND {condition}' for condition in conditions), params
+
+
+def _search_sqlite(terms, book_id, user_id, limit, offset):
+    match = ' '.join('"' + term.replace('"', '') + '"*' for term in terms)
+    where, params = _filters(book_id, user_id)
+    params.update(match=match, limit=limit, offset=offset)
+    source = f"FROM {FTS_TABLE} JOIN comments c ON c.id = {FTS_TABLE}.rowid WHERE {FTS_TABLE} MATCH :match{where}"
+    total = db.session.execute(text(f"SELECT count(*) {source}"), params).scalar()
+    rows = db.session.execute(
+        text(f"SELECT c.id AS id, bm25({FTS_TABLE}) AS score {source} ORDER BY score LIMIT :limit OFFSET :offset"),
+        params
+    ).all()
+    # bm25 is "lower is better", flip the sign so a higher score is a better match
+    return total, [(row.id, -row.score) for row in rows]
+
+
+def _search_mysql(terms, book_id, user_id, limit, offset):
+    match = "MATCH (c.comment_text) AGAINST (:against IN BOOLEAN MODE)"
+    where, params = _filters(book_id, user_id)
+    params.update(against=' '.join(f'+{term}*' for term in terms), limit=limit, offset=offset)
+    total = db.session.execute(text(f"SELECT count(*) FROM comments c WHERE {match}{where}"), params).scalar()
+    rows = db.session.execute(
+        text(f"SELECT c.id AS id, {match} AS score FROM comments c WHERE {match}{where} "
+             f"ORDER BY score DESC LIMIT :limit OFFSET :offset"),
+        params
+    ).all()
+    return total, [(row.id, row.score) for row in rows]
+
+
+def _search_like(terms, book_id, user_id, limit, offset):
+    query = Comments.query
+    for term in terms:
+        query = query.filter(Comments.comment_text.ilike(f'%{term}%'))
+    if book_id is not None:
+        query = query.filter(Comments.book_id == book_id)
+    if user_id is not None:
+        query = query.filter(Comments.user_id == user_id)
+    total = query.count()
+    comments = query.order_by(Comments.id.desc()).limit(limit).offset(offset).all()
+    return total, [(comment.id, None) for comment in comments]
+
+
+def highlight(comment_text, terms):
+    """
+    HTML-escape a comment and wrap the words matching a search term (as a prefix) in <mark> tags.
+    """
+    if not terms:
+        return html.escape(comment_text)
+    pattern = re.compile(r'\b(' + '|'.join(re.escape(term) for term in terms) + r')\w*', re.IGNORECASE | re.UNICODE)
+    parts, position = [], 0
+    for match in pattern.finditer(comment_text):
+        parts.append(html.escape(comment_text[position:match.start()]))
+        parts.append(HIGHLIGHT_OPEN + html.escape(match.group(0)) + HIGHLIGHT_CLOSE)
+        position = match.end()
+    parts.append(html.escape(comment_text[position:]))
+    return ''.join(parts)
+
+
+def search_comments(query, book_id=None, user_id=None, page=1, limit=20):
+    """
+    Search the review comments.
+
+    Args:
+        query (str): Free text typed by the user, each word must match, as a prefix.
+        book_id (int, optional): Only comments on this book.
+        user_id (int, optional): Only comments by this user.
+        page (int): 1-based page number.
+        limit (int): Number of results per page.
+
+    Returns:
+        tuple: (total number of matches, list of comment dictionaries for the requested page, best
+            match first, each with a 'highlight' and a 'score')
+    """
+    terms = _terms(query)
+    if not terms:
+        return 0, []
+
+    offset = (page - 1) * limit
+    dialect = _dialect()
+    if dialect == 'sqlite':
+        total, hits = _search_sqlite(terms, book_id, user_id, limit, offset)
+    elif dialect == 'mysql':
+        total, hits = _search_mysql(terms, book_id, user_id, limit, offset)
+    else:
+        total, hits = _search_like(terms, book_id, user_id, limit, offset)
+    if not hits:
+        return total, []
+
+    # load the page of comments with their authors' names in one joined query, keep rank order
+    rows = db.session.query(Comments, User._name).outerjoin(User, User.id == Comments.user_id) \
+        .filter(Comments.id.in_([comment_id for comment_id, _ in hits])).all()
+    comments = {comment['id']: comment for comment in serialize_comments(
+        [comment for comment, _ in rows], {comment.user_id: name for comment, name in rows if name is not None})}
+    results = []
+    for comment_id, score in hits:
+        if comment_id in comments:
+            comment = comments[comment_id]
+            comment['highlight'] = highlight(comment['comment_text'], terms)
+            comment['score'] = score
+            results.append(comment)
+    return total, results
+
+
+# create the search index alongside the tables
+with app.app_context():
+    init_comment_search()
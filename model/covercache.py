@@ -0,0 +1,353 @@
+## model, backend
+import hashlib
+import io
+import ipaddress
+import os
+import queue
+import shutil
+import socket
+import threading
+from urllib.parse import urljoin, urlsplit
+import requests
+from __init__ import app
+from model.metrics import incr
+
+try:  # Pillow is optional, without it thumbnails are served at full size
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Local cache of book cover images
+# Covers are stored on disk under a name derived from the cover URL (and the thumbnail width), so a
+# cached file never changes and can be served with immutable cache headers. Files are evicted least
+# recently used first when the folder grows past its size budget, a cache hit refreshes the file's
+# modification time. Missing covers are downloaded by a background thread, the request that asked
+# for them is redirected to the original URL meanwhile.
+# Cover URLs come from users (suggestions, imports), so the server only downloads http(s) URLs whose
+# host resolves to public addresses, and follows redirects itself, checking each hop the same way.
+
+THUMBNAIL_WIDTHS = (100, 200, 400)  # the only widths generated, so each cover has at most 4 files
+MAX_COVER_BYTES = 5 * 1024 * 1024   # larger downloads are rejected
+FETCH_TIMEOUT = 10                  # seconds
+QUEUE_SIZE = 1000                   # covers waiting to be fetched per worker, more are dropped
+MAX_REDIRECTS = 3
+ALLOWED_SCHEMES = ('http', 'https')
+
+CONTENT_TYPES = {'image/jpeg': '.jpg', 'image/png': '.png', 'image/gif': '.gif', 'image/webp': '.webp'}
+EXTENSIONS = {extension: content_type for content_type, extension in CONTENT_TYPES.items()}
+
+
+def _is_public(address):
+    ip = ipaddress.ip_address(address.split('%')[0])  # drop an IPv6 scope id
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return not (ip.is_private or ip.is_loopback or ip.is_link_local or ip.is_reserved
+                or ip.is_multicast or ip.is_unspecified)
+
+
+def check_cover_url(url):
+    """
+    Refuse cover URLs the server must not download: other schemes than http(s), and hosts that
+    resolve to a private, loopback, link-local or reserved address.
+
+    Raises:
+        ValueError: The URL is not safe to download.
+    """
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except (TypeError, ValueError):
+        raise ValueError('Not a valid URL')
+    if parts.scheme.lower() not in ALLOWED_SCHEMES:
+        raise ValueError(f'Scheme not allowed: {parts.scheme or "none"}')
+    if not parts.hostname:
+        raise ValueError('URL has no host')
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(parts.hostname, port or parts.scheme, proto=socket.IPPROTO_TCP)}
+    except (socket.gaierror, UnicodeError) as e:
+        raise ValueError(f'Cannot resolve {parts.hostname}: {e}')
+    if not addresses or not all(_is_public(address) for address in addresses):
+        raise ValueError(f'Host is not public: {parts.hostname}')
+
+
+def is_safe_cover_url(url):
+    try:
+        check_cover_url(url)
+        return True
+    except ValueError:
+        return False
+
+
+def default_fetcher(url):
+    """
+    Download an image, following at most MAX_REDIRECTS redirects, each checked by check_cover_url.
+
+    Returns:
+        tuple: (image bytes, content type)
+
+    Raises:
+        ValueError: The URL or a redirect is not safe, or the response is not an image or is too large.
+        requests.RequestException: The download failed.
+    """
+    for _ in range(MAX_REDIRECTS + 1):
+        check_cover_url(url)
+        with requests.get(url, timeout=FETCH_TIMEOUT, stream=True, allow_redirects=False,
+                          headers={'User-Agent': 'bookworms-cover-cache'}) as response:
+            if response.is_redirect:
+                url = urljoin(url, response.headers['Location'])
+                continue
+            response.raise_for_status()
+            content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+            if content_type not in CONTENT_TYPES:
+                raise ValueError(f'Not a supported image: {content_type or "no content type"}')
+            data = bytearray()
+            for chunk in response.iter_content(64 * 1024):
+                data.extend(chunk)
+                if len(data) > MAX_COVER_BYTES:
+                    raise ValueError('Image is too large')
+            return bytes(data), content_type
+    raise ValueError('Too many redirects')
+
+
+_fetcher = default_fetcher
+
+def set_cover_fetcher(fetcher):
+    """
+    Replace the function covers are downloaded with, e.g. a local stand-in for tests.
+
+    Args:
+        fetcher (function): Called with a URL, returns (image bytes, content type). None restores
+            the default fetcher.
+    """
+    global _fetcher
+    _fetcher = fetcher or default_fetcher
+
+
+def cover_key(url):
+    """The stable file name stem of a cover URL."""
+    return hashlib.sha256(url.encode()).hexdigest()[:32]
+
+
+def covers_folder():
+    return app.config['COVERS_FOLDER']
+
+
+def find_cover(url, width=None):
+    """
+    The file name of a cached cover, or None.
+
+    Args:
+        url (str): The cover URL.
+        width (int, optional): One of THUMBNAIL_WIDTHS, None for the original.
+    """
+    stem = cover_key(url) + (f'_w{width}' if width else '')
+    for extension in EXTENSIONS:
+        name = stem + extension
+        if os.path.exists(os.path.join(covers_folder(), name)):
+            return name
+    return None
+
+
+def touch(name):
+    """Mark a cached file as recently used."""
+    try:
+        os.utime(os.path.join(covers_folder(), name))
+    except FileNotFoundError:
+        pass
+
+
+def _write(name, data):
+    # write then rename, readers never see half a file
+    path = os.path.join(covers_folder(), name)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def store_cover(url, data, content_type):
+    """Save a downloaded cover and evict old files if the cache is over budget. Returns the file name."""
+    name = cover_key(url) + CONTENT_TYPES[content_type]
+    _write(name, data)
+    enforce_budget()
+    return name
+
+
+def _alias(original, name):
+    # the original under a thumbnail's name, a hard link where the filesystem allows it
+    folder = covers_folder()
+    tmp = os.path.join(folder, f'{name}.{os.getpid()}.tmp')
+    try:
+        os.link(os.path.join(folder, original), tmp)
+    except OSError:
+        shutil.copyfile(os.path.join(folder, original), tmp)
+    os.replace(tmp, os.path.join(folder, name))
+
+
+def make_thumbnail(url, width):
+    """
+    Resize a cached cover to a width, keeping its aspect ratio.
+
+    An original already narrower than the width is stored under the thumbnail's name too, so it is
+    not opened again. A cached original Pillow cannot read is deleted, to be downloaded again.
+
+    Returns:
+        str: The thumbnail's file name, the original's if Pillow is not installed, None if the
+            original is not cached or is not a readable image.
+    """
+    original = find_cover(url)
+    if original is None:
+        return None
+    if Image is None:
+        return original
+    try:
+        with Image.open(os.path.join(covers_folder(), original)) as image:
+            if image.width <= width:
+                name = f'{cover_key(url)}_w{width}{os.path.splitext(original)[1]}'
+                _alias(original, name)
+                enforce_budget()
+                return name
+            height = max(1, round(image.height * width / image.width))
+            thumbnail = image.convert('RGB').resize((width, height), Image.LANCZOS)
+            buffer = io.BytesIO()
+            thumbnail.save(buffer, 'JPEG', quality=85, optimize=True)
+    except (OSError, Image.DecompressionBombError) as e:
+        incr('covers.unreadable')
+        print(f"Deleting unreadable cover {original}: {e}")
+        try:
+            os.remove(os.path.join(covers_folder(), original))
+        except FileNotFoundError:
+            pass
+        return None
+    name = f'{cover_key(url)}_w{width}.jpg'
+    _write(name, buffer.getvalue())
+    enforce_budget()
+    return name
+
+
+def enforce_budget(max_bytes=None):
+    """
+    Delete the least recently used files until the cache fits its size budget.
+
+    Returns:
+        int: The number of files deleted.
+    """
+    max_bytes = max_bytes or app.config['COVERS_MAX_BYTES']
+    entries = []
+    total = 0
+    with os.scandir(covers_folder()) as scan:
+        for entry in scan:
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+                total += stat.st_size
+    deleted = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            deleted += 1
+        except FileNotFoundError:
+            pass
+        total -= size
+    if deleted:
+        incr('covers.evictions', deleted)
+    return deleted
+
+
+def fetch_cover(url, width=None):
+    """
+    Download a cover into the cache (and make its thumbnail) right away.
+
+    Returns:
+        str: The cached file name, None if the download failed.
+    """
+    if find_cover(url) is None:
+        try:
+            data, content_type = _fetcher(url)
+            store_cover(url, data, content_type)
+            incr('covers.fetched')
+        except Exception as e:
+            incr('covers.fetch_errors')
+            print(f"Could not fetch cover {url}: {e}")
+            return None
+    return make_thumbnail(url, width) if width else find_cover(url)
+
+
+class CoverFetcher:
+    """
+    A background thread per worker that downloads the covers cached_cover could not find.
+
+    The thread is started on first use, after gunicorn has forked the worker.
+    """
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def request(self, url, width=None):
+        """Queue a cover for download, does nothing if it is already queued or the queue is full."""
+        key = (url, width)
+        with self._lock:
+            if key in self._pending:
+                return
+            try:
+                self._queue.put_nowait(key)
+            except queue.Full:
+                incr('covers.dropped')
+                return
+            self._pending.add(key)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='cover-fetcher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            url, width = self._queue.get()
+            try:
+                with app.app_context():
+                    fetch_cover(url, width)
+            finally:
+                with self._lock:
+                    self._pending.discard((url, width))
+                self._queue.task_done()
+
+    def join(self):
+        """Wait until every queued cover has been handled."""
+        self._queue.join()
+
+
+cover_fetcher = CoverFetcher()
+
+
+def cached_cover(url, width=None):
+    """
+    The cached file of a cover, queueing the download when it is missing.
+
+    Args:
+        url (str): The cover URL.
+        width (int, optional): One of THUMBNAIL_WIDTHS, None for the original.
+
+    Returns:
+        str: The file name in the covers folder, None if the cover is not cached yet, or never
+            will be because the URL is not safe to download (see check_cover_url).
+    """
+    name = find_cover(url, width)
+    if name is None and width and find_cover(url):
+        name = make_thumbnail(url, width)  # resizing a cached original is quick enough to do inline
+    if name is None:
+        incr('covers.misses')
+        # only URLs the default fetcher would download are queued, a stand-in fetcher checks its own
+        if _fetcher is not default_fetcher or is_safe_cover_url(url):
+            cover_fetcher.request(url, width)
+        else:
+            incr('covers.rejected')
+        return None
+    incr('covers.hits')
+    touch(name)
+    return name
+
+
+os.makedirs(app.config['COVERS_FOLDER'], exist_ok=True)
@@ -0,0 +1,112 @@
+## model, backend
+from sqlalchemy import insert, inspect, text, update
+from sqlalchemy.exc import IntegrityError
+from __init__ import db
+
+# Schema helpers for existing databases
+# db.create_all() creates missing tables but never changes a table that already exists, so
+# columns and indexes added to existing models are applied here, once, at startup.
+# increment() and insert_ignore() are shared write helpers for counters and deduplicated inserts.
+
+def add_column_if_missing(table, column):
+    """
+    Add a column to an existing table when the database does not have it yet.
+
+    Only the column and its type are added, constraints such as foreign keys apply to tables
+    created fresh by db.create_all().
+
+    Args:
+        table (str): The table name.
+        column (db.Column): The column as declared on the model, e.g. Book.__table__.c.genre_id.
+
+    Returns:
+        bool: True if the column was added.
+    """
+    columns = [existing['name'] for existing in inspect(db.engine).get_columns(table)]
+    if column.name in columns:
+        return False
+    column_type = column.type.compile(dialect=db.engine.dialect)
+    with db.engine.begin() as conn:
+        conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column.name} {column_type}'))
+    return True
+
+
+def has_index(table, name):
+    """True if the database has an index of that name on the table."""
+    return any(index['name'] == name for index in inspect(db.engine).get_indexes(table))
+
+
+def create_index_if_missing(index):
+    """
+    Create an index declared on a model if the database does not have it yet.
+
+    Args:
+        index (sqlalchemy.Index): The index, e.g. one from Model.__table__.indexes.
+    """
+    index.create(db.engine, checkfirst=True)
+
+
+def create_indexes(model):
+    """Create every index declared on a model that is missing from the database."""
+    for index in model.__table__.indexes:
+        create_index_if_missing(index)
+
+
+def increment(model, key, **amounts):
+    """
+    Add to the counter columns of one row, creating the row when it does not exist yet.
+
+    The UPDATE adds in the database, so concurrent writers never lose a count. When two writers
+    create the same row at once, the loser's INSERT fails inside a savepoint and it updates instead.
+    Runs inside the caller's transaction, the caller commits.
+
+    Args:
+        model (db.Model): The model of the counters table.
+        key (dict): The primary key columns and values, e.g. {'book_id': 1}.
+        amounts: Counter column -> amount to add, may be negative. A row created by a negative
+            amount starts at 0.
+    """
+    where = [getattr(model, column) == value for column, value in key.items()]
+    values = {column: getattr(model, column) + amount for column, amount in amounts.items()}
+    statement = update(model).where(*where).values(values)
+    if db.session.execute(statement, execution_options={'synchronize_session': False}).rowcount:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(model(**key, **{column: max(amount, 0) for column, amount in amounts.items()}))
+    except IntegrityError:
+        db.session.execute(statement, execution_options={'synchronize_session': False})
+
+
+def insert_ignore(model, rows, key):
+    """
+    Insert rows, skipping the ones that collide with an existing row on a unique column, in one
+    multi-row statement: INSERT ... ON CONFLICT DO NOTHING on SQLite, INSERT ... ON DUPLICATE KEY
+    UPDATE with a no-op assignment on MySQL. Other errors are still raised.
+
+    Runs inside the caller's transaction, the caller commits.
+
+    Args:
+        model (db.Model): The model of the table.
+        rows (list): Column dictionaries, all with the same keys.
+        key (str): The unique column duplicates are detected on.
+    """
+    if not rows:
+        return
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        statement = sqlite_insert(model).values(rows).on_conflict_do_nothing(index_elements=[key])
+    elif dialect in ('mysql', 'mariadb'):
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        statement = mysql_insert(model).values(rows)
+        statement = statement.on_duplicate_key_update({key: getattr(statement.inserted, key)})
+    else:
+        for row in rows:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(insert(model).values(row))
+            except IntegrityError:
+                pass
+        return
+    db.session.execute(statement)
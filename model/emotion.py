@@ -4,6 +4,8 @@ from sqlalchemy import Text, JSON
 from __init__ import app, db
 from sqlalchemy import Column, Integer, String, Text
 from model.librarydb import Book
+from model.tableversion import TableVersion
+from model.bookevents import emit
 from sqlite3 import IntegrityError
 
 # Reaction model definition
@@ -31,6 +33,8 @@ class Emotion(db.Model):
 
         try:
             db.session.add(new_reaction)
+            emit('reaction.created', emotion=new_reaction)
+            TableVersion.bump('emotion')
             db.session.commit()
         except Exception as e:
             db.session.rollback()
@@ -41,6 +45,8 @@ class Emotion(db.Model):
     
     def create(self):
         db.session.add(self)
+        emit('reaction.created', emotion=self)
+        TableVersion.bump('emotion')
         db.session.commit()
         
     def delete(self):
@@ -55,6 +61,8 @@ class Emotion(db.Model):
         """    
         try:
             db.session.delete(self)
+            emit('reaction.deleted', emotion=self)
+            TableVersion.bump('emotion')
             db.session.commit()
         except Exception as e:
             db.session.rollback()
@@ -100,9 +108,13 @@ class Emotion(db.Model):
 
             if existing_reaction:
                 # Update the existing reaction with new data
+                previous_type = existing_reaction.reaction_type
                 existing_reaction.reaction_type = reaction_data.get('reaction_type', existing_reaction.reaction_type)
+                if existing_reaction.reaction_type != previous_type:
+                    emit('reaction.changed', emotion=existing_reaction, previous_type=previous_type)
                 existing_reaction.author_id = reaction_data.get('author_id', existing_reaction.author_id)
 
+                TableVersion.bump('emotion')
                 db.session.commit()
                 restored_reactions[existing_reaction.id] = existing_reaction
             else:
@@ -139,6 +151,8 @@ def initEmotion():
     for emoji in emotions:
         try:
             db.session.add(emoji)
+            emit('reaction.created', emotion=emoji)
+            TableVersion.bump('emotion')
             db.session.commit()
             print(f"Record created: {repr(emoji)}")
         except IntegrityError:
@@ -76,13 +76,15 @@ class Feedback(db.Model):
         """
         user = User.query.get(self._user_id)
         post = Post.query.get(self._post_id)
-        data = {
+        return self._serialize(user.name if user else None, post._title if post else None)
+
+    def _serialize(self, user_name, post_title):
+        return {
             "id": self.id,
             "content": self._content,
-            "user_name": user.name if user else None,
-            "post_title": post.title if post else None,
+            "user_name": user_name,
+            "post_title": post_title,
         }
-        return data
     
     def update(self):
         """
@@ -117,6 +119,23 @@ class Feedback(db.Model):
             db.session.rollback()
             raise e
 
+def read_feedbacks(query=None):
+    """
+    Read feedbacks as dictionaries (see Feedback.read), loading their authors' names and posts'
+    titles in the same joined query, so a list of feedbacks costs one query instead of two per feedback.
+
+    Args:
+        query (Query, optional): A Feedback query selecting the feedbacks. Every feedback when omitted.
+
+    Returns:
+        list: The feedback dictionaries, in the query's order.
+    """
+    query = query if query is not None else Feedback.query
+    rows = query.outerjoin(User, User.id == Feedback._user_id).outerjoin(Post, Post.id == Feedback._post_id) \
+        .add_columns(User._name, Post._title).all()
+    return [feedback._serialize(user_name, post_title) for feedback, user_name, post_title in rows]
+
+
 def initFeedbacks():
     """
     The initFeedbacks function creates the Feedback table and adds tester data to the table.
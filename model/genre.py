@@ -0,0 +1,174 @@
+## model, backend
+import re
+from sqlalchemy import update
+from __init__ import app, db
+from model.tableversion import TableVersion
+from model.dbutil import add_column_if_missing, create_indexes
+
+class Genre(db.Model):
+    """
+    Genre Model
+
+    The canonical list of genres used by books, suggestions and saved recommendations.
+
+    Attributes:
+        id (db.Column): The primary key.
+        name (db.Column): The display name, e.g. 'Suspense/Thriller'.
+        aliases (relationship): Every normalized spelling that resolves to this genre, the
+            genre's own name included.
+    """
+    __tablename__ = 'genres'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)
+
+    aliases = db.relationship('GenreAlias', backref='genre', lazy=True, cascade='all, delete-orphan')
+
+    def __repr__(self):
+        return f"<Genre(id={self.id}, name={self.name})>"
+
+    def read(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'aliases': sorted(alias.key for alias in self.aliases)
+        }
+
+    @staticmethod
+    def resolve(name, create=False):
+        """
+        Find the genre a free-text genre name refers to, with one indexed alias lookup.
+
+        Args:
+            name (str): A genre as typed by a user or stored in old rows, e.g. 'thriller'.
+            create (bool): Create a new genre when nothing matches.
+
+        Returns:
+            Genre: The matching genre, or None.
+        """
+        key = genre_key(name)
+        if not key:
+            return None
+        alias = GenreAlias.query.filter_by(key=key).first()
+        if alias:
+            return alias.genre
+        if not create:
+            return None
+        genre = Genre(name=name.strip())
+        genre.aliases.append(GenreAlias(key=key))
+        db.session.add(genre)
+        db.session.flush()
+        TableVersion.bump('genres')
+        return genre
+
+
+class GenreAlias(db.Model):
+    """
+    GenreAlias Model
+
+    Maps a normalized spelling of a genre (see genre_key) to the genre it stands for.
+    """
+    __tablename__ = 'genre_aliases'
+
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(100), unique=True, nullable=False, index=True)
+    genre_id = db.Column(db.Integer, db.ForeignKey('genres.id'), nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<GenreAlias(key={self.key}, genre_id={self.genre_id})>"
+
+
+def genre_key(name):
+    """Normalize a genre name for lookups: 'Suspense/Thriller ' -> 'suspense thriller'."""
+    return re.sub(r'[^a-z0-9]+', ' ', (name or '').lower()).strip()
+
+
+def assign_genre(record, create=True):
+    """
+    Point a record with `genre` and `genre_id` columns at the canonical genre for its text.
+
+    The genre text is replaced by the canonical name, so 'thriller' is stored as 'Suspense/Thriller'.
+
+    Args:
+        record (db.Model): A record with `genre` and `genre_id` columns.
+        create (bool): Add unknown genres to the taxonomy, otherwise the record is left unlinked
+            with its text as typed.
+    """
+    genre = Genre.resolve(record.genre, create=create)
+    record.genre_id = genre.id if genre else None
+    if genre:
+        record.genre = genre.name
+
+
+def backfill_genres(model, create=True):
+    """
+    Migrate a table with a free-text `genre` column onto the taxonomy.
+
+    Adds the `genre_id` column and its index to databases created before the taxonomy existed,
+    then links every unlinked row, one UPDATE per distinct genre string.
+
+    Args:
+        model (db.Model): A model with `genre` and `genre_id` columns.
+        create (bool): Add unknown genres to the taxonomy, otherwise their rows stay unlinked.
+
+    Returns:
+        int: The number of rows linked.
+    """
+    table = model.__tablename__
+    add_column_if_missing(table, model.__table__.c.genre_id)
+    create_indexes(model)
+
+    linked = 0
+    names = [row[0] for row in db.session.query(model.genre).filter(model.genre_id.is_(None)).distinct()]
+    for name in names:
+        genre = Genre.resolve(name, create=create)
+        if genre is None:
+            continue
+        result = db.session.execute(
+            update(model)
+            .where(model.genre == name, model.genre_id.is_(None))
+            .values(genre_id=genre.id, genre=genre.name)
+        )
+        linked += result.rowcount
+    if linked:
+        TableVersion.bump(table)
+    db.session.commit()
+    return linked
+
+
+# Starter taxonomy, each genre with the other spellings users are likely to type
+GENRE_ALIASES = {
+    'Classics': ['Classic', 'Classic Literature'],
+    'Fantasy': ['Fantasy Fiction', 'High Fantasy'],
+    'Nonfiction': ['Non-fiction', 'Non Fiction'],
+    'Historical Fiction': ['Historical', 'Historical Novel'],
+    'Suspense/Thriller': ['Suspense', 'Thriller', 'Thrillers', 'Suspense and Thriller'],
+    'Romance': ['Romantic', 'Love Story'],
+    'Dystopian': ['Dystopia', 'Dystopian Fiction'],
+    'Mystery': ['Mysteries', 'Detective'],
+}
+
+def initGenres():
+    """
+    The initGenres function creates the genre tables and adds the starter taxonomy.
+    """
+    with app.app_context():
+        db.create_all()
+        added = False
+        for name, aliases in GENRE_ALIASES.items():
+            genre = Genre.resolve(name, create=True)
+            known = {alias.key for alias in genre.aliases}
+            for alias in aliases:
+                key = genre_key(alias)
+                if key not in known and not GenreAlias.query.filter_by(key=key).first():
+                    genre.aliases.append(GenreAlias(key=key))
+                    known.add(key)
+                    added = True
+        if added:
+            TableVersion.bump('genres')
+        db.session.commit()
+
+
+# create the tables and starter taxonomy before the tables that reference them
+with app.app_context():
+    initGenres()
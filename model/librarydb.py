@@ -1,16 +1,25 @@
 from flask_restful import Api, Resource
 from sqlalchemy import Text, JSON
 from __init__ import app, db
-from sqlalchemy import Column, Integer, String, Text
+from sqlalchemy import Column, Integer, String, Text, insert, update
 from sqlite3 import IntegrityError
+from model.tableversion import TableVersion
+from model.sampler import RandomSampler
+from model.genre import Genre, assign_genre, backfill_genres
+from model.author import Author, assign_author, backfill_authors
+from model.bookevents import emit
+from model.dbutil import create_indexes
+from model.bookvectors import append_book_vector
 import random
 
 class Book(db.Model):
     __tablename__ = 'books'
     id = db.Column(Integer, primary_key=True)
-    title = db.Column(String, nullable=False)
+    title = db.Column(String, nullable=False, index=True)  # keyset pagination by title
     author = db.Column(String, nullable=False)
+    author_id = db.Column(Integer, db.ForeignKey('authors.id'), index=True)  # Reference to Author.id, kept in sync with author
     genre = db.Column(String)
+    genre_id = db.Column(Integer, db.ForeignKey('genres.id'), index=True)  # Reference to Genre.id, kept in sync with genre
     description = db.Column(Text)
     cover_url = db.Column(String)
 
@@ -20,18 +29,33 @@ class Book(db.Model):
     # CRUD methods for Book class
     def create(self):
         try:
+            assign_genre(self)
+            assign_author(self)
             db.session.add(self)
+            db.session.flush()
+            emit('book.created', book=self)
+            TableVersion.bump('books')
             db.session.commit()
         except Exception as e:
             db.session.rollback()
             raise e
+        self._embed()
+
+    def _embed(self):
+        # make the book recommendable as "more like this" before the next full vector build
+        try:
+            append_book_vector(self)
+        except Exception as e:
+            print(f"Could not embed book {self.id}: {e}")
 
     def read(self):
         return {
             'id': self.id,
             'title': self.title,
             'author': self.author,
+            'author_id': self.author_id,
             'genre': self.genre,
+            'genre_id': self.genre_id,
             'cover_url': self.cover_url,
             'description': self.description,
         }
@@ -45,82 +69,128 @@ class Book(db.Model):
         genre = inputs.get("genre", None)
         cover_url = inputs.get("cover_url", None)
         description = inputs.get("description", None)
+        previous = {'title': self.title, 'author_id': self.author_id}
 
         if title:
             self.title = title
         if author:
             self.author = author
+            assign_author(self)
         if genre:
             self.genre = genre
+            assign_genre(self)
         if cover_url:
             self.cover_url = cover_url
         if description:
             self.description = description
 
         try:
+            if title or author:
+                emit('book.updated', book=self, previous=previous)
+            TableVersion.bump('books')
             db.session.commit()
         except Exception as e:
             db.session.rollback()
             raise e
+        if title or genre or description:
+            self._embed()
         return self
 
     def delete(self):
         try:
             db.session.delete(self)
+            db.session.flush()
+            emit('book.deleted', book=self)
+            TableVersion.bump('books')
             db.session.commit()
         except Exception as e:
             db.session.rollback()
             raise e
 
+    # columns a restore or import may set, genre_id is always derived from genre
+    UPSERT_FIELDS = ('title', 'author', 'genre', 'description', 'cover_url')
+
     @staticmethod
-    def restore(data):
-        restored_books = {}
+    def upsert_many(rows, known=None):
+        """
+        Insert or update a batch of books, matched on (title, author), with one bulk INSERT and one
+        bulk UPDATE instead of a query and a commit per row.
 
-        for book_data in data:  # Changed to `book_data` for clarity
-            # Remove 'id' if it's present in the input data, as it's auto-generated by the database
-            book_data.pop('id', None)
+        The caller commits, so a whole batch is one transaction. Rows without a title or author are
+        skipped, later rows for the same book in the batch overwrite earlier ones.
 
-            # Check if the book already exists
-            existing_book = Book.query.filter_by(
-                title=book_data.get('title'),
-                author=book_data.get('author')
-            ).first()
+        Args:
+            rows (list): Book dictionaries, keys other than UPSERT_FIELDS are ignored.
+            known (dict, optional): (title, author) -> book id for books already in the database.
+                Importers pass one map pre-loaded for the whole file, it is updated with the ids of
+                the inserted books. When omitted, the keys of this batch are looked up with one query.
 
-            if existing_book:
-                # Update the existing book with new data
-                for key, value in book_data.items():
-                    setattr(existing_book, key, value)
+        Returns:
+            dict: Counts of 'inserted', 'updated' and 'skipped' rows.
+        """
+        if known is None:
+            titles = list({row.get('title') for row in rows if row.get('title')})
+            known = {}
+            if titles:
+                known = {(title, author): book_id for book_id, title, author in
+                         db.session.query(Book.id, Book.title, Book.author).filter(Book.title.in_(titles))}
 
-                try:
-                    db.session.commit()
-                    restored_books[existing_book.id] = {
-                        'status': 'updated',
-                        'book': existing_book.read()
-                    }
-                except Exception as e:
-                    db.session.rollback()
-                    restored_books[existing_book.id] = {
-                        'status': 'error',
-                        'message': str(e)
-                    }
+        inserts, updates, skipped = {}, {}, 0
+        genres = {}  # genre text -> (genre_id, canonical name), resolved once per batch
+        authors = {}  # author text -> author_id, resolved once per batch
+        for row in rows:
+            values = {key: row[key] for key in Book.UPSERT_FIELDS if row.get(key) is not None}
+            if not values.get('title') or not values.get('author'):
+                skipped += 1
+                continue
+            if 'genre' in values:
+                text = values['genre']
+                if text not in genres:
+                    genre = Genre.resolve(text, create=True)
+                    genres[text] = (genre.id, genre.name) if genre else (None, text)
+                values['genre_id'], values['genre'] = genres[text]
+            if values['author'] not in authors:
+                author = Author.resolve(values['author'], create=True)
+                authors[values['author']] = author.id if author else None
+            values['author_id'] = authors[values['author']]
+            key = (values['title'], values['author'])
+            if key in known:
+                updates.setdefault(key, {'id': known[key]}).update(values)
             else:
-                # Create a new book
-                new_book = Book(**book_data)
-                db.session.add(new_book)
-                try:
-                    db.session.commit()
-                    restored_books[new_book.id] = {
-                        'status': 'created',
-                        'book': new_book.read()
-                    }
-                except Exception as e:
-                    db.session.rollback()
-                    restored_books[new_book.id] = {
-                        'status': 'error',
-                        'message': str(e)
-                    }
+                inserts.setdefault(key, {}).update(values)
+
+        if inserts:
+            db.session.execute(insert(Book), list(inserts.values()))
+            titles = list({title for title, _ in inserts})
+            for book_id, title, author in db.session.query(Book.id, Book.title, Book.author).filter(Book.title.in_(titles)):
+                known.setdefault((title, author), book_id)
+        if updates:
+            db.session.execute(update(Book), list(updates.values()))
+        if inserts or updates:
+            emit('books.imported', author_ids={author_id for author_id in authors.values() if author_id})
+            TableVersion.bump('books')
+        return {'inserted': len(inserts), 'updated': len(updates), 'skipped': skipped}
+
+    @staticmethod
+    def restore(data):
+        """
+        Restore books from a backup, updating books that already exist by (title, author).
+
+        Ids from the backup are not kept, and genre_id is resolved again from the genre text.
+
+        Returns:
+            dict: Counts of 'inserted', 'updated' and 'skipped' books.
+        """
+        try:
+            result = Book.upsert_many(data)
+            db.session.commit()
+            return result
+        except Exception as e:
+            db.session.rollback()
+            raise e
 
-        return restored_books
+# Random book picker shared by /random_book and /random_bookrec, grouped by Genre.id
+book_sampler = RandomSampler(Book, Book.genre_id)
 
 # static book data 
 def initBooks(): 
@@ -425,10 +495,13 @@ def initBooks():
                 description=book["description"],
                 cover_url=book["cover_url"]
             )
+            assign_genre(new_book)  # link the book to the genre taxonomy
+            assign_author(new_book)  # and to its author
             db.session.add(new_book)  # Add the book to session
     
     # commit transaction to the database
     try:
+        TableVersion.bump('books')
         db.session.commit() 
     except IntegrityError:
         db.session.rollback()  
@@ -440,4 +513,7 @@ def initBooks():
 # create the tables before inserting data
 with app.app_context():
     db.create_all()  # create tables
+    startup_linked_authors = backfill_authors(Book)  # link books created before the authors table, adds author_id first
+    backfill_genres(Book)  # link books created before the genre taxonomy
+    create_indexes(Book)  # indexes added after the table was created
     initBooks()  # initialize the books data
\ No newline at end of file
@@ -0,0 +1,63 @@
+## model, backend
+import os
+import threading
+from collections import defaultdict
+
+# In-process counters
+# Every gunicorn worker keeps its own counters, so /api/metrics reports the worker that answered
+# the request along with its pid.
+
+_counters = defaultdict(int)
+_gauges = {}  # name -> function returning the current value
+_lock = threading.Lock()
+
+
+def incr(name, amount=1):
+    """
+    Add to a counter, e.g. incr('catalog.hits').
+
+    Args:
+        name (str): Dotted counter name, the part before the first dot groups related counters.
+        amount (int): How much to add.
+    """
+    with _lock:
+        _counters[name] += amount
+
+
+def gauge(name, read):
+    """
+    Report a current value, e.g. a cache size, read when the metrics are requested.
+
+    Args:
+        name (str): Dotted gauge name, e.g. 'auth_users.size'.
+        read (function): Called with no arguments, returns a number.
+    """
+    with _lock:
+        _gauges[name] = read
+
+
+def snapshot():
+    """
+    Read all counters.
+
+    Returns:
+        dict: The worker pid, a copy of every counter, the current value of every gauge and a hit
+            ratio for each cache that counts both hits and misses.
+    """
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+    ratios = {}
+    for name in counters:
+        if name.endswith('.hits'):
+            prefix = name[:-len('.hits')]
+            lookups = counters[name] + counters.get(prefix + '.misses', 0)
+            ratios[prefix] = round(counters[name] / lookups, 4) if lookups else None
+    return {'pid': os.getpid(), 'counters': counters, 'gauges': {name: read() for name, read in gauges.items()},
+            'hit_ratio': ratios}
+
+
+def reset():
+    """Set every counter back to zero, gauges are kept."""
+    with _lock:
+        _counters.clear()
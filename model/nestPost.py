@@ -84,17 +84,19 @@ class NestPost(db.Model):
         """
         user = User.query.get(self._user_id)
         group = Group.query.get(self._group_id)
-        data = {
+        return self._serialize(user.name if user else None, group.name if group else None)
+
+    def _serialize(self, user_name, group_name):
+        return {
             "id": self.id,
             "title": self._title,
             "content": self._content,
-            "user_name": user.name if user else None,
-            "group_name": group.name if group else None,
+            "user_name": user_name,
+            "group_name": group_name,
             # Review information as this may not work as this is a quick workaround
             "image_url": self._image_url
         }
-        return data
-    
+
     def update(self):
         """
         The update method commits the transaction to the database.
@@ -128,6 +130,23 @@ class NestPost(db.Model):
             db.session.rollback()
             raise e
 
+def read_nest_posts(query=None):
+    """
+    Read posts as dictionaries (see NestPost.read), loading their authors' and groups' names in the
+    same joined query, so a list of posts costs one query instead of two per post.
+
+    Args:
+        query (Query, optional): A NestPost query selecting the posts. Every post when omitted.
+
+    Returns:
+        list: The post dictionaries, in the query's order.
+    """
+    query = query if query is not None else NestPost.query
+    rows = query.outerjoin(User, User.id == NestPost._user_id).outerjoin(Group, Group.id == NestPost._group_id) \
+        .add_columns(User._name, Group._name).all()
+    return [post._serialize(user_name, group_name) for post, user_name, group_name in rows]
+
+
 def initNestPosts():
     """
     The initPosts function creates the Post table and adds tester data to the table.
@@ -0,0 +1,275 @@
+## model, backend
+import math
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from itertools import repeat
+from concurrent.futures.process import BrokenProcessPool
+from sqlalchemy import case, delete, func, inspect, update
+from werkzeug.exceptions import ServiceUnavailable, TooManyRequests
+from werkzeug.security import generate_password_hash, check_password_hash
+from __init__ import app, db
+from model.dbutil import create_indexes, increment
+from model.metrics import incr, gauge
+
+# Password hashing off the request thread
+# pbkdf2 is slow on purpose, hashing it inline lets a burst of logins hold every gunicorn worker.
+# Each worker hands hashing and verification to its own small process pool (PASSWORD_POOL_SIZE
+# processes, 0 hashes inline) and refuses new work with 503 + Retry-After once PASSWORD_QUEUE_LIMIT
+# hashes are waiting or running, instead of queueing requests behind each other.
+# Failed logins are counted in the database so every worker sees them, per uid and client address.
+# After THROTTLE_AFTER failures in a row for a uid from one address, or failures for
+# IP_THROTTLE_UIDS different uids from one address, the address is refused with 429 + Retry-After,
+# before the user is loaded or any hashing runs, for a delay that doubles with each further failure.
+# Keying on the address means a stranger guessing a uid's password does not lock its owner out, and
+# counting uids rather than failures means a few users mistyping behind one NAT do not lock out the
+# rest. The address is the client's as forwarded by nginx, see ProxyFix in __init__.py. A successful
+# login writes nothing unless its uid and address had failures.
+
+HASH_METHOD = "pbkdf2:sha256"
+SALT_LENGTH = 10
+WAIT_SECONDS = 30          # longest a request waits for its hash
+
+THROTTLE_AFTER = 5         # failed logins in a row before a uid is throttled for an address
+IP_THROTTLE_UIDS = 20      # uids with failed logins from one address before the address is throttled
+THROTTLE_BASE_SECONDS = 1  # delay after the first throttled failure, doubled for each one after
+THROTTLE_MAX_SECONDS = 300
+FAILURE_RESET_SECONDS = 15 * 60  # failures older than this are forgotten
+UID_MAX_LENGTH = 255       # longer uids cannot exist, they fail without a lookup
+IP_MAX_LENGTH = 64
+
+
+class PasswordPoolBusy(ServiceUnavailable):
+    description = 'Too many logins at once, please retry shortly.'
+
+
+class LoginThrottled(TooManyRequests):
+    description = 'Too many failed logins, please retry later.'
+
+
+class LoginFailure(db.Model):
+    """
+    LoginFailure Model
+
+    Attributes:
+        uid (db.Column): The uid logins failed for, whether or not a user has it.
+        ip (db.Column): The client address the logins came from.
+        failures (db.Column): Failed logins in a row.
+        last_failure (db.Column): Unix time of the latest failure.
+    """
+    __tablename__ = 'login_failures'
+    __table_args__ = (db.Index('ix_login_failures_ip', 'ip', 'last_failure'),)  # the uids failing from an address
+
+    uid = db.Column(db.String(UID_MAX_LENGTH), primary_key=True)
+    ip = db.Column(db.String(IP_MAX_LENGTH), primary_key=True)
+    failures = db.Column(db.Integer, nullable=False, default=0)
+    last_failure = db.Column(db.Float, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<LoginFailure(uid={self.uid}, ip={self.ip}, failures={self.failures})>"
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_pending = 0               # hashes waiting or running in this worker
+_average_seconds = 0.3     # moving average of one hash, for Retry-After
+
+gauge('passwords.pending', lambda: _pending)
+
+
+def _pool_size():
+    # a spawned process runs the parent's __main__ script again (as __mp_main__) before it takes work.
+    # Under gunicorn or the flask command that is their own launcher, but when the app itself is the
+    # script (python main.py) every pool process would set the whole app up, so hash inline instead
+    if getattr(sys.modules.get('__main__'), 'app', None) is app:
+        return 0
+    return app.config['PASSWORD_POOL_SIZE']
+
+
+def _executor():
+    # created on first use in each process, a gunicorn worker forked from the master gets its own
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(max_workers=app.config['PASSWORD_POOL_SIZE'],
+                                        mp_context=multiprocessing.get_context('spawn'))
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _discard_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _run(function, *args):
+    global _pending, _average_seconds
+    size = _pool_size()
+    if size <= 0:
+        return function(*args)
+    with _pool_lock:
+        if _pending >= app.config['PASSWORD_QUEUE_LIMIT']:
+            incr('passwords.rejected')
+            raise PasswordPoolBusy(retry_after=max(1, math.ceil(_pending * _average_seconds / size)))
+        _pending += 1
+    start = time.monotonic()
+    try:
+        pool = _executor()
+        try:
+            future = pool.submit(function, *args)
+            result = future.result(timeout=WAIT_SECONDS)
+        except FutureTimeoutError:
+            # the pool is too far behind, give up on this hash rather than holding the request
+            future.cancel()
+            incr('passwords.timeouts')
+            raise PasswordPoolBusy(retry_after=max(1, math.ceil(_pending * _average_seconds / size)))
+        except BrokenProcessPool:
+            # a pool process died, start a new pool for the next request and answer this one inline
+            incr('passwords.pool_restarts')
+            _discard_pool(pool)
+            result = function(*args)
+        _average_seconds = 0.9 * _average_seconds + 0.1 * (time.monotonic() - start)
+        return result
+    finally:
+        with _pool_lock:
+            _pending -= 1
+
+
+def hash_password(password):
+    """
+    Hash a password in the worker's hashing pool.
+
+    Raises:
+        PasswordPoolBusy: 503, the pool already has PASSWORD_QUEUE_LIMIT hashes to do, or the hash
+            was not done within WAIT_SECONDS.
+    """
+    incr('passwords.hashed')
+    return _run(generate_password_hash, password, HASH_METHOD, SALT_LENGTH)
+
+
+def verify_password(password_hash, password):
+    """
+    Check a password against its hash in the worker's hashing pool.
+
+    Raises:
+        PasswordPoolBusy: 503, the pool already has PASSWORD_QUEUE_LIMIT hashes to do, or the check
+            was not done within WAIT_SECONDS.
+    """
+    incr('passwords.verified')
+    return _run(check_password_hash, password_hash, password)
+
+
+def hash_passwords(passwords):
+    """
+    Hash many passwords at once, for bulk user creation, with one process per core.
+
+    This bypasses the worker's pool and its queue limit, callers must be admin-only.
+
+    Args:
+        passwords (list): Plain passwords.
+
+    Returns:
+        list: Their hashes, in order.
+    """
+    incr('passwords.hashed', len(passwords))
+    processes = min(os.cpu_count() or 1, len(passwords))
+    if _pool_size() <= 0 or processes <= 1:
+        return [generate_password_hash(password, HASH_METHOD, SALT_LENGTH) for password in passwords]
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return list(pool.map(generate_password_hash, passwords, repeat(HASH_METHOD), repeat(SALT_LENGTH),
+                             chunksize=max(1, len(passwords) // (processes * 4))))
+
+
+def throttle_delay(failures, after=THROTTLE_AFTER):
+    # seconds to wait after the latest failure
+    if failures < after:
+        return 0
+    return min(THROTTLE_MAX_SECONDS, THROTTLE_BASE_SECONDS * 2 ** (failures - after))
+
+
+def _ip(ip):
+    return (ip or '')[:IP_MAX_LENGTH]
+
+
+def check_throttle(uid, ip=None, now=None):
+    """
+    Refuse a login attempt for a uid that failed too often from an address, or from an address that
+    failed for too many uids, with one query.
+
+    Args:
+        uid (str): The uid typed by the user.
+        ip (str, optional): The client address, request.remote_addr.
+
+    Returns:
+        int: The recent failed logins in a row of the uid from the address, 0 if there are none.
+
+    Raises:
+        LoginThrottled: 429, with the seconds left to wait as Retry-After.
+    """
+    now = now if now is not None else time.time()
+    is_uid = LoginFailure.uid == uid
+    uids, latest, failures, last_failure = db.session.query(
+        func.count(), func.max(LoginFailure.last_failure),
+        func.max(case((is_uid, LoginFailure.failures))), func.max(case((is_uid, LoginFailure.last_failure))),
+    ).filter(LoginFailure.ip == _ip(ip), LoginFailure.last_failure >= now - FAILURE_RESET_SECONDS).one()
+    wait = 0
+    if failures:
+        wait = last_failure + throttle_delay(failures) - now
+    if uids:
+        wait = max(wait, latest + throttle_delay(uids, IP_THROTTLE_UIDS) - now)
+    if wait > 0:
+        incr('logins.throttled')
+        raise LoginThrottled(retry_after=math.ceil(wait))
+    return failures or 0
+
+
+_pruned_hour = None
+
+def record_login(uid, success, ip=None, now=None):
+    """
+    Count a failed login of a uid from an address, or forget the failures of the uid from that
+    address after a successful one. Commits only when something was written: a successful login
+    without earlier failures writes nothing.
+    """
+    global _pruned_hour
+    now = now if now is not None else time.time()
+    ip = _ip(ip)
+    try:
+        where = (LoginFailure.uid == uid, LoginFailure.ip == ip)
+        if success:
+            if not db.session.execute(delete(LoginFailure).where(*where)).rowcount:
+                db.session.rollback()
+                return
+        else:
+            db.session.execute(delete(LoginFailure).where(*where, LoginFailure.last_failure < now - FAILURE_RESET_SECONDS))
+            increment(LoginFailure, {'uid': uid, 'ip': ip}, failures=1)
+            db.session.execute(update(LoginFailure).where(*where).values(last_failure=now),
+                               execution_options={'synchronize_session': False})
+            incr('logins.failed')
+            hour = int(now // 3600)
+            if _pruned_hour != hour:
+                # once per hour and worker
+                db.session.execute(delete(LoginFailure).where(LoginFailure.last_failure < now - FAILURE_RESET_SECONDS))
+                _pruned_hour = hour
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        raise e
+
+
+# create the table before it is used; a table keyed by uid only, from before failures were counted
+# per address, only holds throttling state and is recreated
+with app.app_context():
+    inspector = inspect(db.engine)
+    if inspector.has_table(LoginFailure.__tablename__) and \
+            'ip' not in [column['name'] for column in inspector.get_columns(LoginFailure.__tablename__)]:
+        LoginFailure.__table__.drop(db.engine)
+    db.create_all()
+    create_indexes(LoginFailure)
@@ -85,16 +85,17 @@ class Post(db.Model):
         """
         user = User.query.get(self._user_id)
         channel = Channel.query.get(self._channel_id)
-        data = {
+        return self._serialize(user.name if user else None, channel.name if channel else None)
+
+    def _serialize(self, user_name, channel_name):
+        return {
             "id": self.id,
             "title": self._title,
             "comment": self._comment,
             "content": self._content,
-            "user_name": user.name if user else None,
-            "channel_name": channel.name if channel else None
+            "user_name": user_name,
+            "channel_name": channel_name
         }
-        return data
-    
 
     def update(self):
         """
@@ -176,6 +177,24 @@ class Post(db.Model):
                 post.update(post_data)
                 post.create()
         
+def read_posts(query=None):
+    """
+    Read posts as dictionaries (see Post.read), loading their authors' and channels' names in the
+    same joined query, so a list of posts costs one query instead of two per post.
+
+    Args:
+        query (Query, optional): A Post query selecting the posts, e.g. Post.query.filter_by(_channel_id=1).
+            Every post when omitted.
+
+    Returns:
+        list: The post dictionaries, in the query's order.
+    """
+    query = query if query is not None else Post.query
+    rows = query.outerjoin(User, User.id == Post._user_id).outerjoin(Channel, Channel.id == Post._channel_id) \
+        .add_columns(User._name, Channel._name).all()
+    return [post._serialize(user_name, channel_name) for post, user_name, channel_name in rows]
+
+
 def initPosts():
     """
     The initPosts function creates the Post table and adds tester data to the table.
@@ -0,0 +1,66 @@
+## model, backend
+import random
+from array import array
+from __init__ import db
+from model.tableversion import VersionedCache
+
+class RandomSampler:
+    """
+    Draws a uniformly random row from a table without reading the whole table.
+
+    Each worker keeps a compact array of the table's ids, one per group (e.g. genre), and picks
+    from it with random.choice, so gaps left by deleted ids do not skew the result. The arrays
+    are rebuilt only when the table's version changes, so a draw costs one version lookup and
+    one primary key fetch.
+
+    Args:
+        model (db.Model): The model to sample, it must have an integer `id` primary key.
+        group_column (db.Column, optional): Column used to sample within a group.
+        group_key (function, optional): Normalizes group values before they are used as keys.
+        table (str, optional): Name of the version counter, defaults to the model's table name.
+    """
+    RETRIES = 3  # draws to attempt before giving up on rows deleted since the ids were loaded
+
+    def __init__(self, model, group_column=None, group_key=None, table=None):
+        self.model = model
+        self.group_column = group_column
+        self.group_key = group_key or (lambda value: value)
+        self.ids = VersionedCache([table or model.__tablename__], self._load_ids)
+
+    def _load_ids(self):
+        ids_by_group = {None: array('q')}  # the None key holds every id
+        if self.group_column is None:
+            ids_by_group[None].extend(row[0] for row in db.session.query(self.model.id).order_by(self.model.id))
+            return ids_by_group
+
+        for row_id, group in db.session.query(self.model.id, self.group_column).order_by(self.model.id):
+            ids_by_group[None].append(row_id)
+            key = self.group_key(group)
+            if key is not None:
+                ids_by_group.setdefault(key, array('q')).append(row_id)
+        return ids_by_group
+
+    def sample(self, group=None):
+        """
+        Return a random row, optionally from one group only.
+
+        Args:
+            group (optional): Group value to sample from, None samples the whole table.
+
+        Returns:
+            db.Model: A random row, or None when there is nothing to sample.
+        """
+        key = self.group_key(group) if group is not None else None
+        if group is not None and key is None:
+            return None
+
+        for _ in range(self.RETRIES):
+            ids = self.ids.get().get(key)
+            if not ids:
+                return None
+            row = db.session.get(self.model, random.choice(ids))
+            if row is not None:
+                return row
+            # the row went away under us, reload the ids and draw again
+            self.ids.clear()
+        return None
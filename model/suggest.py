@@ -2,7 +2,9 @@ from __init__ import db, app
 from sqlalchemy import Column, Integer, String, Text
 from sqlalchemy.exc import IntegrityError
 from model.librarydb import Book
-import random
+from model.tableversion import TableVersion
+from model.sampler import RandomSampler
+from model.genre import assign_genre, backfill_genres
 
 class SuggestedBook(db.Model):
     __tablename__ = 'suggestions'
@@ -10,6 +12,7 @@ class SuggestedBook(db.Model):
     title = db.Column(db.String, unique=True, nullable=False)
     author = db.Column(db.String, nullable=False)
     genre = db.Column(db.String, nullable=False)
+    genre_id = db.Column(db.Integer, db.ForeignKey('genres.id'), index=True)  # Reference to Genre.id, kept in sync with genre
     description = db.Column(db.Text, nullable=True)
     cover_url = db.Column(db.String, nullable=True)
 
@@ -19,6 +22,7 @@ class SuggestedBook(db.Model):
         self.genre = genre
         self.description = description
         self.cover_url = cover_url
+        assign_genre(self, create=False)  # a suggestion's genre is free text, unknown genres stay unlinked
 
     def add_suggested_book(title, author, genre, description, cover_url):
         new_suggested_book = SuggestedBook(
@@ -32,7 +36,8 @@ class SuggestedBook(db.Model):
         new_book = Book(
             title=title,
             author=author,
-            genre=genre,
+            genre=new_suggested_book.genre,
+            genre_id=new_suggested_book.genre_id,
             description=description,
             cover_url=cover_url
         )
@@ -40,6 +45,8 @@ class SuggestedBook(db.Model):
         try:
             db.session.add(new_suggested_book)
             db.session.add(new_book)
+            TableVersion.bump('suggestions')
+            TableVersion.bump('books')
             db.session.commit()
         except Exception as e:
             db.session.rollback()
@@ -50,14 +57,14 @@ class SuggestedBook(db.Model):
     
     def get_random_suggested_book():
         try:
-            suggested_books_query = SuggestedBook.query.all()
-            return random.choice(suggested_books_query) if suggested_books_query else None
+            return suggestion_sampler.sample()
         except Exception as e:
             print(f"Error while fetching random book: {e}")
             return None
     
     def create(self):
         db.session.add(self)
+        TableVersion.bump('suggestions')
         db.session.commit()
         
     def read(self):
@@ -72,6 +79,7 @@ class SuggestedBook(db.Model):
             "title": self.title,
             "author": self.author,
             "genre": self.genre,
+            "genre_id": self.genre_id,
             "description": self.description,
             "cover_url": self.cover_url
         }
@@ -87,6 +95,8 @@ class SuggestedBook(db.Model):
             Exception: An error occurred when updating the object in the database.
         """
         try:
+            assign_genre(self, create=False)
+            TableVersion.bump('suggestions')
             db.session.commit()
         except Exception as e:
             db.session.rollback()
@@ -104,10 +114,11 @@ class SuggestedBook(db.Model):
         """    
         try:
             db.session.delete(self)
+            TableVersion.bump('suggestions')
             db.session.commit()
         except Exception as e:
             db.session.rollback()
-        raise Exception(f"An error occurred while deleting the object: {str(e)}") from e
+            raise Exception(f"An error occurred while deleting the object: {str(e)}") from e
     
     @staticmethod
     def restore(data):
@@ -126,6 +137,7 @@ class SuggestedBook(db.Model):
         for book_data in data:
             # Remove 'id' from the data if it exists (because id will be auto-generated)
             _ = book_data.pop('id', None)
+            _ = book_data.pop('genre_id', None)
 
             # Check if the book already exists based on title
             existing_book = SuggestedBook.query.filter_by(title=book_data.get("title")).first()
@@ -136,6 +148,8 @@ class SuggestedBook(db.Model):
                 existing_book.genre = book_data.get('genre', existing_book.genre)
                 existing_book.description = book_data.get('description', existing_book.description)
                 existing_book.cover_url = book_data.get('cover_url', existing_book.cover_url)
+                assign_genre(existing_book, create=False)
+                TableVersion.bump('suggestions')
                 db.session.commit()
                 restored_books[existing_book.id] = existing_book
             else:
@@ -146,6 +160,9 @@ class SuggestedBook(db.Model):
 
         return restored_books
 
+# Random suggestion picker for /api/suggest/random
+suggestion_sampler = RandomSampler(SuggestedBook)
+
 def initSuggest():
     with app.app_context():
         db.create_all()
@@ -167,7 +184,13 @@ def initSuggest():
             try:
                 if not Book.query.filter_by(title=suggestion.title).first() and not SuggestedBook.query.filter_by(title=suggestion.title).first():
                     db.session.add(suggestion)
+                    TableVersion.bump('suggestions')
                     db.session.commit()
             except IntegrityError:
                 # Fails with bad or duplicate data
-                db.session.rollback()
\ No newline at end of file
+                db.session.rollback()
+
+# Create the table and link suggestions made before the genre taxonomy
+with app.app_context():
+    db.create_all()
+    backfill_genres(SuggestedBook, create=False)
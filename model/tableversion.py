@@ -0,0 +1,247 @@
+## model, backend
+import threading
+import time
+from collections import OrderedDict
+from flask import g, has_app_context
+from sqlalchemy import update
+from __init__ import app, db
+from model.metrics import incr
+
+class TableVersion(db.Model):
+    """
+    TableVersion Model
+
+    Holds one counter per tracked table. The counter is bumped in the same transaction as every
+    write to that table, so each gunicorn worker can keep in-memory copies of data and find out
+    whether another worker changed it with a single primary key lookup.
+
+    Attributes:
+        name (db.Column): The name of the tracked table, e.g. 'books'.
+        version (db.Column): An integer that increases on every committed write to the table.
+    """
+    __tablename__ = 'table_versions'
+
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<TableVersion(name={self.name}, version={self.version})>"
+
+    @staticmethod
+    def bump(name):
+        """
+        Increment the version of a table inside the current transaction.
+
+        Call this before committing the write it describes, the new version becomes visible to
+        other workers at the same moment as the data.
+
+        Args:
+            name (str): The name of the tracked table.
+        """
+        result = db.session.execute(
+            update(TableVersion).where(TableVersion.name == name).values(version=TableVersion.version + 1)
+        )
+        if result.rowcount == 0:
+            db.session.add(TableVersion(name=name, version=1))
+        _request_versions().pop(name, None)
+        with _worker_lock:
+            _worker_versions.pop(name, None)  # this worker sees its own writes right away
+
+    @staticmethod
+    def get(name, max_age=None):
+        """
+        Get the current version of a table, read at most once per request.
+
+        Args:
+            name (str): The name of the tracked table.
+            max_age (float, optional): Reuse a version this worker read less than max_age seconds
+                ago, for hot paths that would otherwise read it on every request. Writes made by
+                this worker are still seen at once, other workers' writes within max_age seconds.
+
+        Returns:
+            int: The version, 0 when the table has never been written.
+        """
+        versions = _request_versions()
+        if name in versions:
+            return versions[name]
+        if max_age:
+            with _worker_lock:
+                checked = _worker_versions.get(name)
+            if checked and time.monotonic() - checked[0] < max_age:
+                return checked[1]
+        version = db.session.query(TableVersion.version).filter_by(name=name).scalar() or 0
+        versions[name] = version
+        with _worker_lock:
+            _worker_versions[name] = (time.monotonic(), version)
+        return version
+
+
+# versions read by this worker and when, for TableVersion.get(max_age=...)
+_worker_versions = {}
+_worker_lock = threading.Lock()
+
+
+def forget_worker_versions():
+    """Make TableVersion.get(max_age=...) read every version again, e.g. before counting a request's queries."""
+    with _worker_lock:
+        _worker_versions.clear()
+
+
+def _request_versions():
+    # versions read during the current request, so several caches checking 'books' cost one query
+    if not has_app_context():
+        return {}
+    if 'table_versions' not in g:
+        g.table_versions = {}
+    return g.table_versions
+
+
+class VersionedCache:
+    """
+    A per-worker cache of a value derived from one or more tables.
+
+    The value is built by `loader` the first time it is needed and rebuilt whenever the version of
+    one of the tables changes, which is how writes made by one gunicorn worker reach the others.
+
+    Args:
+        tables (list): Names of the tables the value is derived from.
+        loader (function): Builds the value, called with no arguments inside an app context.
+        name (str, optional): Counts hits and misses as '<name>.hits' and '<name>.misses' in model/metrics.py.
+    """
+    def __init__(self, tables, loader, name=None):
+        self.tables = list(tables)
+        self.loader = loader
+        self.name = name
+        self._version = None
+        self._value = None
+        self._lock = threading.Lock()
+
+    def version(self):
+        return tuple(TableVersion.get(name) for name in self.tables)
+
+    def get(self):
+        # the version is read before loading, so a write racing with the load only causes an extra reload
+        version = self.version()
+        hit = version == self._version
+        if not hit:
+            with self._lock:
+                if version != self._version:
+                    self._value = self.loader()
+                    self._version = version
+        if self.name:
+            incr(f"{self.name}.{'hits' if hit else 'misses'}")
+        return self._value
+
+    def clear(self):
+        with self._lock:
+            self._version = None
+            self._value = None
+
+
+class VersionedLRU:
+    """
+    A per-worker, size-bounded cache of many values derived from the same tables.
+
+    Entries are kept in least recently used order and the whole cache is emptied when the version
+    of one of the tables changes, so a write on any worker invalidates every entry on every worker.
+
+    Args:
+        name (str): Counts hits and misses as '<name>.hits' and '<name>.misses' in model/metrics.py.
+        tables (list): Names of the tables the values are derived from.
+        maxsize (int): Number of entries kept, the least recently used entry is dropped first.
+        max_age (float, optional): Check the table versions at most once per max_age seconds, see
+            TableVersion.get.
+    """
+    def __init__(self, name, tables, maxsize=1024, max_age=None):
+        self.name = name
+        self.tables = list(tables)
+        self.maxsize = maxsize
+        self.max_age = max_age
+        self._version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def version(self):
+        return tuple(TableVersion.get(name, self.max_age) for name in self.tables)
+
+    def _check_version(self):
+        version = self.version()
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._entries.clear()
+                    self._version = version
+                    incr(f'{self.name}.invalidations')
+        return version
+
+    def get(self, key, loader):
+        """
+        Get the value cached under key, building it with loader() on a miss.
+
+        Args:
+            key: Any hashable value identifying the entry.
+            loader (function): Builds the value, called with no arguments inside an app context.
+        """
+        version = self._check_version()
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                incr(f'{self.name}.hits')
+                return self._entries[key]
+        incr(f'{self.name}.misses')
+        value = loader()
+        self.put(key, value, version)
+        return value
+
+    def get_many(self, keys, loader):
+        """
+        Get the values cached under several keys, building all the missing ones with a single loader call.
+
+        Args:
+            keys (list): Hashable keys.
+            loader (function): Called with the list of missing keys, returns a dictionary of key -> value.
+                Keys missing from its result are treated as not existing and are not cached.
+
+        Returns:
+            dict: key -> value for every key that exists.
+        """
+        version = self._check_version()
+        found, missing = {}, []
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    found[key] = self._entries[key]
+                else:
+                    missing.append(key)
+        incr(f'{self.name}.hits', len(found))
+        if missing:
+            incr(f'{self.name}.misses', len(missing))
+            loaded = loader(missing)
+            for key, value in loaded.items():
+                self.put(key, value, version)
+            found.update(loaded)
+        return found
+
+    def put(self, key, value, version=None):
+        # a value loaded under an older version is dropped rather than cached
+        with self._lock:
+            if version is not None and version != self._version:
+                return
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._version = None
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# create the table before it is used
+with app.app_context():
+    db.create_all()
@@ -0,0 +1,127 @@
+## model, backend
+from datetime import datetime, timezone
+from sqlalchemy import delete
+from __init__ import app, db
+from model.dbutil import increment
+from model.tableversion import TableVersion, VersionedLRU
+
+# Token revocation
+# Every JWT carries the token_version of its user at the time it was minted. Revoking a user's
+# sessions (an admin revoke, a role change, a password reset) adds one to the user's version, which
+# makes every token minted before it invalid. Users who never revoked anything have no row and
+# version 0. Logging out revokes only the token used, by its jti claim, other devices stay logged in;
+# a revoked jti is kept until the token would have expired anyway.
+# The versions and the set of revoked jtis are cached per worker and the caches are emptied through
+# the 'token_versions' and 'revoked_tokens' table versions, checked at most once per
+# VERSION_CHECK_SECONDS, so a revoked token stops working on other workers within that time and on
+# the revoking worker at once.
+
+CACHE_SIZE = 4096            # users kept per worker
+VERSION_CHECK_SECONDS = 1.0  # how long another worker may still accept a revoked token
+
+
+class TokenVersion(db.Model):
+    """
+    TokenVersion Model
+
+    Attributes:
+        user_id (db.Column): The User.id.
+        version (db.Column): Tokens minted with a lower token_version are revoked.
+    """
+    __tablename__ = 'token_versions'
+
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<TokenVersion(user_id={self.user_id}, version={self.version})>"
+
+
+class RevokedToken(db.Model):
+    """
+    RevokedToken Model
+
+    Attributes:
+        jti (db.Column): The jti claim of a logged out token.
+        expires_at (db.Column): The token's exp, the row is useless afterwards.
+    """
+    __tablename__ = 'revoked_tokens'
+
+    jti = db.Column(db.String(32), primary_key=True)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<RevokedToken(jti={self.jti}, expires_at={self.expires_at})>"
+
+
+token_versions = VersionedLRU('token_versions', ['token_versions'], maxsize=CACHE_SIZE, max_age=VERSION_CHECK_SECONDS)
+
+
+def token_version(user_id):
+    """
+    The current token version of a user, from the worker's cache when possible.
+
+    Args:
+        user_id (int): The User.id.
+
+    Returns:
+        int: The version new tokens are minted with, 0 if the user never revoked a token.
+    """
+    def load():
+        return db.session.query(TokenVersion.version).filter_by(user_id=user_id).scalar() or 0
+
+    return token_versions.get(user_id, load)
+
+
+# one entry, the jtis of every unexpired logged out token, few enough to hold in memory
+revoked_tokens = VersionedLRU('revoked_tokens', ['revoked_tokens'], maxsize=1, max_age=VERSION_CHECK_SECONDS)
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def is_token_revoked(jti):
+    """
+    Whether a token was logged out, from the worker's cache when possible.
+
+    Args:
+        jti (str): The token's jti claim.
+    """
+    def load():
+        return frozenset(row[0] for row in db.session.query(RevokedToken.jti).filter(RevokedToken.expires_at > _utcnow()))
+
+    return jti in revoked_tokens.get('revoked', load)
+
+
+def revoke_token(jti, expires_at):
+    """
+    Revoke one token, e.g. on logout, and forget the revoked tokens that have expired since.
+
+    Runs inside the caller's transaction, the caller commits.
+
+    Args:
+        jti (str): The token's jti claim.
+        expires_at (datetime): The token's exp, in UTC.
+    """
+    db.session.execute(delete(RevokedToken).where(RevokedToken.expires_at <= _utcnow()))
+    db.session.merge(RevokedToken(jti=jti, expires_at=expires_at.astimezone(timezone.utc).replace(tzinfo=None)))
+    TableVersion.bump('revoked_tokens')
+
+
+def revoke_tokens(user_id):
+    """
+    Revoke every token minted so far for a user.
+
+    Runs inside the caller's transaction, the caller commits.
+
+    Args:
+        user_id (int): The User.id.
+    """
+    increment(TokenVersion, {'user_id': user_id}, version=1)
+    TableVersion.bump('token_versions')
+
+
+# create the table before it is used
+with app.app_context():
+    db.create_all()
@@ -0,0 +1,161 @@
+## model, backend
+import re
+import threading
+import time
+from sqlalchemy import delete
+from __init__ import app, db
+from model.bookevents import on
+from model.dbutil import increment
+from model.librarydb import Book
+from model.metrics import incr
+
+# Trending books
+# Every reaction, wishlist entry, comment and saved recommendation adds its weight to the book's
+# counter for the current hour, so the activity table holds one row per book and active hour instead
+# of one per event. A window's ranking sums the book's hourly buckets with exponential decay, an
+# hour that is half_life hours old counts half as much as the current one, and is cached per worker
+# for a few seconds. Deleting a reaction or comment does not take activity back.
+
+# how much each kind of activity says a book is being talked about
+ACTIVITY_WEIGHTS = {'reaction': 1.0, 'wishlist': 2.0, 'comment': 2.0, 'bookrec': 1.0}
+
+RETENTION_HOURS = 30 * 24  # buckets older than the longest window are deleted
+MAX_WINDOW_HOURS = RETENTION_HOURS
+DEFAULT_WINDOW = '24h'
+HALF_LIFE_FRACTION = 0.25  # a window's half life is a quarter of its length
+RANKING_SIZE = 100         # books ranked and cached per window
+CACHE_SECONDS = 30         # how long a worker reuses a ranking
+
+
+class BookActivity(db.Model):
+    """
+    BookActivity Model
+
+    The weighted activity of one book during one hour.
+
+    Attributes:
+        hour (db.Column): Hours since the Unix epoch, the bucket.
+        book_id (db.Column): The Book.id.
+        score (db.Column): The summed ACTIVITY_WEIGHTS of the hour's events.
+    """
+    __tablename__ = 'book_activity'
+
+    # hour first, a window is one range scan of the primary key
+    hour = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    book_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    score = db.Column(db.Float, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<BookActivity(hour={self.hour}, book_id={self.book_id}, score={self.score})>"
+
+
+def current_hour(now=None):
+    return int((now if now is not None else time.time()) // 3600)
+
+
+def parse_window(text):
+    """
+    Parse a window such as '24h' or '7d' into hours.
+
+    Raises:
+        ValueError: The window is malformed or longer than MAX_WINDOW_HOURS.
+    """
+    match = re.fullmatch(r'(\d+)([hd])', (text or '').strip().lower())
+    if not match:
+        raise ValueError("Window must look like '24h' or '7d'")
+    hours = int(match.group(1)) * (24 if match.group(2) == 'd' else 1)
+    if not 1 <= hours <= MAX_WINDOW_HOURS:
+        raise ValueError(f'Window must be between 1h and {MAX_WINDOW_HOURS // 24}d')
+    return hours
+
+
+_pruned_hour = None
+
+def record_activity(book_ids, kind, now=None):
+    """
+    Add one event's weight to the current hour of some books, inside the caller's transaction.
+
+    Args:
+        book_ids (iterable): The books the event is about.
+        kind (str): A key of ACTIVITY_WEIGHTS.
+        now (float, optional): Unix time of the event, defaults to now.
+    """
+    global _pruned_hour
+    weight = ACTIVITY_WEIGHTS[kind]
+    hour = current_hour(now)
+    for book_id in {book_id for book_id in book_ids if book_id}:
+        increment(BookActivity, {'hour': hour, 'book_id': book_id}, score=weight)
+    if _pruned_hour != hour:
+        # once per hour and worker
+        db.session.execute(delete(BookActivity).where(BookActivity.hour <= hour - RETENTION_HOURS))
+        _pruned_hour = hour
+
+
+def rank_books(window_hours, now=None, limit=RANKING_SIZE):
+    """
+    Rank books by their decayed activity over the last window_hours hours.
+
+    Returns:
+        list: (book id, score) pairs, best first.
+    """
+    hour = current_hour(now)
+    half_life = max(1.0, window_hours * HALF_LIFE_FRACTION)
+    scores = {}
+    rows = db.session.query(BookActivity.hour, BookActivity.book_id, BookActivity.score) \
+        .filter(BookActivity.hour > hour - window_hours, BookActivity.hour <= hour)
+    for bucket, book_id, score in rows:
+        scores[book_id] = scores.get(book_id, 0.0) + score * 0.5 ** ((hour - bucket) / half_life)
+    ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+    return [(book_id, round(score, 4)) for book_id, score in ranked]
+
+
+_rankings = {}  # window hours -> (expires at, ranking)
+_rankings_lock = threading.Lock()
+
+def trending_books(window_hours):
+    """
+    The cached ranking of a window, recomputed at most every CACHE_SECONDS per worker.
+
+    Returns:
+        list: (book id, score) pairs, best first, at most RANKING_SIZE.
+    """
+    now = time.time()
+    with _rankings_lock:
+        cached = _rankings.get(window_hours)
+    if cached and cached[0] > now:
+        incr('trending.hits')
+        return cached[1]
+    incr('trending.misses')
+    ranking = rank_books(window_hours, now)
+    with _rankings_lock:
+        _rankings[window_hours] = (now + CACHE_SECONDS, ranking)
+    return ranking
+
+
+def _books_titled(title):
+    return [row[0] for row in db.session.query(Book.id).filter(Book.title == title)]
+
+
+@on('reaction.created')
+def _reaction_created(emotion):
+    record_activity(_books_titled(emotion.title_id), 'reaction')
+
+
+@on('comment.created')
+def _comment_created(comment):
+    record_activity([comment.book_id], 'comment')
+
+
+@on('wishlist.added')
+def _wishlist_added(item):
+    record_activity([item.book_id], 'wishlist')
+
+
+@on('bookrec.saved')
+def _bookrec_saved(record):
+    record_activity([row[0] for row in db.session.query(Book.id).filter_by(title=record.title, author=record.author)], 'bookrec')
+
+
+# create the table before it is used
+with app.app_context():
+    db.create_all()
@@ -3,11 +3,13 @@ from flask import current_app
 from flask_login import UserMixin
 from datetime import date
 from sqlalchemy.exc import IntegrityError
-from werkzeug.security import generate_password_hash, check_password_hash
 import os
 import json
 
 from __init__ import app, db
+from model.tableversion import TableVersion
+from model.tokenversion import revoke_tokens
+from model.passwords import hash_password, verify_password, check_throttle, record_login, UID_MAX_LENGTH
 
 """ Helper Functions """
 
@@ -48,8 +50,14 @@ class User(db.Model, UserMixin):
         _password (Column): A string representing the hashed password of the user. It is not unique and cannot be null.
         _role (Column): A string representing the user's role within the application. Defaults to "User".
         _pfp (Column): A string representing the path to the user's profile picture. It can be null.
+        _version (Column): An integer increased on every write to the user, so copies of it kept in sessions can be revalidated.
     """
     __tablename__ = 'users'
+    # sort and filter keys of the user listings, see model/userdirectory.py
+    __table_args__ = (
+        db.Index('ix_users_name', '_name', 'id'),
+        db.Index('ix_users_role', '_role', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     _name = db.Column(db.String(255), unique=False, nullable=False)
@@ -59,6 +67,7 @@ class User(db.Model, UserMixin):
     _role = db.Column(db.String(20), default="User", nullable=False)
     _pfp = db.Column(db.String(255), unique=False, nullable=True)
     _car = db.Column(db.String(255), unique=False, nullable=True)
+    _version = db.Column(db.Integer, nullable=True, default=0)  # bumped on every write, see model/usercache.py
    
     posts = db.relationship('Post', backref='author', lazy=True)
                                  
@@ -82,6 +91,17 @@ class User(db.Model, UserMixin):
         self._pfp = pfp
         self._car = car
 
+    def changed(self):
+        """
+        Record a write to the user, call it before committing the change.
+
+        Bumps the users table version, which empties the workers' user caches, and the user's own
+        version, which makes copies of the user kept in sessions stale.
+        """
+        # incremented in SQL, this copy of the user may be older than the row (see model/usercache.py)
+        self._version = db.func.coalesce(User._version, 0) + 1
+        TableVersion.bump('users')
+
     # UserMixin/Flask-Login requires a get_id method to return the id as a string
     def get_id(self):
         """
@@ -218,14 +238,17 @@ class User(db.Model, UserMixin):
 
     def set_password(self, password):
         """
-        Sets the user's password (hashed).
+        Sets the user's password (hashed in the worker's hashing pool, see model/passwords.py).
         
         Args:
             password (str): The new password for the user.
+
+        Raises:
+            PasswordPoolBusy: 503, too many passwords are being hashed.
         """
         if not password or password == "":
             password=app.config["DEFAULT_PASSWORD"]
-        self._password = generate_password_hash(password, "pbkdf2:sha256", salt_length=10)
+        self._password = hash_password(password)
 
     def is_password(self, password):
         """
@@ -236,8 +259,41 @@ class User(db.Model, UserMixin):
         
         Returns:
             bool: True if the password matches, False otherwise.
+
+        Raises:
+            PasswordPoolBusy: 503, too many passwords are being hashed.
+        """
+        return verify_password(self._password, password)
+
+    @staticmethod
+    def authenticate(uid, password, ip=None):
         """
-        return check_password_hash(self._password, password)
+        Log in: find the user with a uid and check the password.
+
+        A uid with too many failed logins in a row from the address, or an address with too many
+        failed logins, is refused before the user is loaded or the password hashed. Failures are
+        counted, see model/passwords.py.
+
+        Args:
+            uid (str): The uid typed by the user.
+            password (str): The password typed by the user.
+            ip (str, optional): The client address, request.remote_addr.
+
+        Returns:
+            User: The user, None if the uid or the password is wrong.
+
+        Raises:
+            LoginThrottled: 429, the uid or the address failed too often, retry later.
+            PasswordPoolBusy: 503, too many passwords are being hashed, retry shortly.
+        """
+        if not uid or len(uid) > UID_MAX_LENGTH:
+            return None
+        failures = check_throttle(uid, ip)
+        user = User.query.filter_by(_uid=uid).first()
+        success = user is not None and user.is_password(password)
+        if failures or not success:
+            record_login(uid, success, ip)
+        return user if success else None
 
     def __str__(self):
         """
@@ -262,10 +318,15 @@ class User(db.Model, UserMixin):
     def role(self, role):
         """
         Sets the user's role.
+
+        Tokens carry the role, so a saved user's tokens are revoked when it changes.
         
         Args:
             role (str): The new role for the user.
         """
+        if role != self._role and self.id is not None:
+            revoke_tokens(self.id)
+            self.changed()
         self._role = role
 
     def is_admin(self):
@@ -315,6 +376,7 @@ class User(db.Model, UserMixin):
         """
         try:
             db.session.add(self)  # add prepares to persist person object to Users table
+            TableVersion.bump('users')
             db.session.commit()  # SqlAlchemy "unit of work pattern" requires a manual commit
             if inputs:
                 self.update(inputs)
@@ -373,6 +435,7 @@ class User(db.Model, UserMixin):
         self.set_email()
 
         try:
+            self.changed()
             db.session.commit()
         except IntegrityError:
             db.session.rollback()
@@ -388,6 +451,7 @@ class User(db.Model, UserMixin):
         """
         try:
             db.session.delete(self)
+            TableVersion.bump('users')
             db.session.commit()
         except IntegrityError:
             db.session.rollback()
@@ -417,6 +481,7 @@ class User(db.Model, UserMixin):
         Deletes the user's profile picture from the user record.
         """
         self.pfp = None
+        self.changed()
         db.session.commit()
         
     def save_car(self, image_data, filename):
@@ -443,6 +508,7 @@ class User(db.Model, UserMixin):
         Deletes the user's profile picture from the user record.
         """
         self.car = None
+        self.changed()
         db.session.commit()
         
     def set_uid(self, new_uid=None):
@@ -461,6 +527,7 @@ class User(db.Model, UserMixin):
         if new_uid and new_uid != self._uid:
             self._uid = new_uid
             # Commit the UID change to the database
+            self.changed()
             db.session.commit()
 
         # If the UID has changed, update the directory name
@@ -0,0 +1,120 @@
+## model, backend
+from flask import session
+from flask_login import user_logged_out
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+from __init__ import app, db
+from model.dbutil import add_column_if_missing
+from model.metrics import gauge, incr
+from model.tableversion import TableVersion, VersionedLRU
+from model.user import User
+
+# Authenticated user cache
+# Every request guarded by token_required needs the User of its token. Each worker keeps the
+# column values of recently seen users keyed by uid and attaches a User built from them to the
+# request's session without a query. Any committed write to the users table (User.create, update,
+# delete and the picture helpers bump its version) empties the cache on every worker; the version
+# is checked at most once per VERSION_CHECK_SECONDS, so another worker's change to a user is seen
+# within that time.
+#
+# Server-rendered pages (Flask-Login) keep a copy of the few columns the pages show of the logged in
+# user in the signed session cookie instead; the cookie is signed but readable, so nothing private
+# goes in it. The copy is trusted while the users table version is the one it was last checked
+# against (read at most once per VERSION_CHECK_SECONDS, as for tokens), so a role change or a
+# deleted user is seen as quickly as by token_required. When any user changed, the copy is
+# revalidated by comparing the user's _version with one primary key lookup and reloaded only if
+# this user changed.
+
+CACHE_SIZE = 4096            # users kept per worker
+VERSION_CHECK_SECONDS = 1.0  # how stale another worker's user change may be
+SESSION_KEY = '_user_snapshot'
+SESSION_FIELDS = ('id', '_uid', '_name', '_role', '_version')  # what pages read of current_user, and its version
+
+auth_users = VersionedLRU('auth_users', ['users'], maxsize=CACHE_SIZE, max_age=VERSION_CHECK_SECONDS)
+gauge('auth_users.size', lambda: len(auth_users))
+
+
+def _snapshot(user, fields=None):
+    # the user's column values, all a User needs to be rebuilt without a query
+    return {attribute.key: getattr(user, attribute.key) for attribute in inspect(User).column_attrs
+            if fields is None or attribute.key in fields}
+
+
+def _attach(snapshot):
+    # build a persistent User from a snapshot and add it to the current session, no SQL is emitted;
+    # relationships such as posts and columns missing from the snapshot still load lazily
+    user = User.__mapper__.class_manager.new_instance()
+    for key, value in snapshot.items():
+        setattr(user, key, value)
+    make_transient_to_detached(user)
+    user = db.session.merge(user, load=False)
+    missing = [attribute.key for attribute in inspect(User).column_attrs if attribute.key not in snapshot]
+    if missing:
+        db.session.expire(user, missing)
+    return user
+
+
+def get_user_by_uid(uid):
+    """
+    The User with a uid, from the worker's cache when possible.
+
+    The returned User belongs to the current session like a queried one, so it can be read,
+    updated or deleted as usual.
+
+    Args:
+        uid (str): The user's uid.
+
+    Returns:
+        User: The user, None if no user has that uid.
+    """
+    def load():
+        user = User.query.filter_by(_uid=uid).first()
+        return _snapshot(user) if user else None
+
+    snapshot = auth_users.get(('uid', uid), load)
+    return _attach(snapshot) if snapshot else None
+
+
+def load_session_user(user_id):
+    """
+    The Flask-Login user_loader: the logged in User, from the session's copy when possible.
+
+    Only SESSION_FIELDS are kept in the session, other columns load on first use.
+
+    Args:
+        user_id (int): The User.id stored by Flask-Login.
+
+    Returns:
+        User: The user, None if it was deleted.
+    """
+    users_version = TableVersion.get('users', VERSION_CHECK_SECONDS)
+    cached = session.get(SESSION_KEY)
+    if cached and cached.get('id') == user_id:
+        if cached.get('users_version') == users_version:
+            incr('session_users.hits')
+            return _attach(cached['user'])
+        row = db.session.query(User._version).filter(User.id == user_id).first()
+        if row is not None and (row[0] or 0) == (cached['user'].get('_version') or 0):
+            incr('session_users.revalidated')
+            snapshot = {key: value for key, value in cached['user'].items() if key in SESSION_FIELDS}
+            session[SESSION_KEY] = {'id': user_id, 'users_version': users_version, 'user': snapshot}
+            return _attach(snapshot)
+
+    incr('session_users.misses')
+    user = db.session.get(User, user_id)
+    if user is None:
+        session.pop(SESSION_KEY, None)
+        return None
+    session[SESSION_KEY] = {'id': user_id, 'users_version': users_version, 'user': _snapshot(user, SESSION_FIELDS)}
+    return user
+
+
+@user_logged_out.connect_via(app)
+def _forget_session_user(sender, user=None, **kwargs):
+    session.pop(SESSION_KEY, None)
+
+
+# databases created before User._version get the column, null counts as version 0
+with app.app_context():
+    db.create_all()
+    add_column_if_missing(User.__tablename__, User.__table__.c._version)
@@ -0,0 +1,139 @@
+## model, backend
+from sqlalchemy import or_, and_
+from __init__ import app, db
+from model.dbutil import create_indexes
+from model.user import User
+
+# User listing shared by the admin tables (/users/table, /users/table2, /users/export) and /api/users
+# Pages are read with keyset (cursor) pagination like the catalog (model/catalog.py), sorted and
+# filtered on indexed columns only: id, the unique uid, and (name, id) / (role, id).
+
+USER_COLUMNS = {
+    'id': User.id,
+    'uid': User._uid,
+    'name': User._name,
+    'email': User._email,
+    'role': User._role,
+    'pfp': User._pfp,
+    'car': User._car,
+}
+USER_FIELDS = tuple(USER_COLUMNS)  # the keys of User.read()
+SORT_KEYS = ('id', 'uid', 'name')
+ORDERS = ('asc', 'desc')
+BATCH_SIZE = 500  # rows read per query when streaming every user
+PREFIX_END = '\U0010ffff'  # sorts after any text, search <= value < search + PREFIX_END is a prefix match
+
+
+def parse_fields(value, default=USER_FIELDS):
+    """
+    Parse a sparse fieldset such as 'id,uid,name'.
+
+    Raises:
+        ValueError: A field is not a user field.
+    """
+    if not value:
+        return list(default)
+    fields = list(dict.fromkeys(field.strip() for field in value.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in USER_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. Allowed fields: {', '.join(USER_FIELDS)}")
+    return fields
+
+
+def _filtered(query, search=None, role=None, user_id=None):
+    if search:
+        # a prefix as a range, which the uid and name indexes answer (SQLite's LIKE is case-insensitive
+        # and would scan the table), so the search is case-sensitive
+        end = search + PREFIX_END
+        query = query.filter(or_(and_(User._uid >= search, User._uid < end),
+                                 and_(User._name >= search, User._name < end)))
+    if role:
+        query = query.filter(User._role == role)
+    if user_id is not None:
+        query = query.filter(User.id == user_id)
+    return query
+
+
+def _page_query(sort, order, after, fields, limit, **filters):
+    if sort not in SORT_KEYS:
+        raise ValueError(f"sort must be one of: {', '.join(SORT_KEYS)}")
+    if order not in ORDERS:
+        raise ValueError(f"order must be one of: {', '.join(ORDERS)}")
+    # the sort key and id are always read, the cursor is built from them
+    names = list(dict.fromkeys(['id', sort] + list(fields)))
+    query = _filtered(db.session.query(*[USER_COLUMNS[name].label(name) for name in names]), **filters)
+    column = USER_COLUMNS[sort]
+    descending = order == 'desc'
+    if after is not None:
+        sort_value, user_id = after
+        if sort == 'id':
+            query = query.filter(User.id < user_id if descending else User.id > user_id)
+        elif descending:
+            query = query.filter(or_(column < sort_value, and_(column == sort_value, User.id < user_id)))
+        else:
+            query = query.filter(or_(column > sort_value, and_(column == sort_value, User.id > user_id)))
+    keys = [User.id] if sort == 'id' else [column, User.id]
+    query = query.order_by(*[key.desc() if descending else key for key in keys])
+    return [row._asdict() for row in query.limit(limit).all()]
+
+
+def user_page(sort='id', order='asc', cursor=None, limit=50, fields=USER_FIELDS, search=None, role=None, user_id=None):
+    """
+    Read one page of users.
+
+    Args:
+        sort (str): 'id', 'uid' or 'name'.
+        order (str): 'asc' or 'desc'.
+        cursor (str, optional): The next_cursor of the previous page.
+        limit (int): Page size.
+        fields (list): User fields to return, see USER_FIELDS.
+        search (str, optional): Only users whose uid or name starts with this text, case-sensitive.
+        role (str, optional): Only users with this role.
+        user_id (int, optional): Only this user, for users who may only see themselves.
+
+    Returns:
+        tuple: (list of user dictionaries with only the requested fields, cursor of the next page or None)
+
+    Raises:
+        ValueError: The sort, order or cursor is invalid.
+    """
+    # imported here, model.catalog loads the library models, which need every model defined
+    from model.catalog import decode_cursor, encode_cursor
+
+    after = decode_cursor(cursor) if cursor else None
+    rows = _page_query(sort, order, after, fields, limit + 1, search=search, role=role, user_id=user_id)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last[sort], last['id'])
+    return [{field: row[field] for field in fields} for row in rows], next_cursor
+
+
+def iter_users(sort='id', order='asc', fields=USER_FIELDS, search=None, role=None, user_id=None):
+    """
+    Yield every matching user, reading BATCH_SIZE rows at a time so memory stays flat.
+
+    Raises:
+        ValueError: The sort or order is invalid, raised when the first user is read.
+    """
+    after = None
+    while True:
+        rows = _page_query(sort, order, after, fields, BATCH_SIZE, search=search, role=role, user_id=user_id)
+        for row in rows:
+            yield {field: row[field] for field in fields}
+        if len(rows) < BATCH_SIZE:
+            return
+        last = rows[-1]
+        after = (last[sort], last['id'])
+
+
+def count_users(search=None, role=None, user_id=None):
+    """The number of users matching the filters of user_page."""
+    return _filtered(db.session.query(db.func.count(User.id)), search=search, role=role, user_id=user_id).scalar()
+
+
+# create the sort and filter indexes on databases created before them
+with app.app_context():
+    db.create_all()
+    create_indexes(User)
@@ -0,0 +1,116 @@
+## model, backend
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from __init__ import app, db
+from model.passwords import hash_passwords, UID_MAX_LENGTH
+from model.tableversion import TableVersion
+from model.user import User
+
+# Bulk user provisioning
+# Creating users one at a time hashes and commits per user, a class roster takes minutes and holds
+# the SQLite write lock throughout. provision_users() validates the whole roster first, finds the
+# uids that already exist with one IN query, hashes the new users' passwords on every core, then
+# inserts them in transactions of PROVISION_BATCH_SIZE users.
+
+PROVISION_BATCH_SIZE = 500
+
+
+def _validate(index, row, seen):
+    # the single user endpoint's rules, plus duplicates within the roster
+    if not isinstance(row, dict):
+        return 'Expected an object with name and uid'
+    name, uid = row.get('name'), row.get('uid')
+    if not isinstance(name, str) or len(name) < 2:
+        return 'Name is missing, or is less than 2 characters'
+    if not isinstance(uid, str) or len(uid) < 2:
+        return 'User ID is missing, or is less than 2 characters'
+    if len(uid) > UID_MAX_LENGTH:
+        return f'User ID is longer than {UID_MAX_LENGTH} characters'
+    if uid in seen:
+        return f'User ID {uid} is repeated, first at row {seen[uid]}'
+    seen[uid] = index
+    return None
+
+
+def _insert_batch(batch):
+    # one INSERT for the batch; a uid created meanwhile by someone else fails it, then each row is
+    # inserted and committed on its own so only that row is reported (no savepoints, pysqlite does
+    # not open a transaction before a SAVEPOINT)
+    values = [values for _, values in batch]
+    try:
+        db.session.execute(insert(User), values)
+        TableVersion.bump('users')
+        db.session.commit()
+        return {}
+    except IntegrityError:
+        db.session.rollback()
+    failed = {}
+    for index, row in batch:
+        try:
+            db.session.execute(insert(User), [row])
+            TableVersion.bump('users')
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            failed[index] = f"User ID {row['_uid']} is duplicate"
+    return failed
+
+
+def provision_users(rows, dry_run=False, batch_size=PROVISION_BATCH_SIZE):
+    """
+    Create many users at once.
+
+    Each row is a dictionary with a name and a uid, and optionally a password (DEFAULT_PASSWORD
+    when missing) and a pfp, as for the single user endpoint.
+
+    Args:
+        rows (list): The users to create.
+        dry_run (bool): Validate and check for existing uids only, nothing is hashed or written.
+        batch_size (int): Users inserted per transaction.
+
+    Returns:
+        list: One result per row, in order, a dictionary with the row 'index', 'uid', a 'status'
+            ('created', 'would_create', 'exists' or 'invalid'), the new 'id' of a created user and
+            a 'message' for the others.
+    """
+    results, seen, valid = [], {}, []
+    for index, row in enumerate(rows):
+        error = _validate(index, row, seen)
+        uid = row.get('uid') if isinstance(row, dict) else None
+        results.append({'index': index, 'uid': uid, 'status': 'invalid' if error else None, 'message': error})
+        if not error:
+            valid.append(index)
+
+    existing = set()
+    if valid:
+        uids = [rows[index]['uid'] for index in valid]
+        existing = {row[0] for row in db.session.query(User._uid).filter(User._uid.in_(uids))}
+    new = []
+    for index in valid:
+        if rows[index]['uid'] in existing:
+            results[index].update(status='exists', message=f"User ID {rows[index]['uid']} is duplicate")
+        else:
+            new.append(index)
+
+    if dry_run:
+        for index in new:
+            results[index]['status'] = 'would_create'
+        return results
+
+    hashes = hash_passwords([rows[index].get('password') or app.config['DEFAULT_PASSWORD'] for index in new])
+    for start in range(0, len(new), batch_size):
+        batch = []
+        for index, password_hash in zip(new[start:start + batch_size], hashes[start:start + batch_size]):
+            row = rows[index]
+            batch.append((index, {'_name': row['name'], '_uid': row['uid'], '_email': '?', '_password': password_hash,
+                                  '_role': 'User', '_pfp': row.get('pfp') or '', '_car': ''}))
+        failed = _insert_batch(batch)
+        for index, message in failed.items():
+            results[index].update(status='exists', message=message)
+
+    created = [index for index in new if results[index]['status'] is None]
+    if created:
+        ids = dict(db.session.query(User._uid, User.id).filter(User._uid.in_([rows[index]['uid'] for index in created])))
+        for index in created:
+            results[index].update(status='created', id=ids.get(rows[index]['uid']))
+    return results
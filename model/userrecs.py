@@ -0,0 +1,196 @@
+## model, backend
+import time
+import numpy as np
+from sqlalchemy import delete, insert
+from __init__ import app, db
+from model.tableversion import TableVersion, VersionedCache
+
+# Collaborative filtering ("readers who liked this also liked")
+# A batch job turns wishlist entries, emotion reactions and comments into a sparse user x book
+# matrix, scores every book for every user by item-item cosine similarity, and stores each user's
+# top books as one row. Serving a user's list is then a single primary key lookup.
+
+POPULAR_USER_ID = 0  # the row holding the most popular books, the fallback for users without history
+TOP_N = 20           # books stored per user
+NEIGHBORS = 50       # most similar books kept per book when scoring
+
+# how strongly each kind of signal says a reader cares about a book
+SIGNAL_WEIGHTS = {'wishlist': 1.0, 'emotion': 1.0, 'comment': 2.0}
+
+
+class UserRecommendation(db.Model):
+    """
+    UserRecommendation Model
+
+    The precomputed recommendations of one user, written by build_user_recommendations.
+
+    Attributes:
+        user_id (db.Column): The User.id, or POPULAR_USER_ID for the popularity fallback.
+        book_ids (db.Column): Recommended book ids, best first.
+        scores (db.Column): The score of each recommended book.
+        built_at (db.Column): Unix time of the batch job that wrote the row.
+    """
+    __tablename__ = 'user_recommendations'
+
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    book_ids = db.Column(db.JSON, nullable=False)
+    scores = db.Column(db.JSON, nullable=False)
+    built_at = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return f"<UserRecommendation(user_id={self.user_id}, books={len(self.book_ids)})>"
+
+    def read(self):
+        return {
+            'user_id': self.user_id,
+            'book_ids': self.book_ids,
+            'scores': self.scores,
+            'built_at': self.built_at
+        }
+
+
+def load_interactions():
+    """
+    Collect every (user id, book id, weight) signal.
+
+    Wishlists store the user's uid and reactions store the book's title, both are mapped to ids.
+
+    Returns:
+        list: (user id, book id, weight) tuples, a user and book may appear several times.
+    """
+    from model.user import User
+    from model.librarydb import Book
+    from model.wishlist import Wishlist
+    from model.emotion import Emotion
+    from model.commentsdb import Comments
+
+    user_ids = {uid: user_id for user_id, uid in db.session.query(User.id, User._uid)}
+    book_ids = {title: book_id for book_id, title in db.session.query(Book.id, Book.title)}
+
+    interactions = []
+    for uid, book_id in db.session.query(Wishlist.user_uid, Wishlist.book_id):
+        if uid in user_ids:
+            interactions.append((user_ids[uid], book_id, SIGNAL_WEIGHTS['wishlist']))
+    for user_id, title in db.session.query(Emotion.user_id, Emotion.title_id):
+        if title in book_ids and str(user_id).isdigit():
+            interactions.append((int(user_id), book_ids[title], SIGNAL_WEIGHTS['emotion']))
+    for user_id, book_id in db.session.query(Comments.user_id, Comments.book_id):
+        interactions.append((user_id, book_id, SIGNAL_WEIGHTS['comment']))
+    return interactions
+
+
+def _top(scores, n):
+    # indices of the n largest positive scores, best first
+    candidates = np.flatnonzero(scores > 0)
+    if len(candidates) > n:
+        candidates = candidates[np.argpartition(-scores[candidates], n - 1)[:n]]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+def build_user_recommendations(top_n=TOP_N, neighbors=NEIGHBORS):
+    """
+    Recompute every user's recommendations and the popularity fallback.
+
+    Item-item similarity is the cosine between the columns of the user x book matrix, pruned to the
+    `neighbors` most similar books per book. A user's score for a book is the weighted sum of its
+    similarity to the books the user interacted with, books already seen are left out. All rows are
+    replaced in one transaction.
+
+    Args:
+        top_n (int): Books stored per user.
+        neighbors (int): Similar books kept per book.
+
+    Returns:
+        int: The number of users with personal recommendations.
+    """
+    from scipy import sparse
+    from sklearn.preprocessing import normalize
+
+    interactions = load_interactions()
+    users = sorted({user_id for user_id, _, _ in interactions})
+    books = sorted({book_id for _, book_id, _ in interactions})
+    user_index = {user_id: row for row, user_id in enumerate(users)}
+    book_index = {book_id: column for column, book_id in enumerate(books)}
+
+    rows = []
+    now = time.time()
+    if interactions:
+        # duplicate (user, book) signals are summed by the sparse constructor
+        matrix = sparse.csr_matrix(
+            ([weight for _, _, weight in interactions],
+             ([user_index[user_id] for user_id, _, _ in interactions], [book_index[book_id] for _, book_id, _ in interactions])),
+            shape=(len(users), len(books)), dtype=np.float32)
+
+        similarity = (normalize(matrix, axis=0).T @ normalize(matrix, axis=0)).tocsr()
+        similarity.setdiag(0)
+        similarity = _prune_rows(similarity, neighbors)
+
+        scores = (matrix @ similarity).tocsr()
+        for row, user_id in enumerate(users):
+            # work on the row's nonzero entries only, a user's candidates are few next to the catalog
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            columns, values = scores.indices[start:end], scores.data[start:end].copy()
+            seen = matrix.indices[matrix.indptr[row]:matrix.indptr[row + 1]]
+            values[np.isin(columns, seen)] = 0
+            top = _top(values, top_n)
+            if len(top):
+                rows.append({'user_id': user_id, 'book_ids': [books[columns[i]] for i in top],
+                             'scores': [round(float(values[i]), 4) for i in top], 'built_at': now})
+
+        popularity = np.asarray(matrix.sum(axis=0)).ravel()
+        top = _top(popularity, top_n)
+        rows.append({'user_id': POPULAR_USER_ID, 'book_ids': [books[i] for i in top],
+                     'scores': [round(float(popularity[i]), 4) for i in top], 'built_at': now})
+
+    try:
+        db.session.execute(delete(UserRecommendation))
+        if rows:
+            db.session.execute(insert(UserRecommendation), rows)
+        TableVersion.bump('user_recommendations')
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        raise e
+    return sum(1 for row in rows if row['user_id'] != POPULAR_USER_ID)
+
+
+def _prune_rows(matrix, keep):
+    # keep the `keep` largest entries of every row of a csr matrix
+    from scipy import sparse
+    data, indices, indptr = [], [], [0]
+    for row in range(matrix.shape[0]):
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        values, columns = matrix.data[start:end], matrix.indices[start:end]
+        if len(values) > keep:
+            best = np.argpartition(-values, keep - 1)[:keep]
+            values, columns = values[best], columns[best]
+        data.extend(values)
+        indices.extend(columns)
+        indptr.append(len(data))
+    return sparse.csr_matrix((data, indices, indptr), shape=matrix.shape, dtype=np.float32)
+
+
+def _load_popular():
+    row = db.session.get(UserRecommendation, POPULAR_USER_ID)
+    return row.read() if row else None
+
+# The fallback list is the same for every user, each worker keeps it until the next batch job
+popular_recommendations = VersionedCache(['user_recommendations'], _load_popular, name='popular_recs')
+
+
+def get_user_recommendations(user_id):
+    """
+    The stored recommendations of a user, or the most popular books when the user has no history.
+
+    Returns:
+        tuple: ('personal' or 'popular', recommendation dictionary or None if the job never ran)
+    """
+    row = db.session.get(UserRecommendation, user_id)
+    if row:
+        return 'personal', row.read()
+    return 'popular', popular_recommendations.get()
+
+
+# create the table before it is used
+with app.app_context():
+    db.create_all()
@@ -1,6 +1,7 @@
 from __init__ import db, app
 from model.librarydb import Book
 from model.user import User
+from model.bookevents import emit
 from sqlalchemy.exc import IntegrityError
 from datetime import datetime, date
 import random
@@ -105,6 +106,7 @@ def delete_from_wishlist(user_uid, book_id):
             item = Wishlist.query.filter_by(user_uid=user_uid, book_id=book_id).first()
             if item:
                 db.session.delete(item)
+                emit('wishlist.removed', item=item)
                 db.session.commit()
                 return f"Book with id {book_id} removed from the wishlist."
             else:
@@ -168,6 +170,8 @@ def add_to_wishlist(user_uid, book_id):
         try:
             item = Wishlist(user_uid=user_uid, book_id=book_id)
             db.session.add(item)
+            db.session.flush()  # a duplicate fails here, before the event
+            emit('wishlist.added', item=item)
             db.session.commit()
             return f"Book with id {book_id} added to the wishlist."
         except IntegrityError:
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+""" ann_benchmark.py
+Measures the approximate nearest neighbour index (model/annindex.py) against exact search.
+
+For each nprobe value, every query is answered both by a brute-force scan and by the IVF index,
+and the script reports recall@10 (the share of the exact top 10 the index also returns) with the
+p50 and p99 latency of both searches.
+
+Usage: Run from the root of the project:
+
+Benchmark the built book vectors (flask custom build_vectors):
+> scripts/ann_benchmark.py
+
+Benchmark a synthetic catalog, e.g. 500k clustered vectors of 64 floats:
+> scripts/ann_benchmark.py --synthetic 500000 --dimensions 64 --nprobe 1 4 8 16 32
+
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+# Add the directory containing main.py to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def synthetic_vectors(count, dimensions, clusters=1000, seed=0):
+    """Normalized vectors scattered around random topics, closer to real embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    topics = rng.standard_normal((clusters, dimensions)).astype(np.float32)
+    vectors = topics[rng.integers(0, clusters, count)] + 1.5 * rng.standard_normal((count, dimensions)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def percentile_ms(samples, q):
+    return round(float(np.percentile(samples, q)) * 1000, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--synthetic', type=int, help='Benchmark this many synthetic vectors instead of the book vectors.')
+    parser.add_argument('--dimensions', type=int, default=64, help='Dimensions of the synthetic vectors.')
+    parser.add_argument('--lists', type=int, help='Build a fresh index with this many partitions.')
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32], help='Values of nprobe to measure.')
+    parser.add_argument('--queries', type=int, default=200, help='Number of queries.')
+    parser.add_argument('-k', type=int, default=10, help='Neighbours per query.')
+    args = parser.parse_args()
+
+    from model.annindex import IVFIndex, build_ivf
+
+    folder = None
+    if args.synthetic:
+        vectors = synthetic_vectors(args.synthetic, args.dimensions)
+    else:
+        from main import app
+        from model.bookvectors import book_vectors, vectors_path, ANN_FOLDER
+        with app.app_context():
+            if not book_vectors.ready:
+                sys.exit('No book vectors, run: flask custom build_vectors')
+            vectors = book_vectors.vectors
+            if not args.lists and book_vectors.index.current(source=book_vectors.built_at):
+                folder = vectors_path(ANN_FOLDER)
+
+    temp = None
+    if folder is None:
+        temp = tempfile.TemporaryDirectory()
+        folder = temp.name
+        start = time.perf_counter()
+        manifest = build_ivf(vectors, folder, lists=args.lists)
+        print(f"Built an index of {manifest['lists']} partitions in {time.perf_counter() - start:.1f}s")
+    index = IVFIndex(folder)
+    index.current()
+    lists = len(index.centroids)
+
+    rng = np.random.default_rng(1)
+    queries = np.asarray(vectors[rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)])
+
+    exact, exact_times = [], []
+    for query in queries:
+        start = time.perf_counter()
+        scores = np.asarray(vectors @ query)
+        top = np.argpartition(-scores, args.k - 1)[:args.k]
+        exact_times.append(time.perf_counter() - start)
+        exact.append(set(top.tolist()))
+
+    print(f"{len(vectors)} vectors, {vectors.shape[1]} dimensions, {lists} partitions, {len(queries)} queries, k={args.k}")
+    print(f"{'search':>12} {'recall@' + str(args.k):>10} {'p50 ms':>9} {'p99 ms':>9}")
+    print(f"{'exact':>12} {1.0:>10.3f} {percentile_ms(exact_times, 50):>9} {percentile_ms(exact_times, 99):>9}")
+    for nprobe in args.nprobe:
+        if nprobe > lists:
+            continue
+        hits, times = 0, []
+        for query, truth in zip(queries, exact):
+            start = time.perf_counter()
+            rows, _ = index.search(query, args.k, nprobe)
+            times.append(time.perf_counter() - start)
+            hits += len(truth & set(rows.tolist()))
+        recall = hits / (len(queries) * args.k)
+        print(f"{'nprobe=' + str(nprobe):>12} {recall:>10.3f} {percentile_ms(times, 50):>9} {percentile_ms(times, 99):>9}")
+
+    if temp:
+        temp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+""" login_benchmark.py
+Measures how a login storm affects a running server (model/passwords.py).
+
+First the probe endpoint is timed on an idle server, then again while --logins threads post
+logins to /api/authenticate as fast as they can. The script reports the p50 and p99 latency of
+the logins and of the probe, and how many logins were answered 200, 401, 429 or 503.
+
+Usage: Start the server, e.g. gunicorn with the Dockerfile settings, then from the root of the project:
+
+> scripts/login_benchmark.py --url http://127.0.0.1:8504 --uid admin --password password
+
+Compare hashing inline and in the pool by restarting the server with PASSWORD_POOL_SIZE=0 and =2.
+
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+
+
+def request(url, body=None):
+    """Send one request, return (status, seconds)."""
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=60) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except OSError:
+        status = 'error'
+    return status, time.perf_counter() - start
+
+
+def percentile_ms(samples, q):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))] * 1000, 1)
+
+
+def probe(url, seconds, samples):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        status, elapsed = request(url)
+        if status != 200:
+            raise SystemExit(f'{url} answered {status}, is the server running?')
+        samples.append(elapsed)
+        time.sleep(0.05)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8504', help='Root URL of the running server.')
+    parser.add_argument('--uid', default='admin', help='uid to log in with.')
+    parser.add_argument('--password', default='password', help='Password of the uid.')
+    parser.add_argument('--probe', default='/api/books/trending', help='Non-login endpoint timed during the storm.')
+    parser.add_argument('--logins', type=int, default=24, help='Threads posting logins.')
+    parser.add_argument('--seconds', type=float, default=20, help='Length of the storm.')
+    args = parser.parse_args()
+
+    login_url = args.url.rstrip('/') + '/api/authenticate'
+    probe_url = args.url.rstrip('/') + args.probe
+    credentials = {'uid': args.uid, 'password': args.password}
+
+    idle = []
+    probe(probe_url, min(5, args.seconds), idle)
+
+    logins, statuses, lock = [], Counter(), threading.Lock()
+    end = time.monotonic() + args.seconds
+
+    def storm():
+        while time.monotonic() < end:
+            status, seconds = request(login_url, credentials)
+            with lock:
+                statuses[status] += 1
+                if status == 200:
+                    logins.append(seconds)
+
+    busy = []
+    threads = [threading.Thread(target=storm) for _ in range(args.logins)]
+    threads.append(threading.Thread(target=probe, args=(probe_url, args.seconds, busy)))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print(f"{'':24}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}")
+    for label, samples in ((f'{args.probe} idle', idle), (f'{args.probe} storm', busy), ('login 200', logins)):
+        print(f"{label[:24]:24}{len(samples):>8}{percentile_ms(samples, 50)!s:>10}{percentile_ms(samples, 99)!s:>10}")
+    print('login statuses:', dict(sorted(statuses.items(), key=lambda item: str(item[0]))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+# the tests run on a throwaway SQLite file, set before __init__ configures the database
+_folder = tempfile.mkdtemp(prefix='bookworms-tests-')
+atexit.register(shutil.rmtree, _folder, ignore_errors=True)
+os.environ['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(_folder, 'tests.db')
+os.environ.pop('DB_ENDPOINT', None)
+
+# the project's modules import each other from the repository root (from __init__ import app)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from __init__ import app, db  # noqa: E402
+import main  # noqa: E402,F401  registers the blueprints and creates the tables
+from model.tableversion import forget_worker_versions  # noqa: E402
+from model.userprovision import provision_users  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+@pytest.fixture
+def make_users():
+    """
+    Create users with uids unique to the test, returns their ids, e.g. make_users(3, 'Reader').
+    """
+    def make(count, name):
+        suffix = uuid.uuid4().hex[:8]
+        with app.app_context():
+            results = provision_users([{'name': f'{name} {i}', 'uid': f'{name.lower()}-{suffix}-{i}'} for i in range(count)])
+        assert all(result['status'] == 'created' for result in results)
+        return [result['id'] for result in results]
+
+    return make
+
+
+@pytest.fixture
+def count_statements():
+    """
+    A context manager collecting the SQL statements run inside it, e.g.
+
+        with count_statements() as statements:
+            client.get('/api/posts')
+        assert len(statements) == 3
+    """
+    @contextmanager
+    def counter():
+        with app.app_context():
+            engine = db.engine
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        # read every table version again, so the count does not depend on when this worker last checked
+        forget_worker_versions()
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+    return counter
+
+
+@pytest.fixture
+def statements_of(client, count_statements):
+    """
+    Send a request twice, the first one warms the per-worker caches, and count the statements of the
+    second. Returns (JSON body, number of statements), e.g. statements_of('get', '/api/posts').
+    """
+    def measure(method, url, **kwargs):
+        getattr(client, method)(url, **kwargs)
+        with count_statements() as statements:
+            response = getattr(client, method)(url, **kwargs)
+        assert response.status_code == 200, response.get_data(as_text=True)
+        return response.get_json(), len(statements)
+
+    return measure
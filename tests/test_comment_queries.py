@@ -0,0 +1,49 @@
+import uuid
+
+import pytest
+
+from __init__ import app
+from model.commentsdb import Comments
+from model.librarydb import Book
+
+# Comments are read with their authors' names in one joined query (model/commentsdb.py), so a book
+# with many comments by many users costs as many statements as a book with one.
+
+MANY = 6
+
+
+@pytest.fixture
+def books(make_users):
+    """(book with one comment, book with MANY comments), each comment by a different user."""
+    user_ids = make_users(MANY, 'Reader')
+    suffix = uuid.uuid4().hex[:8]
+    with app.app_context():
+        one = Book(title=f'One comment {suffix}', author='Test Author', genre='Fiction', description='', cover_url='')
+        many = Book(title=f'Many comments {suffix}', author='Test Author', genre='Fiction', description='', cover_url='')
+        one.create()
+        many.create()
+        Comments(book_id=one.id, user_id=user_ids[0], comment_text='Only comment').create()
+        for i, user_id in enumerate(user_ids):
+            Comments(book_id=many.id, user_id=user_id, comment_text=f'Comment {i}').create()
+        return one.id, many.id
+
+
+def test_book_comments_cost_the_same_for_one_and_many(statements_of, books):
+    one, many = books
+    body_one, one_count = statements_of('get', f'/api/comments?book_id={one}')
+    body_many, many_count = statements_of('get', f'/api/comments?book_id={many}')
+
+    assert len(body_one['comments']) == 1
+    assert len(body_many['comments']) == MANY
+    assert one_count == many_count
+
+
+def test_book_page_costs_the_same_for_one_and_many(statements_of, books):
+    one, many = books
+    body_one, one_count = statements_of('get', f'/api/books/{one}')
+    body_many, many_count = statements_of('get', f'/api/books/{many}')
+
+    assert len(body_one['comments']) == 1
+    assert len(body_many['comments']) == MANY
+    assert all(comment['user_name'].startswith('Reader ') for comment in body_many['comments'])
+    assert one_count == many_count
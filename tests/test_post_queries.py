@@ -0,0 +1,89 @@
+import uuid
+
+import pytest
+
+from __init__ import app, db
+from api.jwt_authorize import encode_token
+from model.channel import Channel
+from model.feedback import Feedback, read_feedbacks
+from model.group import Group
+from model.nestPost import NestPost
+from model.post import Post
+from model.section import Section
+from model.user import User
+
+# Post, nest post and feedback lists are read with their authors' and channels', groups' or posts'
+# names in one joined query (read_posts, read_nest_posts, read_feedbacks), so the number of
+# statements a list costs does not grow with the number of rows.
+
+MANY = 6
+
+
+@pytest.fixture
+def forum(make_users):
+    """
+    MANY users, each with a channel and a group, and one post, nest post and feedback by the first
+    user. forum['grow']() adds MANY - 1 of each, by other users or in other channels and groups.
+    """
+    user_ids = make_users(MANY, 'Poster')
+    suffix = uuid.uuid4().hex[:8]
+    with app.app_context():
+        db.create_all()  # the feedbacks table, main.py does not load the feedback API
+        section = Section(f'Section {suffix}')
+        section.create()
+        groups = [Group(f'Group {suffix} {i}', section.id) for i in range(MANY)]
+        for group in groups:
+            group.create()
+        channels = [Channel(f'Channel {suffix} {i}', groups[0].id) for i in range(MANY)]
+        for channel in channels:
+            channel.create()
+        post = Post('First post', 'comment', user_ids[0], channels[0].id).create()
+        NestPost('First nest post', 'content', user_ids[0], groups[0].id, '').create()
+        Feedback('First feedback', user_ids[0], post.id).create()
+        group_ids, channel_ids = [group.id for group in groups], [channel.id for channel in channels]
+        forum = {'channel_id': channel_ids[0], 'post_id': post.id, 'token': encode_token(db.session.get(User, user_ids[0]))}
+
+    def grow():
+        with app.app_context():
+            for i in range(1, MANY):
+                Post(f'Post {i}', 'comment', user_ids[0], channel_ids[i]).create()  # the user's, in another channel
+                Post(f'Reply {i}', 'comment', user_ids[i], channel_ids[0]).create()  # another user's, in the channel
+                NestPost(f'Nest post {i}', 'content', user_ids[0], group_ids[i], '').create()
+                Feedback(f'Feedback {i}', user_ids[i], forum['post_id']).create()
+
+    forum['grow'] = grow
+    return forum
+
+
+@pytest.mark.parametrize('method, url, body', [
+    ('get', '/api/posts', None),
+    ('get', '/api/post/user', None),
+    ('post', '/api/posts/filter', 'channel'),
+    ('get', '/api/nestPost', None),
+])
+def test_post_lists_cost_the_same_for_one_and_many(client, statements_of, forum, method, url, body):
+    client.set_cookie(app.config['JWT_TOKEN_NAME'], forum['token'])
+    kwargs = {'json': {'channel_id': forum['channel_id']}} if body else {}
+
+    before_rows, before = statements_of(method, url, **kwargs)
+    forum['grow']()
+    after_rows, after = statements_of(method, url, **kwargs)
+
+    assert len(after_rows) >= len(before_rows) + MANY - 1
+    assert after == before
+
+
+def test_feedback_list_costs_the_same_for_one_and_many(count_statements, forum):
+    # the feedback API is not registered in main.py, its listing is read_feedbacks
+    def read():
+        with app.app_context(), count_statements() as statements:
+            feedbacks = read_feedbacks(Feedback.query.filter(Feedback._post_id == forum['post_id']))
+        return feedbacks, len(statements)
+
+    one, before = read()
+    forum['grow']()
+    many, after = read()
+
+    assert len(one) == 1 and len(many) == MANY
+    assert all(feedback['post_title'] == 'First post' for feedback in many)
+    assert after == before